@@ -8,38 +8,116 @@ import os
 import shutil
 import json
 import platform
-import subprocess
+import time
 from datetime import datetime
-import hashlib
+
+from backup_config import load_config, get_source_folders, get_user_profile
+from backup_rules import BackupRules
+from backup_scanner import scan_tree, beyond_depth, FileEntry
+from backup_journal import open_changes
+from backup_delta import write_delta, delta_depth, open_stored, stored_suffix, DELTA_SUFFIX
+from backup_sparse import copy_sparse, supports_sparse, HoleFinder, SPARSE_SUFFIX
+from backup_hashing import (load_repository, inventory_settings, entry_digest,
+                            hash_file, hash_stream, TreeHasher)
+from backup_io import IOScheduler, probe_buffer_size, DEFAULT_BUFFER
+from backup_fanout import BackupTarget, FanoutCopier, is_device_error
+from backup_diff import diff_inventories, print_summary, entry_path, INVENTORY_ORDER
+from backup_platform import get_provider
+from backup_throttle import Throttle
+from backup_pipeline import BufferPool, HashStage, DEFAULT_BUFFERS
+from backup_cache import DigestCache
+from backup_storage import publish
+from backup_metadata import metadata_mode, capture
+from backup_merkle import write_tree
 
 class PCBackup:
-    def __init__(self, usb_drive_letter="E:"):
-        self.usb_drive = usb_drive_letter
-        self.backup_root = os.path.join(usb_drive_letter, "PC_Backup")
+    def __init__(self, usb_drive_letter="E:", config=None):
+        # One drive ("E:") or several (["E:", "F:"]) written in the same run
+        destinations = [usb_drive_letter] if isinstance(usb_drive_letter, str) else list(usb_drive_letter)
         self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.backup_folder = os.path.join(self.backup_root, f"Backup_{self.timestamp}")
+        self.config = config if config is not None else load_config(usb_drive=destinations[0])
+        self.rules = BackupRules.from_config(self.config)
+        self.scan_settings = self.config.get('scan', {})
+        self.report = {'timestamp': self.timestamp}
+        
+        # I/O scheduling (see backup_io.py)
+        io_settings = self.config.get('io', {})
+        self.scheduler = IOScheduler(io_settings, self.config.get('priority'))
+        self.buffer_size = None
+        self.report['io'] = self.scheduler.report
+        
+        # Time box: copying stops after max_duration_min, the rest is listed as deferred
+        self.max_duration = (io_settings.get('max_duration_min') or 0) * 60
+        self.deadline = None
+        self.deferred = []
+        self.failed = []        # paths that could not be scanned or copied (missing from the snapshot)
+        
+        # Holes and zero runs of at least this size are not copied (see backup_sparse.py)
+        sparse = self.config.get('sparse', {})
+        self.min_hole = sparse.get('min_hole_kb', 64) * 1024 if sparse.get('enabled', True) else 0
+        self.min_packed = sparse.get('min_packed_mb', 16) * 1024 * 1024
+        
+        # Background mode: lower priority, rate limits, full speed switch (see backup_throttle.py)
+        self.throttle = Throttle(self.config.get('background', {}))
+        self.report['background'] = self.throttle.report
+        
+        # Per-destination state (see backup_fanout.py); the first one is the primary
+        self.targets = [BackupTarget(drive, self.timestamp, io_settings) for drive in destinations]
+        self.usb_drive = self.targets[0].usb_drive
+        self.backup_root = self.targets[0].backup_root
+        self.backup_folder = self.targets[0].backup_folder
+        self.fanout = None
+        self.pool = None
+        self.digests = None     # DigestCache, open during run_backup
+        
+        # Incremental state shared by all destinations (see prepare_incremental)
+        self.journal_position = None
+        self.changes = None
+    
+    def live_targets(self):
+        """Destinations that have not failed yet"""
+        return [target for target in self.targets if target.ok]
+    
+    def fail_target(self, target, e):
+        target.fail(e)
+        print(f"❌ {target.usb_drive} failed: {e}")
+    
+    def for_each_target(self, action):
+        """Run action(target) on every live destination; a failure only drops that one"""
+        for target in self.live_targets():
+            try:
+                action(target)
+            except OSError as e:
+                if len(self.targets) == 1:
+                    raise
+                self.fail_target(target, e)
+        if not self.live_targets():
+            raise RuntimeError("All backup destinations failed")
         
     def create_backup_structure(self):
         """Create backup folder structure"""
-        folders = [
-            self.backup_folder,
-            os.path.join(self.backup_folder, "Documents"),
-            os.path.join(self.backup_folder, "Pictures"),
-            os.path.join(self.backup_folder, "Videos"),
-            os.path.join(self.backup_folder, "Desktop"),
-            os.path.join(self.backup_folder, "Downloads"),
-            os.path.join(self.backup_folder, "Music"),
-            os.path.join(self.backup_folder, "Browser_Data"),
-            os.path.join(self.backup_folder, "System_Info"),
+        self.for_each_target(self._create_structure)
+    
+    def _create_structure(self, target):
+        folders = [target.backup_folder]
+        folders += [os.path.join(target.backup_folder, name) for name in self.config.get('folders', [])]
+        folders += [
+            os.path.join(target.backup_folder, "Browser_Data"),
+            os.path.join(target.backup_folder, "System_Info"),
         ]
         
         for folder in folders:
             os.makedirs(folder, exist_ok=True)
+        target.sparse_ok = bool(self.min_hole) and supports_sparse(target.backup_folder)
+        target.metadata = metadata_mode(self.config.get('metadata'), target.backup_folder)
         
-        print(f"✅ Backup folders created at: {self.backup_folder}")
+        print(f"✅ Backup folders created at: {target.backup_folder}")
+        if target.metadata == 'index':
+            print("   🏷️ File metadata is kept in the inventory on this drive")
     
     def get_system_info(self):
         """Get complete system information"""
+        provider = get_provider()
         info = {
             "timestamp": self.timestamp,
             "hostname": platform.node(),
@@ -48,34 +126,16 @@ class PCBackup:
             "os_release": platform.release(),
             "architecture": platform.machine(),
             "processor": platform.processor(),
-            "username": os.getlogin(),
+            "username": provider.username(),
         }
         
-        # Get disk info
-        if platform.system() == "Windows":
-            try:
-                result = subprocess.run(['wmic', 'logicaldisk', 'get', 'caption,filesystem,size,freespace'],
-                                      capture_output=True, text=True)
-                info['disks'] = result.stdout
-            except:
-                pass
-        
-        # Get installed programs (Windows)
-        if platform.system() == "Windows":
-            try:
-                result = subprocess.run(['wmic', 'product', 'get', 'name,version'],
-                                      capture_output=True, text=True, timeout=60)
-                info['installed_programs'] = result.stdout
-            except:
-                info['installed_programs'] = "Could not retrieve"
-        
-        # Get network info
-        try:
-            result = subprocess.run(['ipconfig'] if platform.system() == "Windows" else ['ifconfig'],
-                                  capture_output=True, text=True)
-            info['network'] = result.stdout
-        except:
-            pass
+        # Disks, installed programs (Windows), network - whatever the OS provides
+        for key, collect in (('disks', provider.disks),
+                             ('installed_programs', provider.installed_programs),
+                             ('network', provider.network)):
+            value = collect()
+            if value is not None:
+                info[key] = value
         
         return info
     
@@ -84,92 +144,495 @@ class PCBackup:
         print("📋 Collecting system information...")
         
         info = self.get_system_info()
-        info_file = os.path.join(self.backup_folder, "System_Info", "system_info.json")
         
-        with open(info_file, 'w') as f:
-            json.dump(info, f, indent=4)
+        def save(target):
+            info_file = os.path.join(target.backup_folder, "System_Info", "system_info.json")
+            with open(info_file, 'w') as f:
+                json.dump(info, f, indent=4)
+            print(f"✅ System info saved: {info_file}")
         
-        print(f"✅ System info saved: {info_file}")
+        self.for_each_target(save)
+    
+    def find_previous_snapshot(self, target=None):
+        """Latest earlier snapshot on this drive that has an inventory"""
+        target = target or self.live_targets()[0]
+        if not os.path.isdir(target.backup_root):
+            return None
+        
+        for name in sorted(os.listdir(target.backup_root), reverse=True):
+            path = os.path.join(target.backup_root, name)
+            if (name.startswith("Backup_") and path != target.backup_folder
+                    and os.path.isfile(os.path.join(path, 'file_inventory.json'))):
+                return path
+        return None
+    
+    def open_repository(self):
+        """Load (or create) repository settings such as the hash algorithm"""
+        def load(target):
+            target.hash_settings = load_repository(target.backup_root, self.config)['hash']
+            print(f"🔐 Hash algorithm ({target.usb_drive}): {target.hash_settings['algorithm']}"
+                  f"{' (tree)' if target.hash_settings.get('leaf_size') else ''}")
+        
+        self.for_each_target(load)
+    
+    def prepare_incremental(self):
+        """Use the change journal (if the watcher runs) instead of a full scan"""
+        print("📓 Checking change journal...")
+        
+        for target in self.live_targets():
+            self._load_previous(target)
+        
+        self.journal_position, self.changes, reason = open_changes(self.config, self._common_position())
+        
+        if self.changes is not None:
+            # Journal mode: every live destination has a previous snapshot (see _common_position)
+            base = os.path.basename(self.live_targets()[0].previous_snapshot)
+            print(f"✅ Journal: {len(self.changes)} changed paths since {base}")
+            self.report['scan'] = {'mode': 'journal', 'base': base, 'changed_paths': len(self.changes)}
+        else:
+            print(f"🔎 Full scan ({reason})")
+            self.report['scan'] = {'mode': 'full', 'reason': reason}
+    
+    def _load_previous(self, target):
+        previous_inventory = {}
+        target.previous_snapshot = self.find_previous_snapshot(target)
+        if target.previous_snapshot:
+            try:
+                with open(os.path.join(target.previous_snapshot, 'file_inventory.json'), 'r') as f:
+                    previous_inventory = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Could not read previous inventory on {target.usb_drive}: {e}")
+                target.previous_snapshot = None
+        
+        target.previous_hash = inventory_settings(previous_inventory)
+        target.previous_journal = previous_inventory.get('journal') if target.previous_snapshot else None
+        for entry in previous_inventory.get('files', []):
+            rel = entry['file'].replace('\\', '/').lstrip('/')
+            target.previous_files[rel] = entry
+    
+    def _common_position(self):
+        """Oldest journal position of all destinations, None unless all share one journal epoch"""
+        positions = [target.previous_journal for target in self.live_targets()]
+        if not positions or not all(positions):
+            return None
+        if len({(p.get('epoch'), p.get('rules')) for p in positions}) > 1:
+            return None
+        return min(positions, key=lambda p: p.get('seq', 0))
     
     def backup_user_folders(self):
         """Backup important user folders"""
-        if platform.system() == "Windows":
-            user_profile = os.environ.get('USERPROFILE', 'C:\\Users\\' + os.getlogin())
-        else:
-            user_profile = os.path.expanduser('~')
-        
-        folders_to_backup = {
-            'Documents': os.path.join(user_profile, 'Documents'),
-            'Pictures': os.path.join(user_profile, 'Pictures'),
-            'Videos': os.path.join(user_profile, 'Videos'),
-            'Desktop': os.path.join(user_profile, 'Desktop'),
-            'Downloads': os.path.join(user_profile, 'Downloads'),
-            'Music': os.path.join(user_profile, 'Music'),
-        }
+        folders_to_backup = get_source_folders(self.config)
+        jobs = []
         
         for folder_name, source_path in folders_to_backup.items():
             if os.path.exists(source_path):
-                dest_path = os.path.join(self.backup_folder, folder_name)
-                print(f"📁 Backing up {folder_name}...")
+                print(f"📁 Scanning {folder_name}...")
                 
                 try:
-                    # Copy with progress
-                    self.copy_with_progress(source_path, dest_path)
-                    print(f"✅ {folder_name} backed up!")
+                    if self.changes is not None:
+                        # Only changed files, the rest comes from the previous snapshot
+                        folder_jobs = self.collect_changed(source_path, folder_name, folder_name)
+                    else:
+                        folder_jobs = self.collect_files(source_path, folder_name)
+                    jobs.extend(folder_jobs)
+                    print(f"   {len(folder_jobs)} files to copy")
                 except Exception as e:
                     print(f"⚠️ Error backing up {folder_name}: {e}")
+                    self.failed.append(folder_name)
             else:
                 print(f"⏭️ {folder_name} not found, skipping...")
+        
+        # Copy everything in one scheduled pass
+        print(f"📁 Copying {len(jobs)} files...")
+        self.copy_files(jobs)
+        print(f"✅ User folders backed up!")
+    
+    def _scan_error(self, path, e):
+        print(f"   ⚠️ Could not scan {path}: {e}")
+        self.failed.append(path)
     
-    def copy_with_progress(self, src, dst):
-        """Copy folder with progress indication"""
+    def _job(self, entry, dst, prefix):
+        rel = entry.rel[len(prefix):].lstrip('/')
+        return entry, f"{dst}/{rel}" if rel else dst
+    
+    def collect_files(self, src, dst, prefix=None):
+        """Scan a folder (rules prune excluded folders) into copy jobs
+        
+        dst is the destination folder relative to the snapshot ("Documents");
+        jobs are (entry, "Documents/sub/file.txt") pairs.
+        """
+        if prefix is None:
+            prefix = os.path.basename(os.path.normpath(src))
+        return [self._job(entry, dst, prefix)
+                for entry in scan_tree(src, prefix, self.rules, self._scan_error, self.scan_settings)]
+    
+    def copy_with_progress(self, src, dst, prefix=None):
+        """Copy folder with progress indication (dst relative to the snapshot)"""
         if not os.path.exists(src):
             return
+        self.copy_files(self.collect_files(src, dst, prefix))
+    
+    def collect_changed(self, src, dst, prefix):
+        """Copy jobs for files the journal marks as changed, carry the rest forward"""
+        for index, target in enumerate(self.live_targets()):
+            carried = 0
+            for rel, entry in target.previous_files.items():
+                if not rel.startswith(prefix + '/') or self.changes.touches(rel):
+                    continue
+                
+                rule = self.rules.excludes_path(rel, entry.get('size'), self._carried_mtime(src, rel, entry))
+                if rule:
+                    if index == 0:
+                        self.rules.record(rule, entry.get('size', 0))
+                    continue
+                
+                suffix = stored_suffix(entry)
+                old_file = os.path.join(target.previous_snapshot, *rel.split('/')) + suffix
+                dst_file = target.path(rel) + suffix
+                try:
+                    os.makedirs(os.path.dirname(dst_file), exist_ok=True)
+                    self.carry_forward(old_file, dst_file, target.metadata)
+                    target.known_entries[rel] = entry
+                    carried += 1
+                except OSError as e:
+                    if is_device_error(e) and len(self.targets) > 1:
+                        self.fail_target(target, e)
+                        break
+                    print(f"   ⚠️ Could not carry forward {rel}: {e}")
+                    self.failed.append(rel)
+            print(f"   ♻️ {carried} unchanged files carried forward"
+                  f"{f' on {target.usb_drive}' if len(self.targets) > 1 else ''}")
+        
+        # Keyed by path: a changed file inside a changed or rescanned folder is found twice
+        files = {}
+        for rel in sorted(self.changes.modified):
+            if not rel.startswith(prefix + '/'):
+                continue
+            path = os.path.join(os.path.dirname(src), *rel.split('/'))
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue  # deleted again after the change was recorded
+            
+            if os.path.isdir(path):
+                files.update((entry.rel, entry) for entry in
+                             scan_tree(path, rel, self.rules, self._scan_error, self.scan_settings))
+                continue
+            if beyond_depth(rel, self.scan_settings):
+                continue
+            rule = self.rules.excludes_path(rel, st.st_size, st.st_mtime)
+            if rule:
+                self.rules.record(rule, st.st_size)
+                continue
+            files[rel] = FileEntry(path, rel, st)
+        
+        for rel in sorted(self.changes.rescan):
+            if rel.startswith(prefix + '/') and not self.rules.excludes_path(rel, is_dir=True):
+                path = os.path.join(os.path.dirname(src), *rel.split('/'))
+                files.update((entry.rel, entry) for entry in
+                             scan_tree(path, rel, self.rules, self._scan_error, self.scan_settings))
+        
+        return [self._job(entry, dst, prefix) for entry in files.values()]
+    
+    def _carried_mtime(self, src, rel, entry):
+        """Source mtime of an unchanged file, only needed for max_age_days"""
+        if self.rules.min_mtime is None:
+            return None
+        if entry.get('meta', {}).get('mtime_ns') is not None:
+            return entry['meta']['mtime_ns'] / 1e9
+        try:
+            return os.stat(os.path.join(os.path.dirname(src), *rel.split('/'))).st_mtime
+        except OSError:
+            return None
+    
+    def carry_forward(self, old_file, dst_file, metadata='copy'):
+        """Reuse a file from the previous snapshot (hard link, else copy)"""
+        try:
+            os.link(old_file, dst_file)
+        except OSError:
+            if metadata == 'index':
+                shutil.copyfile(old_file, dst_file)  # metadata comes from the inventory
+            else:
+                shutil.copy2(old_file, dst_file)
+    
+    def tune_buffer(self, jobs):
+        """Pick the copy buffer size (fixed, or probed once per run)"""
+        settings = self.config.get('io', {})
+        if self.buffer_size:
+            return
+        if settings.get('buffer_kb'):
+            self.buffer_size = settings['buffer_kb'] * 1024
+            self.report['io']['buffer'] = {'size': self.buffer_size, 'source': 'config'}
+            return
+        
+        total = sum(entry.stat.st_size for entry, _ in jobs)
+        if not settings.get('probe', True) or total < settings.get('probe_min_mb', 256) * 1024 * 1024:
+            self.buffer_size = DEFAULT_BUFFER
+            self.report['io']['buffer'] = {'size': self.buffer_size, 'source': 'default'}
+            return
+        
+        largest = max(jobs, key=lambda job: job[0].stat.st_size)[0].path
+        try:
+            self.buffer_size, results = probe_buffer_size(self.live_targets()[0].backup_folder, largest)
+            self.report['io']['buffer'] = {'size': self.buffer_size, 'source': 'probe', 'mb_per_s': results}
+            print(f"   💽 Buffer size {self.buffer_size // 1024} KB (probed)")
+        except OSError as e:
+            print(f"   ⚠️ Buffer probe failed ({e}), using default")
+            self.buffer_size = DEFAULT_BUFFER
+            self.report['io']['buffer'] = {'size': self.buffer_size, 'source': 'default'}
+    
+    def copy_files(self, jobs):
+        """Copy (entry, snapshot-relative path) jobs in scheduled order"""
+        if not jobs:
+            return
         
-        # Count total files
-        total_files = sum([len(files) for r, d, files in os.walk(src)])
+        self.tune_buffer(jobs)
+        total_files = len(jobs)
         copied_files = 0
         
-        for root, dirs, files in os.walk(src):
-            # Create destination directory structure
-            dest_root = root.replace(src, dst, 1)
-            os.makedirs(dest_root, exist_ok=True)
+        for phase, phase_jobs in self.scheduler.plan(jobs):
+            if self.out_of_time():
+                self.defer(phase_jobs)
+                continue
+            started = time.perf_counter()
+            phase_bytes = 0
+            done = 0
             
-            for file in files:
-                src_file = os.path.join(root, file)
-                dst_file = os.path.join(dest_root, file)
-                
+            for entry, rel in phase_jobs:
+                if self.out_of_time():
+                    self.defer(phase_jobs[done:])
+                    break
+                done += 1
+                if not self.live_targets():
+                    raise RuntimeError("All backup destinations failed")
                 try:
-                    shutil.copy2(src_file, dst_file)
+                    self.copy_file(entry, rel)
                     copied_files += 1
+                    phase_bytes += entry.stat.st_size
                     
                     # Show progress every 10 files
                     if copied_files % 10 == 0:
                         progress = (copied_files / total_files) * 100
                         print(f"   Progress: {progress:.1f}% ({copied_files}/{total_files})")
                 except Exception as e:
-                    print(f"   ⚠️ Could not copy {file}: {e}")
+                    print(f"   ⚠️ Could not copy {os.path.basename(entry.path)}: {e}")
+                    self.failed.append(rel)
+            
+            # Flush each phase so the measured time includes the device writes
+            self.finish_writes()
+            self.scheduler.record_phase(phase, done, phase_bytes, time.perf_counter() - started)
+    
+    def out_of_time(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+    
+    def defer(self, jobs):
+        """Leave jobs for the next run (time box reached)"""
+        if jobs and not self.deferred:
+            print("   ⏱️ Time limit reached, the remaining files are left for the next run")
+        self.deferred.extend(jobs)
+    
+    def finish_writes(self):
+        """Wait for queued fan-out writes and flush every destination"""
+        if self.fanout:
+            self.fanout.drain()
+        for target in self.live_targets():
+            try:
+                target.fsync.flush()
+            except OSError as e:
+                if len(self.targets) == 1:
+                    raise
+                self.fail_target(target, e)
+    
+    def copy_file(self, entry, rel):
+        """Copy one file to every destination, reading it only once
+        
+        Destinations that can store the file as a delta against their
+        previous snapshot do so; the rest get the full file (through the
+        fan-out writer when there is more than one).
+        """
+        # Source metadata for drives that keep it in the inventory (see backup_metadata.py)
+        meta = None
+        if any(target.metadata == 'index' for target in self.live_targets()):
+            meta = capture(entry.path, entry.stat, self.config.get('metadata', {}).get('xattrs', True))
+        
+        outputs = []
+        for target in self.live_targets():
+            dst_file = target.path(rel)
+            try:
+                os.makedirs(os.path.dirname(dst_file), exist_ok=True)
+                try:
+                    if self.copy_delta(target, entry, dst_file, meta):
+                        continue
+                except (OSError, ValueError) as e:
+                    if is_device_error(e):
+                        raise
+                    print(f"   ⚠️ Delta failed for {os.path.basename(entry.path)} ({e}), copying in full")
+                    if os.path.exists(dst_file + DELTA_SUFFIX):
+                        os.remove(dst_file + DELTA_SUFFIX)
+            except OSError as e:
+                if len(self.targets) == 1 or not is_device_error(e):
+                    raise
+                self.fail_target(target, e)
+                continue
+            outputs.append((target, dst_file))
+        
+        if not outputs:
+            return
+        size = entry.stat.st_size
+        io_settings = self.config.get('io', {})
+        settings = outputs[0][0].hash_settings
+        # Unchanged since the last run: digest from the cache, nothing to hash (see backup_cache.py)
+        digest = self.digests.get(entry.path, entry.stat, settings) if self.digests else None
+        hasher = None
+        if digest is None and io_settings.get('hash_while_copying', True):
+            hasher = TreeHasher(settings, size)
+        
+        if len(self.targets) == 1:
+            target, dst_file = outputs[0]
+            # Large files are read ahead in a second thread (see backup_pipeline.py)
+            pool = None
+            if size >= self.scheduler.large_file and io_settings.get('pipeline_buffers', DEFAULT_BUFFERS) > 1:
+                pool = self.buffer_pool()
+            stored_file, copied, stored, sparse = copy_sparse(entry.path, dst_file, target.sparse_ok,
+                                                              self.buffer_size or DEFAULT_BUFFER, self.min_hole,
+                                                              self.throttle, pool,
+                                                              [HashStage(hasher)] if hasher else (),
+                                                              copy_stat=target.metadata == 'copy',
+                                                              min_packed=self.min_packed)
+            target.written(stored_file, stored)
+            # The digest is only valid if the file did not change size while being read
+            if copied != size:
+                digest = None
+            elif hasher:
+                digest = hasher.result()
+                self.remember_digest(entry, settings, digest)
+            if target.metadata != 'index':
+                meta = None
+            if sparse or digest or meta:
+                target.record_copy(dst_file, copied, sparse, digest, meta)
+            return
+        
+        if self.fanout is None:
+            self.fanout = FanoutCopier(self.targets, self.buffer_size or DEFAULT_BUFFER,
+                                       self.config.get('io', {}).get('fanout_buffer_mb', 64) * 1024 * 1024,
+                                       self.min_hole, self.throttle, self.min_packed,
+                                       self.config.get('io', {}).get('fanout_wait_s', 5))
+        computed = self.fanout.copy(entry.path, size, outputs, meta, digest, hasher, settings)
+        if hasher and computed:
+            self.remember_digest(entry, settings, computed)
+    
+    def remember_digest(self, entry, settings, digest):
+        """Keep a digest computed this run for the next one"""
+        if self.digests:
+            self.digests.put(entry.path, entry.stat, settings, digest)
+    
+    def buffer_pool(self):
+        """Read-ahead buffers for large files, allocated once per run"""
+        if self.pool is None or self.pool.size != (self.buffer_size or DEFAULT_BUFFER):
+            count = self.config.get('io', {}).get('pipeline_buffers', DEFAULT_BUFFERS)
+            self.pool = BufferPool(count, self.buffer_size or DEFAULT_BUFFER)
+        return self.pool
+    
+    def copy_delta(self, target, entry, dst_file, meta=None):
+        """Store a large changed file as a delta; False if a full copy is needed"""
+        settings = self.config.get('delta', {})
+        if not settings.get('enabled') or not target.previous_snapshot:
+            return False
+        if entry.stat.st_size < settings.get('min_size_mb', 32) * 1024 * 1024:
+            return False
+        if entry.rel.split('/', 1)[0] not in settings.get('folders', []):
+            return False
+        
+        previous = target.previous_files.get(entry.rel)
+        if not previous or not previous.get('size'):
+            return False
+        
+        suffix = stored_suffix(previous)
+        basis = os.path.join(target.previous_snapshot, *entry.rel.split('/')) + suffix
+        if not os.path.exists(basis):
+            return False
+        
+        # Unchanged since the previous snapshot (full scan): reuse the stored file
+        cached = self.digests.get(entry.path, entry.stat, target.hash_settings) if self.digests else None
+        if cached and self._unchanged(target, entry, previous, cached):
+            self._carry_delta_basis(target, entry, previous, basis, dst_file + suffix, meta)
+            return True
+        if delta_depth(basis) >= settings.get('max_chain', 5):
+            return False
+        
+        basis_ref = f"{os.path.basename(target.previous_snapshot)}/{entry.rel}{suffix}"
+        hasher = TreeHasher(target.hash_settings, entry.stat.st_size)
+        holes = HoleFinder(self.min_hole)
+        stats = write_delta(entry.path, basis, basis_ref, dst_file + DELTA_SUFFIX,
+                            block_size=settings.get('block_size_kb', 64) * 1024,
+                            max_literal_ratio=settings.get('max_literal_ratio', 0.5),
+                            digest=hasher, throttle=self.throttle, holes=holes)
+        if stats is None:
+            return False
+        digest = hasher.result()
+        if stats['size'] == entry.stat.st_size:
+            self.remember_digest(entry, target.hash_settings, digest)
+        if not stats['literal'] and self._unchanged(target, entry, previous, digest):
+            os.remove(dst_file + DELTA_SUFFIX)
+            self._carry_delta_basis(target, entry, previous, basis, dst_file + suffix, meta)
+            return True
+        target.written(dst_file + DELTA_SUFFIX, stats['stored'])
+        
+        target.known_entries[entry.rel] = dict(
+            digest,
+            size=stats['size'],
+            delta={'basis': basis_ref, 'stored_size': stats['stored']},
+            fresh=True,
+        )
+        if holes.holes:
+            # Recreated on restore, like the holes of a full copy
+            target.known_entries[entry.rel]['sparse'] = {'holes': holes.holes, 'stored': 'delta'}
+        if meta and target.metadata == 'index':
+            target.known_entries[entry.rel]['meta'] = meta
+        
+        delta_report = target.report.setdefault('delta', {'files': [], 'bytes_saved': 0})
+        delta_report['files'].append({'file': entry.rel, 'size': stats['size'],
+                                      'stored': stats['stored'], 'saved': stats['saved']})
+        delta_report['bytes_saved'] += stats['saved']
+        print(f"   🧩 {os.path.basename(entry.path)}: {stats['stored'] / (1024 * 1024):.1f} MB written, "
+              f"{stats['saved'] / (1024 * 1024):.1f} MB saved (delta)")
+        return True
+    
+    def _unchanged(self, target, entry, previous, digest):
+        """True if a source file matches its entry in the previous snapshot (size, mtime, digest)"""
+        if target.previous_hash != target.hash_settings or previous.get('size') != entry.stat.st_size:
+            return False
+        mtime_ns = previous.get('meta', {}).get('mtime_ns')
+        if mtime_ns is not None and mtime_ns != entry.stat.st_mtime_ns:
+            return False
+        return entry_digest(previous) == digest['digest']
+    
+    def _carry_delta_basis(self, target, entry, previous, basis, dst_file, meta):
+        self.carry_forward(basis, dst_file, target.metadata)
+        target.known_entries[entry.rel] = dict(previous, meta=meta) if meta and target.metadata == 'index' else previous
+        delta_report = target.report.setdefault('delta', {'files': [], 'bytes_saved': 0})
+        delta_report['unchanged'] = delta_report.get('unchanged', 0) + 1
     
     def backup_browser_data(self):
         """Backup browser bookmarks and passwords"""
         print("🌐 Backing up browser data...")
         
-        if platform.system() == "Windows":
-            user_profile = os.environ.get('USERPROFILE')
-            
+        browsers = get_provider().browser_profiles()
+        if browsers:
             # Chrome
-            chrome_path = os.path.join(user_profile, 'AppData', 'Local', 'Google', 'Chrome', 'User Data', 'Default')
+            chrome_path = browsers.get('Chrome', '')
             if os.path.exists(chrome_path):
                 try:
                     bookmarks = os.path.join(chrome_path, 'Bookmarks')
                     if os.path.exists(bookmarks):
-                        shutil.copy2(bookmarks, os.path.join(self.backup_folder, 'Browser_Data', 'Chrome_Bookmarks'))
+                        self.copy_file(FileEntry(bookmarks, 'Browser_Data/Chrome_Bookmarks', os.stat(bookmarks)),
+                                       'Browser_Data/Chrome_Bookmarks')
                         print("✅ Chrome bookmarks backed up!")
                 except Exception as e:
                     print(f"⚠️ Chrome backup error: {e}")
             
             # Firefox
-            firefox_path = os.path.join(user_profile, 'AppData', 'Roaming', 'Mozilla', 'Firefox', 'Profiles')
+            firefox_path = browsers.get('Firefox', '')
             if os.path.exists(firefox_path):
                 try:
                     # Find default profile
@@ -177,48 +640,155 @@ class PCBackup:
                         if profile.endswith('.default') or profile.endswith('.default-release'):
                             places = os.path.join(firefox_path, profile, 'places.sqlite')
                             if os.path.exists(places):
-                                shutil.copy2(places, os.path.join(self.backup_folder, 'Browser_Data', 'Firefox_Places.sqlite'))
+                                self.copy_file(FileEntry(places, 'Browser_Data/Firefox_Places.sqlite', os.stat(places)),
+                                               'Browser_Data/Firefox_Places.sqlite')
                                 print("✅ Firefox data backed up!")
                 except Exception as e:
                     print(f"⚠️ Firefox backup error: {e}")
+            
+            self.finish_writes()
     
     def create_file_inventory(self):
-        """Create inventory of all backed up files"""
+        """Create inventory of all backed up files (one per destination)"""
         print("📝 Creating file inventory...")
-        
+        self.for_each_target(self._create_inventory)
+    
+    def _create_inventory(self, target):
         inventory = []
         total_size = 0
+        workers = self.config.get('hash', {}).get('workers', 4)
+        backup_folder = target.backup_folder
         
-        for root, dirs, files in os.walk(self.backup_folder):
+        # Digests from the previous inventory are only reusable with the same settings
+        reuse = target.previous_hash == target.hash_settings
+        
+        for root, dirs, files in os.walk(backup_folder):
             for file in files:
                 filepath = os.path.join(root, file)
                 try:
+                    rel = os.path.relpath(filepath, backup_folder).replace(os.sep, '/')
+                    
+                    # Delta and packed sparse files are listed under the name of the full file
+                    suffix = next((s for s in (DELTA_SUFFIX, SPARSE_SUFFIX) if rel.endswith(s)), '')
+                    known = target.known_entries.get(rel[:-len(suffix)]) if suffix else None
+                    if known and stored_suffix(known) == suffix:
+                        entry = {k: v for k, v in known.items() if k not in ('md5', 'digest', 'leaves')}
+                        if entry_digest(known) and (known.get('fresh') or reuse):
+                            entry.update(self._digest_fields(known))
+                        else:
+                            with open_stored(filepath) as stream:
+                                entry.update(hash_stream(stream, target.hash_settings, known['size']))
+                        entry.pop('fresh', None)
+                        total_size += entry['size']
+                        inventory.append(dict(entry, file=filepath[:-len(suffix)].replace(backup_folder, '')))
+                        continue
+                    
                     size = os.path.getsize(filepath)
                     total_size += size
                     
-                    # Calculate MD5 hash for verification
-                    with open(filepath, 'rb') as f:
-                        md5 = hashlib.md5(f.read()).hexdigest()
+                    # Carried-forward files keep the hash from the previous inventory,
+                    # copied ones the hash computed while copying
+                    known = target.known_entries.get(rel)
+                    if (reuse or (known and known.get('fresh'))) and known and known.get('size') == size and entry_digest(known) and not known.get('delta'):
+                        digest = self._digest_fields(known)
+                    else:
+                        digest = hash_file(filepath, target.hash_settings, workers, size)
                     
-                    inventory.append({
-                        'file': filepath.replace(self.backup_folder, ''),
+                    entry = {
+                        'file': filepath.replace(backup_folder, ''),
                         'size': size,
-                        'md5': md5
-                    })
-                except:
-                    pass
+                    }
+                    entry.update(digest)
+                    if known and known.get('sparse') and known.get('size') == size:
+                        entry['sparse'] = known['sparse']  # holes to recreate on restore
+                    if known and known.get('meta'):
+                        entry['meta'] = known['meta']  # metadata to reapply on restore
+                    inventory.append(entry)
+                except (OSError, ValueError) as e:
+                    print(f"   ⚠️ Could not hash {file}: {e}")
         
-        # Save inventory
-        inventory_file = os.path.join(self.backup_folder, 'file_inventory.json')
+        # Save inventory (sorted by path, so snapshots can be diffed as streams)
+        inventory.sort(key=entry_path)
+        merkle_root = write_tree(backup_folder, inventory, target.hash_settings)
+        inventory_file = os.path.join(backup_folder, 'file_inventory.json')
+        data = {
+            'total_files': len(inventory),
+            'total_size': total_size,
+            'total_size_mb': total_size / (1024 * 1024),
+            'hash': target.hash_settings,
+            'order': INVENTORY_ORDER,
+            'metadata': target.metadata,
+            'merkle_root': merkle_root,
+        }
+        # Deferred and failed files are not in this snapshot: the next run must scan in full
+        # to find them (a saved position would only replay later changes)
+        if self.journal_position and not self.deferred and not self.failed and not target.stats['errors']:
+            data['journal'] = self.journal_position
+        data['files'] = inventory
         with open(inventory_file, 'w') as f:
-            json.dump({
-                'total_files': len(inventory),
-                'total_size': total_size,
-                'total_size_mb': total_size / (1024 * 1024),
-                'files': inventory
-            }, f, indent=2)
+            json.dump(data, f, indent=2)
+        
+        print(f"✅ Inventory created{f' on {target.usb_drive}' if len(self.targets) > 1 else ''}: {len(inventory)} files, {total_size / (1024**3):.2f} GB "
+              f"({target.hash_settings['algorithm']}{', tree' if target.hash_settings.get('leaf_size') else ''})")
+    
+    def compare_with_previous(self):
+        """Diff against the previous snapshot and warn about mass changes (ransomware)"""
+        target = next((t for t in self.live_targets() if t.previous_snapshot), None)
+        if target is None:
+            return
+        print("🔍 Comparing with previous snapshot...")
+        
+        # Files deferred by the time limit or not read this run are missing, not deleted
+        deferred = {rel for _, rel in self.deferred}
+        failed = {self._failed_rel(path) for path in self.failed}
+        missing = {'deferred': 0, 'failed': 0}
+        
+        def on_change(kind, path, old, new):
+            if kind != 'removed':
+                return
+            parts = path.split('/')
+            if path in deferred:
+                missing['deferred'] += 1
+            elif any('/'.join(parts[:i]) in failed for i in range(1, len(parts) + 1)):
+                missing['failed'] += 1
+        
+        try:
+            # User folders only (system info etc. changes on every run)
+            summary = diff_inventories(target.previous_snapshot, target.backup_folder,
+                                       on_change if deferred or failed else None, self.config.get('folders', []))
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not compare snapshots: {e}")
+            return
+        not_deleted = missing['deferred'] + missing['failed']
+        if not_deleted:
+            summary['removed_deferred'] = missing['deferred']
+            summary['removed_failed'] = missing['failed']
+            changed = (summary['modified']['files'] + summary['removed']['files']
+                       + summary['renamed']['files'] - not_deleted)
+            summary['changed_ratio'] = round(changed / summary['old_files'], 4)
+        summary['base'] = os.path.basename(target.previous_snapshot)
+        self.report['diff'] = summary
+        print_summary(summary)
+        if not_deleted:
+            print(f"   ({not_deleted} of the removed files were deferred or could not be read, not deleted)")
         
-        print(f"✅ Inventory created: {len(inventory)} files, {total_size / (1024**3):.2f} GB")
+        alert_ratio = self.config.get('diff', {}).get('alert_ratio')
+        if alert_ratio is not None and summary['changed_ratio'] > alert_ratio:
+            summary['alert'] = True
+            print(f"🚨 ALERT: {summary['changed_ratio'] * 100:.1f}% of files changed since "
+                  f"{summary['base']} - check for ransomware before overwriting older backups!")
+    
+    def _failed_rel(self, path):
+        """Snapshot path of a failed entry (scan errors name the source path)"""
+        if os.path.isabs(path):
+            path = os.path.relpath(path, get_user_profile())
+        return path.replace(os.sep, '/')
+    
+    def _digest_fields(self, entry):
+        fields = {'digest': entry_digest(entry)}
+        if entry.get('leaves'):
+            fields['leaves'] = entry['leaves']
+        return fields
     
     def create_readme(self):
         """Create README file"""
@@ -229,7 +799,7 @@ class PCBackup:
 
 Backup Date: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
 Computer: {platform.node()}
-User: {os.getlogin()}
+User: {get_provider().username()}
 OS: {platform.system()} {platform.release()}
 
 ───────────────────────────────────────────────────────────
@@ -267,7 +837,10 @@ OS: {platform.system()} {platform.release()}
 🔄 TO RESTORE:
 
 1. Copy folders back to your PC
+   (*.pcbdelta and *.pcbsparse files: python backup_delta.py restore <this folder> <target>,
+    one *.pcbsparse file: python backup_sparse.py expand <file>.pcbsparse <file>)
 2. Check file_inventory.json for verification
+   (python backup_hashing.py verify <this folder>)
 3. Refer to System_Info/ for original locations
 
 ───────────────────────────────────────────────────────────
@@ -285,12 +858,92 @@ Generated: {self.timestamp}
 ╚═══════════════════════════════════════════════════════════╝
 """
         
-        readme_file = os.path.join(self.backup_folder, 'README.txt')
-        with open(readme_file, 'w') as f:
-            f.write(readme_content)
+        def write(target):
+            with open(os.path.join(target.backup_folder, 'README.txt'), 'w') as f:
+                f.write(readme_content)
         
+        self.for_each_target(write)
         print(f"✅ README created")
     
+    def save_report(self):
+        """Save run report (rule savings etc.) next to the inventory"""
+        print("📊 Writing run report...")
+        
+        self.report['io']['fsync_batches'] = sum(target.fsync.batches for target in self.targets)
+        io = self.report['io']
+        if io.get('phases'):
+            print(f"   💽 I/O order: {io['strategy']}, buffer {io['buffer']['size'] // 1024} KB, "
+                  f"{io['fsync_batches']} fsync batches")
+            for phase, stats in io['phases'].items():
+                print(f"   💽 {phase}: {stats['files']} files, {stats['mb_per_s']} MB/s")
+        
+        if self.deferred:
+            self.report['deferred'] = {
+                'files': len(self.deferred),
+                'bytes': sum(entry.stat.st_size for entry, _ in self.deferred),
+                'max_duration_min': round(self.max_duration / 60, 2),
+                'list': sorted(rel for _, rel in self.deferred),
+            }
+            print(f"   ⏱️ Deferred to the next run: {len(self.deferred)} files, "
+                  f"{self.report['deferred']['bytes'] / (1024 * 1024):.1f} MB (listed in the report)")
+        
+        if self.failed:
+            self.report['failed'] = {'files': len(self.failed), 'list': sorted(set(self.failed))}
+            print(f"   ⚠️ Not backed up: {len(self.failed)} files or folders, retried by a full scan next run "
+                  f"(listed in the report)")
+        
+        if self.digests:
+            self.digests.close()
+            cache = self.report['digest_cache'] = self.digests.summary()
+            self.digests = None
+            rate = f" ({cache['hit_rate']:.0%} hit rate)" if cache['hit_rate'] is not None else ""
+            print(f"   🗃️ Digest cache: {cache['hits']} hits, {cache['misses']} misses{rate}, "
+                  f"{cache['evicted']} evicted, {cache['entries']} entries")
+        
+        if self.rules:
+            self.report['rules'] = self.rules.summary()
+            for rule, stats in self.report['rules'].items():
+                saved = f"{stats['bytes'] / (1024 * 1024):.1f} MB saved"
+                if stats.get('measured') is False:
+                    # Pruned folders are not walked unless rules.measure_pruned is on
+                    saved = f"{saved}, folder size not measured" if stats['files'] else "size not measured"
+                print(f"   🧹 {rule}: {stats['files']} files, {stats['dirs']} folders pruned, {saved}")
+        
+        # Every destination gets the shared report plus its own status and deltas
+        self.report['destinations'] = [target.status() for target in self.targets]
+        if len(self.targets) > 1:
+            for status in self.report['destinations']:
+                print(f"   📤 {status['destination']}: {status['status']}, {status['files']} files, "
+                      f"{status['bytes'] / (1024 * 1024):.1f} MB, {status['re_read']} re-read, "
+                      f"waited for {status['waited_s']:.0f}s"
+                      f"{', ' + status['error'] if status.get('error') else ''}")
+        
+        self.write_reports()
+    
+    def write_reports(self):
+        def write(target):
+            report_file = os.path.join(target.backup_folder, 'backup_report.json')
+            with open(report_file, 'w') as f:
+                json.dump(dict(self.report, **target.report), f, indent=2)
+            print(f"✅ Report saved: {report_file}")
+        
+        self.for_each_target(write)
+    
+    def upload_snapshot(self):
+        """Send the snapshot to the configured storage backend (see backup_storage.py)"""
+        settings = self.config.get('storage', {})
+        if not settings.get('upload'):
+            return
+        self.report['upload'] = publish(self.live_targets()[0].backup_folder, settings['upload'], settings)
+        # The report went up with the snapshot; the copies on the drives also get the outcome
+        self.write_reports()
+        print()
+    
+    def set_full_speed(self, on=True):
+        """Leave background mode (or return to it), also while run_backup() is running"""
+        self.throttle.set_full_speed(on)
+        print("⚡ Full speed" if on else "🐢 Back to background mode")
+    
     def run_backup(self):
         """Run complete backup process"""
         print("=" * 60)
@@ -298,14 +951,33 @@ Generated: {self.timestamp}
         print("=" * 60)
         print()
         
-        print(f"📍 Backup Location: {self.backup_folder}")
+        for target in self.targets:
+            print(f"📍 Backup Location: {target.backup_folder}")
         print()
         
         try:
+            self.digests = DigestCache.from_config(self.config)
+            if self.throttle.start(get_user_profile()):
+                limits = [f"{self.throttle.max_rate / (1024 * 1024):g} MB/s" if self.throttle.max_rate else None,
+                          f"{self.throttle.max_iops} IOPS" if self.throttle.max_iops else None,
+                          "adaptive" if self.throttle.report['latency_sampling'] else None]
+                print(f"🐢 Background mode: low priority{''.join(f', {l}' for l in limits if l)}")
+                print()
+            
+
             # Step 1: Create structure
             self.create_backup_structure()
             print()
             
+            # Step 1b: What changed since the last backup?
+            self.open_repository()
+            self.prepare_incremental()
+            print()
+            if self.max_duration:
+                self.deadline = time.monotonic() + self.max_duration
+                print(f"⏱️ Copying stops after {self.max_duration / 60:g} minutes")
+                print()
+            
             # Step 2: System info
             self.save_system_info()
             print()
@@ -322,29 +994,79 @@ Generated: {self.timestamp}
             self.create_file_inventory()
             print()
             
+            # Step 5b: What changed since the last snapshot?
+            self.compare_with_previous()
+            print()
+            
             # Step 6: Create README
             self.create_readme()
             print()
             
+            # Step 7: Run report
+            self.save_report()
+            print()
+            
+            # Step 8: Publish the finished snapshot
+            self.upload_snapshot()
+            
             print("=" * 60)
-            print("✅ BACKUP COMPLETE!")
+            print("✅ BACKUP COMPLETE!" if all(t.ok for t in self.targets) else "⚠️ BACKUP COMPLETE (some drives failed)")
             print("=" * 60)
-            print(f"\n📁 Backup saved at: {self.backup_folder}")
+            for target in self.targets:
+                if target.ok:
+                    print(f"\n📁 Backup saved at: {target.backup_folder}")
+                else:
+                    print(f"\n❌ {target.usb_drive} failed: {target.error}")
             print("\n💾 You can now safely remove the USB drive!")
             
         except Exception as e:
             print(f"\n❌ BACKUP FAILED: {e}")
             import traceback
             traceback.print_exc()
+        finally:
+            if self.fanout:
+                self.fanout.close()
+                self.fanout = None
+            if self.digests:
+                self.digests.close()
+                self.digests = None
+            self.throttle.stop()
 
 if __name__ == "__main__":
-    import sys
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="PC Auto Backup Tool")
+    parser.add_argument('usb_drive', nargs='*', default=["E:"],
+                        help="USB drive letter(s) or path(s) (default E:); several drives are written in one pass")
+    parser.add_argument('--config', help="Path to backup_config.json")
+    parser.add_argument('--background', action='store_true',
+                        help="Low priority, keep the PC responsive (see \"background\" in the config)")
+    parser.add_argument('--max-mbps', type=float, help="Background mode: read at most this many MB/s")
+    parser.add_argument('--max-iops', type=int, help="Background mode: at most this many reads per second")
+    parser.add_argument('--priority', action='store_true',
+                        help="Copy recent files and important folders first (see \"priority\" in the config)")
+    parser.add_argument('--max-duration', type=float, metavar='MINUTES',
+                        help="Stop copying after this many minutes (implies --priority); the rest is deferred")
+    parser.add_argument('--upload', metavar='DESTINATION',
+                        help="Then publish the snapshot to s3://bucket/prefix or a folder (see \"storage\" in the config)")
+    args = parser.parse_args()
     
-    # Get USB drive letter from command line or use default
-    usb_drive = sys.argv[1] if len(sys.argv) > 1 else "E:"
+    config = load_config(args.config, args.usb_drive[0])
+    if args.background or args.max_mbps or args.max_iops:
+        config['background']['enabled'] = True
+    if args.max_mbps:
+        config['background']['max_mb_per_s'] = args.max_mbps
+    if args.max_iops:
+        config['background']['max_iops'] = args.max_iops
+    if args.priority or args.max_duration:
+        config['priority']['enabled'] = True
+    if args.max_duration:
+        config['io']['max_duration_min'] = args.max_duration
+    if args.upload:
+        config['storage']['upload'] = args.upload
     
     # Create and run backup
-    backup = PCBackup(usb_drive)
+    backup = PCBackup(args.usb_drive, config)
     backup.run_backup()
     
     input("\nPress Enter to exit...")
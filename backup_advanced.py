@@ -11,23 +11,23 @@ import os
 import shutil
 import json
 import platform
-import subprocess
-import hashlib
-import zipfile
-import sqlite3
 from datetime import datetime
-from pathlib import Path
 import socket
-import winreg  # Windows only
+
+from backup_platform import get_provider
 
 class AdvancedPCBackup:
-    def __init__(self, usb_drive="E:", password=None):
+    def __init__(self, usb_drive="E:", password=None, upload=None, storage=None):
         self.usb_drive = usb_drive
         self.password = password
+        self.upload = upload        # s3://bucket/prefix or a folder (see backup_storage.py)
+        self.storage = storage      # "storage" config section
         self.backup_root = os.path.join(usb_drive, "PC_Backup_Advanced")
         self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.backup_folder = os.path.join(self.backup_root, f"Backup_{self.timestamp}")
         self.computer_name = platform.node()
+        self.provider = get_provider()
+        self.encrypted = {}  # rel path -> inventory entry of encrypted files
         
     def create_structure(self):
         """Create advanced backup folder structure"""
@@ -69,14 +69,9 @@ class AdvancedPCBackup:
             
             for key_path, filename in keys_to_backup:
                 reg_file = os.path.join(reg_folder, filename)
-                try:
-                    subprocess.run(
-                        ['reg', 'export', key_path, reg_file, '/y'],
-                        capture_output=True,
-                        timeout=30
-                    )
+                if self.provider.export_registry(key_path, reg_file):
                     print(f"   ✅ Exported: {filename}")
-                except Exception as e:
+                else:
                     print(f"   ⚠️ Failed: {filename}")
                     
         except Exception as e:
@@ -93,38 +88,10 @@ class AdvancedPCBackup:
         try:
             wifi_folder = os.path.join(self.backup_folder, "WiFiPasswords")
             
-            # Get all WiFi profiles
-            profiles = subprocess.check_output(
-                ['netsh', 'wlan', 'show', 'profiles']
-            ).decode('utf-8', errors='ignore').split('\n')
-            
-            wifi_data = []
-            
-            for line in profiles:
-                if "All User Profile" in line:
-                    profile_name = line.split(":")[1].strip()
-                    
-                    try:
-                        # Get password for this profile
-                        profile_info = subprocess.check_output(
-                            ['netsh', 'wlan', 'show', 'profile', profile_name, 'key=clear']
-                        ).decode('utf-8', errors='ignore').split('\n')
-                        
-                        password = None
-                        for info_line in profile_info:
-                            if "Key Content" in info_line:
-                                password = info_line.split(":")[1].strip()
-                                break
-                        
-                        wifi_data.append({
-                            'network': profile_name,
-                            'password': password if password else "N/A"
-                        })
-                        
-                        print(f"   ✅ {profile_name}: {'***' if password else 'No password'}")
-                        
-                    except:
-                        pass
+            # Saved networks with their keys
+            wifi_data = self.provider.wifi_profiles()
+            for network in wifi_data:
+                print(f"   ✅ {network['network']}: {'***' if network['password'] != 'N/A' else 'No password'}")
             
             # Save WiFi data
             wifi_file = os.path.join(wifi_folder, "wifi_passwords.json")
@@ -141,14 +108,7 @@ class AdvancedPCBackup:
         print("🌐 Advanced browser backup...")
         
         browser_folder = os.path.join(self.backup_folder, "BrowserData")
-        user_profile = os.environ.get('USERPROFILE', os.path.expanduser('~'))
-        
-        browsers = {
-            'Chrome': os.path.join(user_profile, 'AppData', 'Local', 'Google', 'Chrome', 'User Data', 'Default'),
-            'Edge': os.path.join(user_profile, 'AppData', 'Local', 'Microsoft', 'Edge', 'User Data', 'Default'),
-            'Firefox': os.path.join(user_profile, 'AppData', 'Roaming', 'Mozilla', 'Firefox', 'Profiles'),
-            'Brave': os.path.join(user_profile, 'AppData', 'Local', 'BraveSoftware', 'Brave-Browser', 'User Data', 'Default'),
-        }
+        browsers = self.provider.browser_profiles()
         
         for browser_name, browser_path in browsers.items():
             if os.path.exists(browser_path):
@@ -197,44 +157,8 @@ class AdvancedPCBackup:
         
         if platform.system() == "Windows":
             try:
-                # Get from registry
-                apps = []
-                
-                reg_paths = [
-                    r"SOFTWARE\Microsoft\Windows\CurrentVersion\Uninstall",
-                    r"SOFTWARE\WOW6432Node\Microsoft\Windows\CurrentVersion\Uninstall"
-                ]
-                
-                for reg_path in reg_paths:
-                    try:
-                        key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, reg_path)
-                        
-                        for i in range(winreg.QueryInfoKey(key)[0]):
-                            try:
-                                subkey_name = winreg.EnumKey(key, i)
-                                subkey = winreg.OpenKey(key, subkey_name)
-                                
-                                try:
-                                    name = winreg.QueryValueEx(subkey, "DisplayName")[0]
-                                    version = winreg.QueryValueEx(subkey, "DisplayVersion")[0]
-                                    publisher = winreg.QueryValueEx(subkey, "Publisher")[0]
-                                    
-                                    apps.append({
-                                        'name': name,
-                                        'version': version,
-                                        'publisher': publisher
-                                    })
-                                    
-                                except:
-                                    pass
-                                    
-                                winreg.CloseKey(subkey)
-                            except:
-                                pass
-                        
-                        winreg.CloseKey(key)
-                    except:
-                        pass
+                # Uninstall entries from the registry
+                apps = self.provider.installed_applications()
                 
                 # Save apps list
                 apps_file = os.path.join(apps_folder, "installed_applications.json")
@@ -279,8 +203,7 @@ class AdvancedPCBackup:
                 settings['environment_variables'] = dict(os.environ)
                 
                 # System info
-                result = subprocess.run(['systeminfo'], capture_output=True, text=True, timeout=30)
-                settings['systeminfo'] = result.stdout
+                settings['systeminfo'] = self.provider.system_details()
                 
             except:
                 pass
@@ -337,15 +260,17 @@ pause
         print("🔒 Encrypting sensitive data...")
         
         try:
-            from cryptography.fernet import Fernet
-            import base64
+            from backup_crypto import make_cipher, encrypt_file, ENC_SUFFIX, CHUNK_SIZE
+            from backup_hashing import load_repository, TreeHasher
+            from backup_pipeline import BufferPool
             
             # Generate key from password
-            key = base64.urlsafe_b64encode(hashlib.sha256(self.password.encode()).digest())
-            cipher = Fernet(key)
+            cipher = make_cipher(self.password)
+            hash_settings = load_repository(self.backup_root, None)['hash']
             
-            # Encrypt sensitive folders
+            # Encrypt sensitive folders (chunked, so files never sit in memory whole)
             sensitive_folders = ['WiFiPasswords', 'BrowserData', 'Registry']
+            pool = BufferPool(size=CHUNK_SIZE)  # read-ahead buffers, reused for every file
             
             for folder in sensitive_folders:
                 folder_path = os.path.join(self.backup_folder, folder)
@@ -355,14 +280,13 @@ pause
                             file_path = os.path.join(root, file)
                             
                             try:
-                                with open(file_path, 'rb') as f:
-                                    data = f.read()
-                                
-                                encrypted = cipher.encrypt(data)
-                                
-                                with open(file_path + '.encrypted', 'wb') as f:
-                                    f.write(encrypted)
+                                size = os.path.getsize(file_path)
+                                hasher = TreeHasher(hash_settings, size)
+                                stored = encrypt_file(file_path, file_path + ENC_SUFFIX, cipher, digest=hasher, pool=pool)
                                 
+                                rel = os.path.relpath(file_path, self.backup_folder).replace(os.sep, '/')
+                                self.encrypted[rel] = dict(hasher.result(), size=size,
+                                                           encrypted={'format': 'chunked', 'stored_size': stored})
                                 os.remove(file_path)
                                 print(f"   🔒 Encrypted: {file}")
                             except:
@@ -374,6 +298,50 @@ pause
             print("⚠️ cryptography module not installed - skipping encryption")
             print("   Install with: pip install cryptography")
     
+    def create_file_inventory(self):
+        """Inventory of the snapshot, so backup_reader.py can browse it"""
+        from backup_crypto import ENC_SUFFIX
+        from backup_hashing import load_repository, hash_file
+        from backup_merkle import write_tree
+        
+        print("📝 Creating file inventory...")
+        hash_settings = load_repository(self.backup_root, None)['hash']
+        inventory = []
+        total_size = 0
+        
+        for root, dirs, files in os.walk(self.backup_folder):
+            for file in files:
+                file_path = os.path.join(root, file)
+                rel = os.path.relpath(file_path, self.backup_folder).replace(os.sep, '/')
+                try:
+                    if rel.endswith(ENC_SUFFIX) and rel[:-len(ENC_SUFFIX)] in self.encrypted:
+                        # Listed under the plain name, digest of the plain content
+                        rel = rel[:-len(ENC_SUFFIX)]
+                        entry = dict(self.encrypted[rel])
+                    else:
+                        size = os.path.getsize(file_path)
+                        entry = dict(hash_file(file_path, hash_settings, size=size), size=size)
+                    entry['file'] = '/' + rel
+                    total_size += entry['size']
+                    inventory.append(entry)
+                except (OSError, ValueError) as e:
+                    print(f"   ⚠️ Could not hash {file}: {e}")
+        
+        inventory.sort(key=lambda entry: entry['file'])
+        merkle_root = write_tree(self.backup_folder, inventory, hash_settings)
+        with open(os.path.join(self.backup_folder, 'file_inventory.json'), 'w') as f:
+            json.dump({
+                'total_files': len(inventory),
+                'total_size': total_size,
+                'total_size_mb': total_size / (1024 * 1024),
+                'hash': hash_settings,
+                'order': 'path',
+                'merkle_root': merkle_root,
+                'files': inventory,
+            }, f, indent=2)
+        
+        print(f"✅ Inventory created: {len(inventory)} files")
+    
     def run_advanced_backup(self):
         """Run complete advanced backup"""
         print("=" * 70)
@@ -407,6 +375,14 @@ pause
             # Encrypt if password provided
             self.encrypt_backup()
             
+            # Index for browsing/restoring single files
+            self.create_file_inventory()
+            
+            # Publish the finished snapshot
+            if self.upload:
+                from backup_storage import publish
+                publish(self.backup_folder, self.upload, self.storage)
+            
             print("\n" + "=" * 70)
             print("✅ ADVANCED BACKUP COMPLETE!")
             print("=" * 70)
@@ -444,8 +420,15 @@ if __name__ == "__main__":
         if not password:
             print("⚠️ No password provided - encryption disabled")
     
+    # Optional upload of the finished snapshot
+    upload = input("Upload to (s3://bucket/prefix or a folder, default none): ").strip() or None
+    storage = None
+    if upload:
+        from backup_config import load_config
+        storage = load_config(usb_drive=usb_drive).get('storage')
+    
     # Run backup
-    backup = AdvancedPCBackup(usb_drive, password)
+    backup = AdvancedPCBackup(usb_drive, password, upload, storage)
     backup.run_advanced_backup()
     
     input("\nPress Enter to exit...")
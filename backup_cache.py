@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+🗃️ DIGEST CACHE
+Remembers the digest of every source file on the PC (a small SQLite
+file, ~/.pc_backup/digests.sqlite), so files that did not change since
+the last run are not hashed again:
+
+    file (st_dev, st_ino) + hash settings  ->  size, mtime_ns, digest
+
+A cached digest is used only if size and mtime (policy "mtime") - or
+also the ctime (policy "ctime", catches tools that restore the mtime) -
+are unchanged, and, with max_age_days, if it was computed recently
+enough. The cache keeps at most max_entries files; the least recently
+used ones are dropped at the end of a run.
+
+    "digest_cache": {"enabled": true, "policy": "mtime", "max_entries": 1000000}
+"""
+
+import os
+import json
+import time
+
+POLICIES = ('mtime', 'ctime')
+COMMIT_EVERY = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS digests (
+    file TEXT NOT NULL,         -- "st_dev:st_ino"
+    scheme TEXT NOT NULL,       -- "algorithm:leaf_size"
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    ctime_ns INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    leaves TEXT,
+    hashed REAL NOT NULL,
+    used REAL NOT NULL,
+    PRIMARY KEY (file, scheme)
+);
+CREATE INDEX IF NOT EXISTS digests_used ON digests (used);
+"""
+
+
+def default_path():
+    return os.path.join(os.path.expanduser('~'), '.pc_backup', 'digests.sqlite')
+
+
+def _scheme(settings):
+    return f"{settings['algorithm']}:{settings.get('leaf_size') or 0}"
+
+
+class DigestCache:
+    """Persistent (st_dev, st_ino, size, mtime) -> digest map for one run"""
+
+    def __init__(self, path=None, max_entries=1000000, policy='mtime', max_age_days=None):
+        import sqlite3
+
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown digest cache policy: {policy}")
+        self.path = path or default_path()
+        self.max_entries = max_entries
+        self.policy = policy
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0, 'stored': 0, 'evicted': 0}
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript(SCHEMA)
+        self._used = []     # hits, written back in one go
+        self._pending = 0
+        self._now = time.time()
+
+    @classmethod
+    def from_config(cls, config):
+        """Cache from the "digest_cache" config section, None when disabled or unavailable"""
+        settings = config.get('digest_cache', {})
+        if not settings.get('enabled', True):
+            return None
+        try:
+            return cls(settings.get('path'), settings.get('max_entries', 1000000),
+                       settings.get('policy', 'mtime'), settings.get('max_age_days'))
+        except ImportError:
+            print("⚠️ sqlite3 not available - digest cache disabled")
+        except Exception as e:  # sqlite3.Error, OSError: a broken cache must not stop the backup
+            print(f"⚠️ Digest cache disabled: {e}")
+        return None
+
+    def _key(self, path, st):
+        # DirEntry.stat() has no st_dev/st_ino on Windows
+        if not st.st_ino:
+            st = os.stat(path)
+        return f"{st.st_dev}:{st.st_ino}", st
+
+    def get(self, path, st, settings):
+        """{'digest'[, 'leaves']} for an unchanged file, else None"""
+        key, st = self._key(path, st)
+        row = self.db.execute(
+            "SELECT size, mtime_ns, ctime_ns, digest, leaves, hashed FROM digests WHERE file = ? AND scheme = ?",
+            (key, _scheme(settings))).fetchone()
+        if row is None:
+            self.stats['misses'] += 1
+            return None
+        size, mtime_ns, ctime_ns, digest, leaves, hashed = row
+        if (size != st.st_size or mtime_ns != st.st_mtime_ns
+                or (self.policy == 'ctime' and ctime_ns != st.st_ctime_ns)
+                or (self.max_age is not None and self._now - hashed > self.max_age)):
+            self.stats['stale'] += 1
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        self._used.append((self._now, key, _scheme(settings)))
+        result = {'digest': digest}
+        if leaves:
+            result['leaves'] = json.loads(leaves)
+        return result
+
+    def put(self, path, st, settings, result):
+        """Remember the digest of a file as it was when st was taken"""
+        key, st = self._key(path, st)
+        leaves = json.dumps(result['leaves']) if result.get('leaves') else None
+        self.db.execute(
+            "INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, _scheme(settings), st.st_size, st.st_mtime_ns, st.st_ctime_ns,
+             result['digest'], leaves, time.time(), self._now))
+        self.stats['stored'] += 1
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self.db.commit()
+            self._pending = 0
+
+    def summary(self):
+        """Stats for the report, with the hit rate"""
+        lookups = self.stats['hits'] + self.stats['misses']
+        return dict(self.stats, hit_rate=round(self.stats['hits'] / lookups, 4) if lookups else None)
+
+    def close(self):
+        """Save, drop the least recently used entries beyond max_entries"""
+        if self._used:
+            self.db.executemany("UPDATE digests SET used = ? WHERE file = ? AND scheme = ?", self._used)
+            self._used = []
+        count = self.db.execute("SELECT COUNT(*) FROM digests").fetchone()[0]
+        if self.max_entries and count > self.max_entries:
+            cursor = self.db.execute(
+                "DELETE FROM digests WHERE rowid IN (SELECT rowid FROM digests ORDER BY used LIMIT ?)",
+                (count - self.max_entries,))
+            self.stats['evicted'] += cursor.rowcount
+            count -= cursor.rowcount
+        self.stats['entries'] = count
+        self.db.commit()
+        self.db.close()
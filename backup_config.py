@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+⚙️ BACKUP CONFIGURATION
+Loads backup_config.json from the USB drive (or next to the scripts)
+"""
+
+import os
+import json
+import copy
+
+from backup_platform import get_provider
+
+CONFIG_FILENAME = "backup_config.json"
+
+DEFAULT_CONFIG = {
+    # Folders (inside the user profile) that are backed up
+    "folders": ["Documents", "Pictures", "Videos", "Desktop", "Downloads", "Music"],
+
+    # Include/exclude rules (gitignore style, see backup_rules.py)
+    "rules": {
+        "patterns": [],
+        "max_file_size_mb": None,
+        "max_age_days": None,
+        "measure_pruned": False,
+    },
+
+    # Directory walk (see backup_scanner.py)
+    "scan": {
+        "workers": 8,               # folders listed in parallel (1: one at a time)
+        "max_depth": None,          # folder levels below each source folder
+        "follow_symlinks": False,   # descend into symlinked folders and junctions
+        "one_file_system": False,   # stay on the file system of each source folder
+    },
+
+    # Digests of unchanged source files are reused (see backup_cache.py)
+    "digest_cache": {
+        "enabled": True,
+        "path": None,               # default: ~/.pc_backup/digests.sqlite
+        "max_entries": 1000000,     # least recently used files are dropped beyond this
+        "policy": "mtime",          # "ctime": also require an unchanged ctime
+        "max_age_days": None,       # re-hash digests older than this
+    },
+
+    # Publish each finished snapshot to a folder or an object store (see backup_storage.py)
+    "storage": {
+        "upload": None,             # "s3://bucket/prefix" or a folder; None: keep it on the drive only
+        "endpoint": None,           # S3-compatible server, default https://s3.<region>.amazonaws.com
+        "region": "us-east-1",
+        "access_key_env": "AWS_ACCESS_KEY_ID",      # credentials come from these environment variables
+        "secret_key_env": "AWS_SECRET_ACCESS_KEY",
+        "addressing": "path",       # or "virtual" (bucket.host)
+        "part_size_mb": 16,         # multipart upload part size
+        "workers": 8,               # parts and files sent in parallel
+        "retries": 5,
+        "verify_tls": True,
+        "fsync": True,              # folders: flush every file before the inventory
+    },
+
+    # Change-tracking journal written by backup_journal.py
+    "journal": {
+        "enabled": True,
+        "path": None,               # default: ~/.pc_backup/journal
+        "max_entries": 200000,      # compacted/reset beyond this
+        "poll_interval": 60,        # seconds, polling fallback only
+        "sync_timeout": 10,         # seconds to wait for the watcher
+    },
+
+    # Store large, slightly changed files as deltas against the previous
+    # snapshot (see backup_delta.py)
+    "delta": {
+        "enabled": False,
+        "folders": ["Documents", "Desktop"],
+        "min_size_mb": 32,
+        "block_size_kb": 64,
+        "max_chain": 5,             # deltas on top of deltas before a full copy
+        "max_literal_ratio": 0.5,   # give up if more than this fraction changed
+    },
+
+    # Digest settings for NEW repositories; an existing PC_Backup folder
+    # keeps the settings in its repository.json (see backup_hashing.py)
+    "hash": {
+        "algorithm": "blake2b",     # any hashlib algorithm: md5, sha256, blake2b...
+        "tree": False,              # tree hash: leaves hashed in parallel
+        "leaf_size_mb": 64,
+        "workers": 4,
+    },
+
+    # Sparse files (see backup_sparse.py): holes and long zero runs (VM
+    # images, databases) are skipped while copying; recreated on drives
+    # with sparse files, packed elsewhere
+    "sparse": {
+        "enabled": True,
+        "min_hole_kb": 64,          # shorter zero runs are copied as data
+        "min_packed_mb": 16,        # drives without sparse files: shorter runs are written out
+    },
+
+    # Background mode (backup_throttle.py): for automatic runs that should
+    # not slow the PC down; the GUI has a "full speed" button
+    "background": {
+        "enabled": False,
+        "nice": 10,                 # CPU priority (POSIX nice level)
+        "max_mb_per_s": None,       # source read cap, None = no cap
+        "max_iops": None,           # source reads per second, None = no cap
+        "adaptive": True,           # back off while the source disk is busy (Linux)
+        "max_latency_ms": 25,
+    },
+
+    # I/O scheduling (see backup_io.py)
+    "io": {
+        "schedule": True,           # order reads by disk location, small files first
+        "large_file_mb": 8,         # streamed separately from the small-file batch
+        "use_extents": True,        # physical extents via FIEMAP (Linux)
+        "buffer_kb": None,          # fixed copy buffer; default: probe per run
+        "probe": True,
+        "probe_min_mb": 256,        # only probe when copying at least this much
+        "fsync_batch_mb": 256,
+        "fsync_batch_files": 1000,
+        "fanout_buffer_mb": 64,     # per extra drive: how far a slow drive may lag behind
+        "fanout_wait_s": 5,         # then the others wait this long before it re-reads the file alone
+        "pipeline_buffers": 4,      # read-ahead buffers for large files (1: no read-ahead)
+        "hash_while_copying": True, # inventory digests computed during the copy, no second read
+        "max_duration_min": None,   # stop copying after this long, the rest is deferred
+    },
+
+    # Copy order for runs that may be cut short (see IOScheduler in backup_io.py):
+    # recently modified files first, then small files, then bulk; heavier
+    # folders first within each group
+    "priority": {
+        "enabled": False,
+        "recent_days": 7,
+        "weights": {"Desktop": 3, "Documents": 3, "Pictures": 2, "Downloads": 1,
+                    "Music": 1, "Videos": 0.5},
+    },
+
+    # File metadata (see backup_metadata.py): "copy" sets it on every copied file,
+    # "index" keeps it in file_inventory.json, "auto" picks index on FAT/exFAT
+    "metadata": {
+        "mode": "auto",
+        "xattrs": True,
+    },
+
+    # Comparison with the previous snapshot after each run (see backup_diff.py)
+    "diff": {
+        "alert_ratio": 0.5,         # warn when more than this fraction of files changed
+    },
+}
+
+
+def _merge(base, override):
+    """Merge override into base (nested dicts are merged, not replaced)"""
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            _merge(base[key], value)
+        else:
+            base[key] = value
+    return base
+
+
+def get_user_profile():
+    """Home folder of the current user"""
+    return get_provider().user_profile()
+
+
+def get_source_folders(config, user_profile=None):
+    """Map of folder name -> source path for the configured folders"""
+    user_profile = user_profile or get_user_profile()
+    return {name: os.path.join(user_profile, name) for name in config.get('folders', [])}
+
+
+def find_config(usb_drive=None):
+    """Find config file on the USB drive or next to the scripts"""
+    candidates = []
+    if usb_drive:
+        candidates.append(os.path.join(usb_drive, CONFIG_FILENAME))
+    candidates.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), CONFIG_FILENAME))
+
+    for path in candidates:
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def load_config(path=None, usb_drive=None):
+    """Load configuration, falling back to defaults for missing keys"""
+    config = copy.deepcopy(DEFAULT_CONFIG)
+
+    if path is None:
+        path = find_config(usb_drive)
+    if path is None:
+        return config
+
+    with open(path, 'r', encoding='utf-8') as f:
+        user_config = json.load(f)
+
+    if not isinstance(user_config, dict):
+        raise ValueError(f"Invalid config file (expected a JSON object): {path}")
+
+    _merge(config, user_config)
+    config['_path'] = path
+    return config
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+🔒 ENCRYPTED FILES
+Chunked Fernet format used for ".encrypted" files, so they can be
+decrypted (and decompressed) as a stream instead of in one piece:
+
+    PCBENC1\\n
+    {"size": ..., "chunk_size": 1048576, "compression": "zlib"}\\n
+    <4-byte length> <Fernet token>      one per chunk
+
+Every token holds one chunk of the file, prefixed with its index, a
+"last chunk" flag and a "compressed" flag; reordered, dropped or
+truncated chunks are detected.
+
+Older backups stored the whole file as a single Fernet token; those are
+still readable, but have to be decrypted in memory.
+"""
+
+import io
+import os
+import json
+import zlib
+import base64
+import struct
+import hashlib
+
+from backup_pipeline import BufferPool, HashStage, run_pipeline
+
+ENC_MAGIC = b"PCBENC1\n"
+ENC_SUFFIX = ".encrypted"
+CHUNK_SIZE = 1024 * 1024
+
+TOKEN_LENGTH = struct.Struct('>I')
+CHUNK_PREFIX = struct.Struct('>QBB')  # index, last, compressed
+
+
+def make_cipher(password):
+    """Fernet cipher for a backup password (raises ImportError without cryptography)"""
+    from cryptography.fernet import Fernet
+
+    key = base64.urlsafe_b64encode(hashlib.sha256(password.encode()).digest())
+    return Fernet(key)
+
+
+class EncryptStage:
+    """Pipeline stage turning each chunk into a length-prefixed token"""
+
+    def __init__(self, cipher, count, level=6):
+        self.cipher = cipher
+        self.count = count
+        self.level = level
+        self.index = 0
+
+    def data(self, view):
+        # Registry exports and browser databases compress well, media does not
+        packed = zlib.compress(view, self.level)
+        compressed = len(packed) < len(view)
+        prefix = CHUNK_PREFIX.pack(self.index, self.index == self.count - 1, compressed)
+        token = self.cipher.encrypt(prefix + (packed if compressed else view))
+        self.index += 1
+        return TOKEN_LENGTH.pack(len(token)) + token
+
+
+def encrypt_file(src, dst, cipher, chunk_size=CHUNK_SIZE, digest=None, pool=None):
+    """Encrypt src into dst chunk by chunk; returns the stored size
+
+    Files of more than one chunk are read ahead in a second thread while
+    the current chunk is encrypted (backup_pipeline.py); pool is a
+    BufferPool of chunk_size buffers to reuse across files.
+    """
+    size = os.path.getsize(src)
+    count = max(-(-size // chunk_size), 1)
+    stages = ([HashStage(digest)] if digest is not None else []) + [EncryptStage(cipher, count)]
+    filled = [0]
+
+    with open(src, 'rb', buffering=0) as fin, open(dst, 'wb') as out:
+        out.write(ENC_MAGIC)
+        header = {'size': size, 'chunk_size': chunk_size, 'compression': 'zlib'}
+        out.write(json.dumps(header).encode() + b"\n")
+
+        def fill(buffer):
+            # Exactly count chunks of chunk_size (the last one shorter), even for empty files
+            if filled[0] == count:
+                return None
+            view = memoryview(buffer)[:chunk_size]
+            n = 0
+            while n < chunk_size:
+                got = fin.readinto(view[n:])
+                if not got:
+                    break
+                n += got
+            filled[0] += 1
+            return view[:n]
+
+        def drain(view):
+            for stage in stages:
+                view = stage.data(view)
+            out.write(view)
+
+        if count == 1:
+            drain(fill(bytearray(chunk_size)))
+        else:
+            run_pipeline(fill, drain, pool if pool is not None and pool.size >= chunk_size
+                         else BufferPool(size=chunk_size))
+        return out.tell()
+
+
+def _decrypt(cipher, token, path):
+    from cryptography.fernet import InvalidToken
+
+    try:
+        return cipher.decrypt(token)
+    except InvalidToken:
+        raise ValueError(f"Wrong password or damaged file: {path}")
+
+
+def is_chunked(path):
+    with open(path, 'rb') as f:
+        return f.read(len(ENC_MAGIC)) == ENC_MAGIC
+
+
+class EncryptedReader:
+    """Seekable file-like object decrypting one chunk at a time"""
+
+    def __init__(self, path, cipher):
+        self.path = path
+        self.cipher = cipher
+        self.f = open(path, 'rb')
+        if self.f.read(len(ENC_MAGIC)) != ENC_MAGIC:
+            self.f.close()
+            raise ValueError(f"Not a chunked encrypted file: {path}")
+        header = json.loads(self.f.readline())
+        self.size = header['size']
+        self.chunk_size = header['chunk_size']
+        self.count = max(-(-self.size // self.chunk_size), 1)
+        self._first = self.f.tell()
+        self._offsets = None    # file offset of every chunk, built on the first jump
+        self._index = -1
+        self._data = b""
+        self.pos = 0
+
+    def _chunk(self, index):
+        if index == self._index:
+            return self._data
+        if index != self._index + 1:
+            self.f.seek(self._chunk_offset(index))
+
+        raw = self.f.read(TOKEN_LENGTH.size)
+        if len(raw) < TOKEN_LENGTH.size:
+            raise ValueError(f"Truncated encrypted file: {self.path}")
+        (length,) = TOKEN_LENGTH.unpack(raw)
+        plain = _decrypt(self.cipher, self.f.read(length), self.path)
+
+        chunk_index, last, compressed = CHUNK_PREFIX.unpack_from(plain)
+        if chunk_index != index or bool(last) != (index == self.count - 1):
+            raise ValueError(f"Encrypted chunks out of order: {self.path}")
+        data = plain[CHUNK_PREFIX.size:]
+        self._index = index
+        self._data = zlib.decompress(data) if compressed else data
+        return self._data
+
+    def _chunk_offset(self, index):
+        if self._offsets is None:
+            # Only the length prefixes are read, the tokens are skipped
+            self._offsets = []
+            here = self.f.tell()
+            self.f.seek(self._first)
+            for _ in range(self.count):
+                offset = self.f.tell()
+                raw = self.f.read(TOKEN_LENGTH.size)
+                if len(raw) < TOKEN_LENGTH.size:
+                    break
+                self._offsets.append(offset)
+                self.f.seek(TOKEN_LENGTH.unpack(raw)[0], 1)
+            self.f.seek(here)
+        if index >= len(self._offsets):
+            raise ValueError(f"Truncated encrypted file: {self.path}")
+        return self._offsets[index]
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.pos
+        elif whence == 2:
+            offset += self.size
+        self.pos = max(offset, 0)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.pos
+        out = []
+        while size > 0 and self.pos < self.size:
+            index, skip = divmod(self.pos, self.chunk_size)
+            piece = self._chunk(index)[skip:skip + size]
+            if not piece:
+                break
+            out.append(piece)
+            self.pos += len(piece)
+            size -= len(piece)
+        return b"".join(out)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_encrypted(path, cipher):
+    """Open an .encrypted file of either format for reading"""
+    if is_chunked(path):
+        return EncryptedReader(path, cipher)
+    # Old format: one token for the whole file
+    with open(path, 'rb') as f:
+        return io.BytesIO(_decrypt(cipher, f.read(), path))
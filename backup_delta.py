@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+🧩 DELTA TRANSFER
+rsync-style deltas for large files that change slightly between snapshots.
+
+The copy of a file in the previous snapshot is split into blocks; each
+block gets a weak (Adler-32, rolling) and a strong (BLAKE2b) checksum.
+The new file is scanned for matching blocks and only the changed bytes
+are written, as a ".pcbdelta" file that references the old copy:
+
+    PCBDELTA1\\n
+    {"basis": "Backup_.../Documents/mail.pst", "size": ..., ...}\\n
+    C <first block> <count>      copy blocks from the basis
+    L <length> <bytes>           literal data
+    E                            end
+
+Full files are rebuilt lazily (streamed) on restore:
+
+    python backup_delta.py rebuild E:/PC_Backup/Backup_X/Documents/mail.pst.pcbdelta out.pst
+    python backup_delta.py restore E:/PC_Backup/Backup_X C:/Restore
+"""
+
+import os
+import sys
+import json
+import zlib
+import bisect
+import struct
+import shutil
+import hashlib
+
+from backup_sparse import SparseReader, SPARSE_SUFFIX, expand, write_with_holes
+from backup_metadata import apply as apply_metadata
+
+DELTA_MAGIC = b"PCBDELTA1\n"
+DELTA_SUFFIX = ".pcbdelta"
+
+OP_COPY = b"C"
+OP_LITERAL = b"L"
+OP_END = b"E"
+
+COPY_OP = struct.Struct('>QI')
+LITERAL_OP = struct.Struct('>I')
+
+ADLER_MOD = 65521
+READ_SIZE = 1024 * 1024
+RESYNC_BLOCKS = 16
+
+
+def _strong(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class DeltaReader:
+    """Seekable file-like object that rebuilds a delta file on the fly"""
+
+    def __init__(self, path, backup_root=None):
+        self.path = path
+        self.f = open(path, 'rb')
+        if self.f.read(len(DELTA_MAGIC)) != DELTA_MAGIC:
+            self.f.close()
+            raise ValueError(f"Not a delta file: {path}")
+        self.header = json.loads(self.f.readline())
+        self.size = self.header['size']
+        self.block_size = self.header['block_size']
+
+        # The basis is stored relative to the PC_Backup folder
+        if backup_root is None:
+            backup_root = snapshot_root(path)
+        self.basis = open_stored(os.path.join(backup_root, *self.header['basis'].split('/')), backup_root)
+        basis_size = getattr(self.basis, 'size', None)
+        if basis_size is None:
+            basis_size = os.fstat(self.basis.fileno()).st_size
+
+        # Index of (logical offset, length, source, source offset); literal
+        # data is not read here, only skipped over.
+        self.ops = []
+        offset = 0
+        while True:
+            op = self.f.read(1)
+            if op == OP_COPY:
+                start, count = COPY_OP.unpack(self.f.read(COPY_OP.size))
+                begin = start * self.block_size
+                length = min(count * self.block_size, basis_size - begin)
+                self.ops.append((offset, length, self.basis, begin))
+            elif op == OP_LITERAL:
+                (length,) = LITERAL_OP.unpack(self.f.read(LITERAL_OP.size))
+                self.ops.append((offset, length, self.f, self.f.tell()))
+                self.f.seek(length, os.SEEK_CUR)
+            else:
+                break
+            offset += length
+        self._starts = [op[0] for op in self.ops]
+        self.pos = 0
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self.pos = max(offset, 0)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.pos
+        out = []
+        i = bisect.bisect_right(self._starts, self.pos) - 1
+        while size > 0 and 0 <= i < len(self.ops):
+            start, length, source, source_offset = self.ops[i]
+            skip = self.pos - start
+            if skip >= length:
+                i += 1
+                continue
+            source.seek(source_offset + skip)
+            chunk = source.read(min(size, length - skip, READ_SIZE))
+            if not chunk:
+                break
+            out.append(chunk)
+            self.pos += len(chunk)
+            size -= len(chunk)
+        return b"".join(out)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.f.close()
+        self.basis.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def snapshot_root(path):
+    """PC_Backup folder containing a stored file (parent of Backup_*)"""
+    current = os.path.dirname(os.path.abspath(path))
+    while True:
+        if os.path.basename(current).startswith("Backup_"):
+            return os.path.dirname(current)
+        parent = os.path.dirname(current)
+        if parent == current:
+            raise ValueError(f"Not inside a Backup_* folder: {path}")
+        current = parent
+
+
+def stored_suffix(entry):
+    """Suffix of the file an inventory entry is stored as ('' for plain files)"""
+    if entry.get('delta'):
+        return DELTA_SUFFIX
+    if entry.get('sparse', {}).get('stored') == 'packed':
+        return SPARSE_SUFFIX
+    return ''
+
+
+def open_stored(path, backup_root=None):
+    """Open a stored file for reading, rebuilding it if it is a delta or packed"""
+    if path.endswith(DELTA_SUFFIX):
+        return DeltaReader(path, backup_root)
+    if path.endswith(SPARSE_SUFFIX):
+        return SparseReader(path)
+    if not os.path.exists(path):
+        if os.path.exists(path + DELTA_SUFFIX):
+            return DeltaReader(path + DELTA_SUFFIX, backup_root)
+        if os.path.exists(path + SPARSE_SUFFIX):
+            return SparseReader(path + SPARSE_SUFFIX)
+    return open(path, 'rb')
+
+
+def delta_depth(path):
+    """Number of deltas that must be applied to rebuild a stored file"""
+    depth = 0
+    while path.endswith(DELTA_SUFFIX):
+        with open(path, 'rb') as f:
+            f.read(len(DELTA_MAGIC))
+            header = json.loads(f.readline())
+        depth += 1
+        path = os.path.join(snapshot_root(path), *header['basis'].split('/'))
+    return depth
+
+
+def build_signature(basis, block_size):
+    """Map weak checksum -> {strong checksum: block index} for a basis file"""
+    signature = {}
+    index = 0
+    tail = None
+    while True:
+        block = basis.read(block_size)
+        if not block:
+            break
+        if len(block) < block_size:
+            tail = (index, _strong(block), len(block))
+            break
+        signature.setdefault(zlib.adler32(block), {}).setdefault(_strong(block), index)
+        index += 1
+    return signature, tail
+
+
+class _DeltaWriter:
+    """Collects copy/literal ops, merging runs of consecutive blocks"""
+
+    def __init__(self, out):
+        self.out = out
+        self.copy_start = None
+        self.copy_count = 0
+        self.written = 0
+        self.literal_bytes = 0
+
+    def copy(self, index):
+        if self.copy_start is not None and self.copy_start + self.copy_count == index:
+            self.copy_count += 1
+            return
+        self._flush_copy()
+        self.copy_start, self.copy_count = index, 1
+
+    def literal(self, data):
+        if not data:
+            return
+        self._flush_copy()
+        for i in range(0, len(data), 0x7fffffff):
+            part = data[i:i + 0x7fffffff]
+            self.out.write(OP_LITERAL + LITERAL_OP.pack(len(part)))
+            self.out.write(part)
+            self.written += 1 + LITERAL_OP.size + len(part)
+        self.literal_bytes += len(data)
+
+    def _flush_copy(self):
+        if self.copy_start is not None:
+            self.out.write(OP_COPY + COPY_OP.pack(self.copy_start, self.copy_count))
+            self.written += 1 + COPY_OP.size
+            self.copy_start = None
+
+    def finish(self):
+        self._flush_copy()
+        self.out.write(OP_END)
+        self.written += 1
+
+
+def write_delta(src_path, basis_path, basis_ref, out_path, block_size=64 * 1024,
+                max_literal_ratio=0.5, digest=None, throttle=None, holes=None):
+    """
+    Write a delta of src_path against basis_path to out_path.
+
+    Returns a stats dict, or None if the file changed too much for a
+    delta to be worthwhile (out_path is removed in that case). The
+    optional digest and holes (a backup_sparse.HoleFinder) objects are
+    updated with the full new content; reads of src_path are charged to
+    the optional throttle (background mode).
+    """
+    with open_stored(basis_path) as basis:
+        signature, tail = build_signature(basis, block_size)
+
+    size = os.path.getsize(src_path)
+    max_literal = int(size * max_literal_ratio)
+
+    with open(src_path, 'rb') as src, open(out_path, 'wb') as out:
+        if throttle is not None:
+            src = throttle.wrap(src)
+        header = {'basis': basis_ref, 'size': size, 'block_size': block_size}
+        out.write(DELTA_MAGIC)
+        out.write(json.dumps(header).encode() + b"\n")
+        writer = _DeltaWriter(out)
+
+        buf = bytearray()
+        pos = 0             # scan position in buf
+        literal_start = 0   # start of pending literal data in buf
+        eof = False
+        weak = None
+        a = b = 0
+        # Rolling byte-by-byte is slow in Python, so it is limited to
+        # re-aligning after a change; long changed regions are skipped
+        # block-wise with a fresh attempt every RESYNC_BLOCKS blocks.
+        roll_budget = 2 * block_size
+        skipped = 0
+
+        while True:
+            # Keep at least one block + one byte ahead of pos
+            if not eof and len(buf) - pos < block_size + 1:
+                # Drop data that was already emitted
+                if literal_start > 0:
+                    del buf[:literal_start]
+                    pos -= literal_start
+                    literal_start = 0
+                chunk = src.read(max(READ_SIZE, block_size * 2))
+                if digest is not None and chunk:
+                    digest.update(chunk)
+                if holes is not None and chunk:
+                    holes.update(chunk)
+                if not chunk:
+                    eof = True
+                buf += chunk
+                continue
+
+            if len(buf) - pos < block_size:
+                break
+
+            if weak is None:
+                window = bytes(buf[pos:pos + block_size])
+                weak = zlib.adler32(window)
+                a, b = weak & 0xffff, weak >> 16
+
+            index = None
+            candidates = signature.get(weak)
+            if candidates:
+                index = candidates.get(_strong(bytes(buf[pos:pos + block_size])))
+
+            if index is not None:
+                writer.literal(bytes(buf[literal_start:pos]))
+                writer.copy(index)
+                pos += block_size
+                literal_start = pos
+                weak = None
+                roll_budget = 2 * block_size
+                skipped = 0
+            elif roll_budget > 0 and len(buf) - pos > block_size:
+                # Roll the Adler-32 window one byte forward
+                old, new = buf[pos], buf[pos + block_size]
+                a = (a - old + new) % ADLER_MOD
+                b = (b - block_size * old + a - 1) % ADLER_MOD
+                weak = (b << 16) | a
+                pos += 1
+                roll_budget -= 1
+            else:
+                # Changed region: continue block-aligned until the next match
+                pos += block_size
+                weak = None
+                skipped += 1
+                if skipped % RESYNC_BLOCKS == 0:
+                    roll_budget = 2 * block_size
+
+            # Flush literal data in bounded pieces to keep memory flat
+            if pos - literal_start >= READ_SIZE:
+                writer.literal(bytes(buf[literal_start:pos]))
+                literal_start = pos
+
+            if writer.literal_bytes > max_literal:
+                break
+
+        if writer.literal_bytes <= max_literal:
+            rest = bytes(buf[literal_start:])
+            if tail and len(rest) == tail[2] and _strong(rest) == tail[1]:
+                writer.copy(tail[0])
+            else:
+                writer.literal(rest)
+
+        usable = writer.literal_bytes <= max_literal
+        if usable:
+            writer.finish()
+
+    if not usable:
+        os.remove(out_path)
+        return None
+
+    stored = os.path.getsize(out_path)
+    return {
+        'size': size,
+        'stored': stored,
+        'literal': writer.literal_bytes,
+        'saved': max(size - stored, 0),
+    }
+
+
+def rebuild(delta_path, out_path, holes=None):
+    """Rebuild the full file from a delta (streaming), leaving holes unwritten"""
+    with DeltaReader(delta_path) as reader:
+        if holes:
+            write_with_holes(reader, out_path, reader.size, holes)
+            return
+        with open(out_path, 'wb') as out:
+            shutil.copyfileobj(reader, out, READ_SIZE)
+
+
+def _inventory_entries(snapshot):
+    """rel path -> inventory entry of the files with metadata or holes to restore"""
+    try:
+        with open(os.path.join(snapshot, 'file_inventory.json'), 'r') as f:
+            inventory = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {entry['file'].replace('\\', '/').lstrip('/'): entry
+            for entry in inventory.get('files', []) if entry.get('meta') or entry.get('sparse')}
+
+
+def restore_tree(snapshot, dest):
+    """Copy a snapshot folder to dest, rebuilding delta and packed sparse files
+    and reapplying metadata kept in the inventory"""
+    entries = _inventory_entries(snapshot)
+    restored = 0
+    for root, dirs, files in os.walk(snapshot):
+        rel_root = os.path.relpath(root, snapshot)
+        target_root = os.path.join(dest, rel_root)
+        os.makedirs(target_root, exist_ok=True)
+        for file in files:
+            src = os.path.join(root, file)
+            if file.endswith(DELTA_SUFFIX):
+                file = file[:-len(DELTA_SUFFIX)]
+                entry = entries.get(os.path.normpath(os.path.join(rel_root, file)).replace(os.sep, '/'), {})
+                rebuild(src, os.path.join(target_root, file), entry.get('sparse', {}).get('holes'))
+            elif file.endswith(SPARSE_SUFFIX):
+                file = file[:-len(SPARSE_SUFFIX)]
+                expand(src, os.path.join(target_root, file))
+            else:
+                shutil.copy2(src, os.path.join(target_root, file))
+            meta = entries.get(os.path.normpath(os.path.join(rel_root, file)).replace(os.sep, '/'), {}).get('meta')
+            if meta:
+                apply_metadata(os.path.join(target_root, file), meta)
+            restored += 1
+    return restored
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Rebuild files stored as deltas")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('rebuild', help="Rebuild one .pcbdelta file")
+    p.add_argument('delta')
+    p.add_argument('output')
+    p = sub.add_parser('restore', help="Restore a whole snapshot folder")
+    p.add_argument('snapshot')
+    p.add_argument('dest')
+    args = parser.parse_args()
+
+    if args.command == 'rebuild':
+        rebuild(args.delta, args.output)
+        print(f"✅ Rebuilt: {args.output}")
+    else:
+        count = restore_tree(args.snapshot, args.dest)
+        print(f"✅ Restored {count} files to {args.dest}")
+    sys.exit(0)
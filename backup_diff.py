@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+🔍 SNAPSHOT DIFF
+Compares two snapshots through their file_inventory.json files:
+added, removed, modified and renamed (same content, new path) files,
+with byte totals.
+
+Inventories are read as streams (entry by entry) and merged in one
+pass, so memory grows with the number of changes, not with the size of
+the inventories. New inventories are written sorted by path
+("order": "path"); older ones are sorted in memory first.
+
+    python backup_diff.py E:/PC_Backup/Backup_A E:/PC_Backup/Backup_B
+    python backup_diff.py E:/PC_Backup/Backup_A E:/PC_Backup/Backup_B --summary --alert 0.3
+"""
+
+import os
+import re
+import sys
+import json
+
+from backup_hashing import inventory_settings, entry_digest
+
+INVENTORY_FILE = 'file_inventory.json'
+INVENTORY_ORDER = 'path'
+READ_SIZE = 1024 * 1024
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = re.compile(r'[ \t\r\n]*')
+_SEPARATOR = re.compile(r'[ \t\r\n]*,?[ \t\r\n]*')
+_VALUE_END = ' \t\r\n,]}:'
+
+
+def entry_path(entry):
+    """Snapshot-relative "/"-separated path of an inventory entry (also the sort key)"""
+    return entry['file'].replace('\\', '/').lstrip('/')
+
+
+class InventoryStream:
+    """
+    Reads a file_inventory.json entry by entry.
+
+    Top-level values before "files" are available in .header once
+    iteration has started; the files are yielded one at a time.
+    """
+
+    def __init__(self, path):
+        if os.path.isdir(path):
+            path = os.path.join(path, INVENTORY_FILE)
+        self.path = path
+        self.header = {}
+        self._f = None
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        chunk = self._f.read(READ_SIZE)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _skip(self):
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf) or not self._fill():
+                return
+
+    def _peek(self):
+        self._skip()
+        return self._buf[self._pos] if self._pos < len(self._buf) else ''
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError(f"Malformed inventory (expected {char!r}): {self.path}")
+        self._pos += 1
+
+    def _value(self):
+        self._skip()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buf, self._pos)
+                # A number cut off by the end of the buffer ("8." | "5") decodes too early
+                if (end < len(self._buf) and self._buf[end] in _VALUE_END) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise ValueError(f"Malformed inventory: {self.path}")
+            self._fill()
+
+    def _array(self):
+        # Hot loop: one regex for the separator, one raw_decode per entry
+        buf, pos = self._buf, self._pos
+        while True:
+            pos = _SEPARATOR.match(buf, pos).end()
+            if pos < len(buf):
+                if buf[pos] == ']':
+                    self._pos = pos + 1
+                    return
+                try:
+                    value, end = _decoder.raw_decode(buf, pos)
+                    if end < len(buf) and buf[end] in _VALUE_END:
+                        pos = end
+                        yield value
+                        continue
+                except json.JSONDecodeError:
+                    pass
+            # Entry cut off at the end of the buffer
+            self._pos = pos
+            if not self._fill():
+                raise ValueError(f"Malformed inventory: {self.path}")
+            buf, pos = self._buf, self._pos
+
+    def __iter__(self):
+        with open(self.path, 'r', encoding='utf-8') as self._f:
+            self._expect('{')
+            while self._peek() not in ('}', ''):
+                key = self._value()
+                self._expect(':')
+                if key == 'files':
+                    self._expect('[')
+                    yield from self._array()
+                else:
+                    self.header[key] = self._value()
+                if self._peek() == ',':
+                    self._pos += 1
+
+
+def sorted_entries(path):
+    """(stream, iterator of entries sorted by path) for any inventory"""
+    stream = InventoryStream(path)
+    entries = iter(stream)
+    first = next(entries, None)  # reads the header up to "files"
+    if stream.header.get('order') == INVENTORY_ORDER:
+        def chain():
+            if first is not None:
+                yield first
+            yield from entries
+        return stream, chain()
+
+    # Older inventory (folder-walk order)
+    everything = ([first] if first is not None else []) + list(entries)
+    everything.sort(key=entry_path)
+    return stream, iter(everything)
+
+
+def _within(entries, folders):
+    prefixes = tuple(folder.strip('/') + '/' for folder in folders)
+    return (entry for entry in entries if entry_path(entry).startswith(prefixes))
+
+
+def diff_inventories(old_path, new_path, on_change=None, folders=None):
+    """
+    Merge two inventories; returns a summary dict.
+
+    on_change(kind, path, old_entry, new_entry) is called for every
+    change: 'modified' while merging, 'added'/'removed'/'renamed' at the
+    end (a rename passes "old path -> new path" as path). folders limits
+    the comparison to some top-level folders (e.g. ["Documents"]).
+    """
+    old_stream, old_entries = sorted_entries(old_path)
+    new_stream, new_entries = sorted_entries(new_path)
+    if folders:
+        old_entries, new_entries = _within(old_entries, folders), _within(new_entries, folders)
+
+    # Digests are only comparable when both sides use the same settings
+    comparable = inventory_settings(old_stream.header) == inventory_settings(new_stream.header)
+
+    summary = {kind: {'files': 0, 'bytes': 0} for kind in ('added', 'removed', 'modified', 'renamed', 'unchanged')}
+    summary['digests_compared'] = comparable
+    added, removed = {}, {}   # digest -> [(path, entry)], only possible renames are kept
+
+    def count(kind, path, old, new):
+        summary[kind]['files'] += 1
+        summary[kind]['bytes'] += (new or old).get('size', 0)
+        if on_change and kind != 'unchanged':
+            on_change(kind, path, old, new)
+
+    def pending(table, path, entry, kind):
+        digest = entry_digest(entry)
+        if comparable and digest and entry.get('size'):
+            table.setdefault(digest, []).append((path, entry))
+        else:
+            count(kind, path, entry if kind == 'removed' else None, entry if kind == 'added' else None)
+
+    old_entry = next(old_entries, None)
+    new_entry = next(new_entries, None)
+    old_files = 0
+    while old_entry is not None or new_entry is not None:
+        old_key = entry_path(old_entry) if old_entry is not None else None
+        new_key = entry_path(new_entry) if new_entry is not None else None
+
+        if new_key is None or (old_key is not None and old_key < new_key):
+            pending(removed, old_key, old_entry, 'removed')
+            old_entry = next(old_entries, None)
+            old_files += 1
+        elif old_key is None or new_key < old_key:
+            pending(added, new_key, new_entry, 'added')
+            new_entry = next(new_entries, None)
+        else:
+            if comparable:
+                same = entry_digest(old_entry) == entry_digest(new_entry)
+            else:
+                same = old_entry.get('size') == new_entry.get('size')
+            count('unchanged' if same else 'modified', new_key, old_entry, new_entry)
+            old_entry = next(old_entries, None)
+            new_entry = next(new_entries, None)
+            old_files += 1
+
+    # Same content under a new path = rename
+    for digest, new_list in added.items():
+        old_list = removed.get(digest, [])
+        for path, entry in new_list:
+            if old_list:
+                source, old_entry = old_list.pop(0)
+                count('renamed', f"{source} -> {path}", old_entry, entry)
+            else:
+                count('added', path, None, entry)
+    for old_list in removed.values():
+        for source, entry in old_list:
+            count('removed', source, entry, None)
+
+    changed = summary['modified']['files'] + summary['removed']['files'] + summary['renamed']['files']
+    summary['old_files'] = old_files
+    summary['changed_ratio'] = round(changed / old_files, 4) if old_files else 0.0
+    return summary
+
+
+def print_summary(summary):
+    for kind in ('added', 'removed', 'modified', 'renamed', 'unchanged'):
+        stats = summary[kind]
+        print(f"   {kind:<10} {stats['files']:>8} files  {stats['bytes'] / (1024 * 1024):>10.1f} MB")
+    print(f"   changed    {summary['changed_ratio'] * 100:>7.1f}% of {summary['old_files']} files")
+    if not summary['digests_compared']:
+        print("   ⚠️ Different hash settings - compared by size only, renames not detected")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare two snapshots by their inventories")
+    parser.add_argument('old', help="Older Backup_YYYYMMDD_HHMMSS folder (or its file_inventory.json)")
+    parser.add_argument('new', help="Newer snapshot")
+    parser.add_argument('--path', action='append', help="Only this folder (repeatable, e.g. --path Documents)")
+    parser.add_argument('--summary', action='store_true', help="Only print totals")
+    parser.add_argument('--json', action='store_true', help="Print the summary as JSON")
+    parser.add_argument('--alert', type=float, metavar='RATIO',
+                        help="Exit with status 2 if more than this fraction of files changed (e.g. 0.3)")
+    args = parser.parse_args()
+
+    marks = {'added': 'A', 'removed': 'D', 'modified': 'M', 'renamed': 'R'}
+
+    def show(kind, path, old, new):
+        print(f"{marks[kind]} {path}")
+
+    try:
+        summary = diff_inventories(args.old, args.new, None if args.summary or args.json else show, args.path)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary)
+
+    if args.alert is not None and summary['changed_ratio'] > args.alert:
+        print(f"🚨 ALERT: {summary['changed_ratio'] * 100:.1f}% of files changed "
+              f"(threshold {args.alert * 100:.1f}%)", file=sys.stderr)
+        sys.exit(2)
+    sys.exit(0)
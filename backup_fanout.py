@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+📤 MULTI-DESTINATION FAN-OUT
+Reads every source file once and writes it to several USB drives.
+
+Each destination has its own writer thread and a bounded queue of
+chunks. A drive that is merely slower (USB 2 next to USB 3) sets the
+pace: when its queue is full the reader waits for it, so every file is
+still read once, except when a drive stalls or fails:
+
+- a drive whose queue stays full for longer than max_wait is detached
+  from the current file and finishes it on its own (reading the rest
+  of that file again, from where it stopped)
+- a drive that fails (removed, full, I/O error) is marked failed and
+  dropped for the rest of the run; the others carry on
+
+Holes and zero runs (backup_sparse.py) are sent as their length only;
+each drive recreates them or stores the file packed.
+"""
+
+import os
+import time
+import errno
+import shutil
+import threading
+from collections import deque
+
+from backup_io import FsyncBatcher, DEFAULT_BUFFER
+from backup_sparse import SparseWriter, iter_regions, MIN_HOLE, MIN_PACKED
+from backup_pipeline import HashStage
+
+# Errors that mean the drive itself is gone or unusable (not just one bad file name)
+DEVICE_ERRORS = {errno.EIO, errno.ENOSPC, errno.ENODEV, errno.ENXIO, errno.EROFS,
+                 getattr(errno, 'EDQUOT', errno.ENOSPC)}
+
+
+def is_device_error(e):
+    return getattr(e, 'errno', None) in DEVICE_ERRORS
+
+
+class BackupTarget:
+    """One destination drive and its state for the current run"""
+
+    def __init__(self, usb_drive, timestamp, io_settings=None):
+        io_settings = io_settings or {}
+        self.usb_drive = usb_drive
+        self.backup_root = os.path.join(usb_drive, "PC_Backup")
+        self.backup_folder = os.path.join(self.backup_root, f"Backup_{timestamp}")
+
+        # Incremental state (see PCBackup.prepare_incremental)
+        self.previous_snapshot = None
+        self.previous_files = {}
+        self.previous_journal = None
+        self.previous_hash = None
+        self.known_entries = {}
+        self.hash_settings = None
+
+        self.sparse_ok = False   # probed once the snapshot folder exists
+        self.metadata = 'copy'   # or 'index' (backup_metadata.py), probed like sparse_ok
+        self.fsync = FsyncBatcher(io_settings.get('fsync_batch_mb', 256) * 1024 * 1024,
+                                  io_settings.get('fsync_batch_files', 1000))
+        self.report = {}
+        self.error = None
+        self.stats = {'files': 0, 'bytes': 0, 're_read': 0, 'errors': 0, 'waited_s': 0}
+        self._lock = threading.Lock()
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def path(self, rel):
+        """Path of a snapshot-relative ("Documents/a.txt") file on this drive"""
+        return os.path.join(self.backup_folder, *rel.split('/'))
+
+    def fail(self, e):
+        if self.error is None:
+            self.error = str(e)
+
+    def count(self, name, amount=1):
+        """Add to a stats counter (writer threads and the main thread share them)"""
+        with self._lock:
+            self.stats[name] += amount
+
+    def written(self, dst_file, size):
+        # Called from the writer thread and from the main thread (deltas)
+        with self._lock:
+            self.stats['files'] += 1
+            self.stats['bytes'] += size
+            self.fsync.add(dst_file, size)
+
+    def record_copy(self, dst_file, size, sparse=None, digest=None, meta=None):
+        """Remember what the inventory needs of a file copied this run
+        (size: the full size; holes to recreate, digest computed while
+        copying, source metadata in index mode)"""
+        rel = os.path.relpath(dst_file, self.backup_folder).replace(os.sep, '/')
+        entry = dict(digest or {}, size=size, fresh=True)
+        if sparse:
+            entry['sparse'] = sparse
+        if meta:
+            entry['meta'] = meta
+        with self._lock:
+            self.known_entries[rel] = entry
+            if sparse:
+                stats = self.report.setdefault('sparse', {'files': 0, 'hole_bytes': 0, 'packed': 0})
+                stats['files'] += 1
+                stats['hole_bytes'] += sum(length for _, length in sparse['holes'])
+                stats['packed'] += sparse['stored'] == 'packed'
+
+    def status(self):
+        status = {'destination': self.usb_drive, 'status': 'ok' if self.ok else 'failed',
+                  'sparse_files': self.sparse_ok, 'metadata': self.metadata}
+        status.update(self.stats)
+        status['waited_s'] = round(status['waited_s'], 1)
+        if self.error:
+            status['error'] = self.error
+        return status
+
+
+class _Writer:
+    """Writer thread and chunk queue of one destination"""
+
+    def __init__(self, target, copier):
+        self.target = target
+        self.copier = copier
+        self.items = deque()
+        self.buffered = 0
+        self.busy = False
+        self.out = None
+        self.dst = None
+        self.thread = threading.Thread(target=self._run, name=f"fanout-{target.usb_drive}", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        cond = self.copier.cond
+        while True:
+            with cond:
+                while not self.items:
+                    cond.wait()
+                kind, job, payload = self.items.popleft()
+                self.busy = True
+            try:
+                if kind == 'stop':
+                    return
+                if self.target.ok:
+                    self._handle(kind, job, payload)
+            except Exception as e:
+                self._discard()
+                if isinstance(e, OSError) and not is_device_error(e):
+                    self.target.count('errors')
+                    print(f"   ⚠️ Could not write {os.path.basename(self.dst or job.src)} "
+                          f"to {self.target.usb_drive}: {e}")
+                else:
+                    # Drive gone, or anything unexpected: drop this destination, keep the thread
+                    # alive and its queue empty so drain() does not wait for it
+                    self.target.fail(e)
+                    print(f"   ❌ {self.target.usb_drive} failed: {e}")
+                    with cond:
+                        self._drop_queued()
+            finally:
+                with cond:
+                    if kind == 'data':
+                        self.buffered -= len(payload)
+                    self.busy = False
+                    cond.notify_all()
+
+    def _handle(self, kind, job, payload):
+        if kind == 'open':
+            self.dst = payload
+            self.out = SparseWriter(payload, self.target.sparse_ok, self.copier.min_packed)
+        elif self.out is None:
+            return  # an earlier error already dropped this file
+        elif kind in ('data', 'hole'):
+            self.out.write(kind, payload)
+        elif kind == 'detach':
+            # Fell behind: finish this file from the source on our own
+            self.target.count('re_read')
+            with open(job.src, 'rb', buffering=0) as f:
+                if self.copier.throttle is not None:
+                    f = self.copier.throttle.wrap(f)
+                buf = bytearray(self.copier.buffer_size)
+                for piece in iter_regions(f, buf, min_hole=self.copier.min_hole, start=self.out.pos):
+                    self.out.write(*piece)
+            self._finish(job)
+        elif kind == 'close':
+            self._finish(job)
+        elif kind == 'abort':
+            self._discard()
+
+    def _finish(self, job):
+        path, stored, info = self.out.close()
+        size = self.out.pos
+        self.out = None
+        if self.target.metadata == 'index':
+            meta = job.meta
+        else:
+            meta = None
+            shutil.copystat(job.src, path)
+        self.target.written(path, stored)
+        # The digest read from the source only applies to targets hashing the same way
+        digest = job.digest if size == job.size and job.settings == self.target.hash_settings else None
+        if info or digest or meta:
+            self.target.record_copy(self.dst, size, info, digest, meta)
+
+    def _drop_queued(self):
+        """Forget what is still queued for a failed destination (caller holds cond)"""
+        stop = any(kind == 'stop' for kind, _, _ in self.items)
+        self.buffered -= sum(len(payload) for kind, _, payload in self.items if kind == 'data')
+        self.items.clear()
+        if stop:
+            self.items.append(('stop', None, None))
+
+    def _discard(self):
+        if self.out is not None:
+            self.out.abort()
+            self.out = None
+
+
+class _Job:
+    def __init__(self, src, size, meta=None, digest=None, settings=None):
+        self.src = src
+        self.size = size
+        self.meta = meta
+        self.digest = digest        # set once the whole source is read
+        self.settings = settings
+
+
+class FanoutCopier:
+    """Copies files from one source to several BackupTargets, reading once"""
+
+    def __init__(self, targets, buffer_size=DEFAULT_BUFFER, max_buffer=64 * 1024 * 1024, min_hole=MIN_HOLE,
+                 throttle=None, min_packed=MIN_PACKED, max_wait=5.0):
+        self.buffer_size = buffer_size
+        self.max_wait = max_wait    # seconds the reader waits for a drive with a full queue
+        self.min_hole = min_hole
+        self.min_packed = min_packed
+        self.throttle = throttle    # shared with the main thread (background mode)
+        self.max_buffer = max(max_buffer, buffer_size)
+        self.cond = threading.Condition()
+        self.writers = {id(target): _Writer(target, self) for target in targets}
+
+    def _put(self, writer, item):
+        writer.items.append(item)
+        if item[0] == 'data':
+            writer.buffered += len(item[2])
+
+    def copy(self, src, size, outputs, meta=None, digest=None, hasher=None, settings=None):
+        """Copy src to [(target, dst_file)]; raises OSError on source read errors
+
+        meta: source metadata for drives that keep it in the inventory
+        digest: known digest of src for the hash settings given, or a
+        TreeHasher (hasher) to compute it from the bytes read; returns
+        the digest, None if src changed size while being read
+        """
+        job = _Job(src, size, meta, None, settings)
+        stage = HashStage(hasher) if hasher is not None else None
+        read = 0
+        active = [self.writers[id(target)] for target, _ in outputs]
+        with self.cond:
+            for writer, (_, dst_file) in zip(active, outputs):
+                self._put(writer, ('open', job, dst_file))
+            self.cond.notify_all()
+
+        try:
+            with open(src, 'rb', buffering=0) as f:
+                if self.throttle is not None:
+                    f = self.throttle.wrap(f)
+                # Fresh bytes per read (no shared buffer): chunks wait in the queues
+                for piece in iter_regions(f, buffer_size=self.buffer_size, min_hole=self.min_hole):
+                    if piece[0] == 'data':
+                        read += len(piece[1])
+                        if stage:
+                            stage.data(piece[1])
+                    else:
+                        read += piece[1]
+                        if stage:
+                            stage.zeros(piece[1])
+                    active = self._offer(active, job, piece)
+                    if not active:
+                        break
+        except OSError:
+            with self.cond:
+                for writer in active:
+                    self._put(writer, ('abort', job, None))
+                self.cond.notify_all()
+            raise
+
+        if active and read == size:
+            job.digest = hasher.result() if stage else digest
+        with self.cond:
+            for writer in active:
+                self._put(writer, ('close', job, None))
+            self.cond.notify_all()
+        return job.digest
+
+    def _offer(self, active, job, piece):
+        """Queue a ('data', chunk) or ('hole', length) piece for every writer
+        that keeps up; returns the writers still attached"""
+        with self.cond:
+            deadline = None
+            while True:
+                active = [w for w in active if w.target.ok]
+                full = [w for w in active if w.buffered >= self.max_buffer]
+                if not full:
+                    break
+                if len(full) == len(active):
+                    deadline = None     # nobody has room: the fastest drive sets the pace
+                    self.cond.wait()
+                    continue
+                # Wait for the slower drives (no second read) unless they stall
+                now = time.monotonic()
+                if deadline is None:
+                    deadline = now + self.max_wait
+                if now >= deadline:
+                    break
+                self.cond.wait(deadline - now)
+                waited = time.monotonic() - now
+                for writer in full:
+                    writer.target.count('waited_s', waited)
+
+            attached = []
+            for writer in active:
+                if writer.buffered < self.max_buffer:
+                    self._put(writer, (piece[0], job, piece[1]))
+                    attached.append(writer)
+                else:
+                    self._put(writer, ('detach', job, None))
+            self.cond.notify_all()
+            return attached
+
+    def drain(self):
+        """Wait until every queued write has reached its destination"""
+        with self.cond:
+            while any(w.items or w.busy for w in self.writers.values()):
+                self.cond.wait()
+
+    def close(self):
+        with self.cond:
+            for writer in self.writers.values():
+                self._put(writer, ('stop', None, None))
+            self.cond.notify_all()
+        for writer in self.writers.values():
+            writer.thread.join()
@@ -6,25 +6,23 @@ Easy-to-use graphical interface for PC backup
 Copyright © 2026 DAXX
 """
 
+import os
+import sys
+import threading
+
 try:
     import tkinter as tk
     from tkinter import ttk, filedialog, messagebox, scrolledtext
-    import threading
-    import os
-    import sys
-    from pathlib import Path
-    
-    # Import our backup modules
-    sys.path.insert(0, os.path.dirname(__file__))
-    from backup import PCBackup
-    from backup_advanced import AdvancedPCBackup
-    
 except ImportError as e:
     print(f"Error: {e}")
-    print("Please install required modules:")
-    print("pip install tkinter")
+    print("The GUI needs Tkinter:")
+    print("   Windows/macOS: included with the python.org installer")
+    print("   Linux: sudo apt install python3-tk (or your distribution's package)")
     sys.exit(1)
 
+# The backup modules are imported when a backup starts, so the window opens fast
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
 class BackupGUI:
     def __init__(self, root):
         self.root = root
@@ -37,6 +35,8 @@ class BackupGUI:
         self.backup_type = tk.StringVar(value="basic")
         self.enable_encryption = tk.BooleanVar(value=False)
         self.password = tk.StringVar()
+        self.background = tk.BooleanVar(value=False)
+        self.current_backup = None  # PCBackup while it runs, for the full speed button
         
         self.setup_ui()
         
@@ -121,6 +121,16 @@ class BackupGUI:
         )
         self.password_entry.pack(side=tk.LEFT, padx=5)
         
+        # Background mode
+        speed_frame = tk.LabelFrame(main, text="🐢 Speed", padx=10, pady=10)
+        speed_frame.pack(fill=tk.X, pady=5)
+        
+        tk.Checkbutton(
+            speed_frame,
+            text="Background mode (low priority, keep the PC responsive)",
+            variable=self.background
+        ).pack(anchor=tk.W)
+        
         # Progress
         progress_frame = tk.LabelFrame(main, text="📊 Progress", padx=10, pady=10)
         progress_frame.pack(fill=tk.BOTH, expand=True, pady=5)
@@ -153,6 +163,18 @@ class BackupGUI:
         )
         self.start_button.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
         
+        self.full_speed_button = tk.Button(
+            button_frame,
+            text="⚡ FULL SPEED",
+            command=self.full_speed,
+            bg="#f39c12",
+            fg="white",
+            font=("Arial", 12, "bold"),
+            height=2,
+            state=tk.DISABLED
+        )
+        self.full_speed_button.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=2)
+        
         tk.Button(
             button_frame,
             text="❌ EXIT",
@@ -176,6 +198,12 @@ class BackupGUI:
         else:
             self.password_frame.pack_forget()
     
+    def full_speed(self):
+        """Leave background mode of the running backup"""
+        if self.current_backup is not None:
+            self.current_backup.set_full_speed()
+        self.full_speed_button.config(state=tk.DISABLED)
+    
     def log(self, message):
         """Add message to log"""
         self.log_text.insert(tk.END, message + "\n")
@@ -222,8 +250,19 @@ class BackupGUI:
             pwd = self.password.get() if self.enable_encryption.get() else None
             
             if backup_type in ["basic", "complete"]:
+                from backup import PCBackup
+                from backup_config import load_config
+
                 self.log("\n📁 Running BASIC backup...")
-                backup = PCBackup(usb)
+                config = load_config(usb_drive=usb)
+                if self.background.get():
+                    config['background']['enabled'] = True
+                backup = PCBackup(usb, config)
+                
+                # Keep a reference so the full speed button can reach the running backup
+                self.current_backup = backup
+                if backup.throttle.enabled:
+                    self.full_speed_button.config(state=tk.NORMAL)
                 
                 # Redirect prints to GUI
                 import sys
@@ -240,6 +279,8 @@ class BackupGUI:
                 self.log(output)
             
             if backup_type in ["advanced", "complete"]:
+                from backup_advanced import AdvancedPCBackup
+
                 self.log("\n⚙️ Running ADVANCED backup...")
                 adv_backup = AdvancedPCBackup(usb, pwd)
                 
@@ -270,6 +311,8 @@ class BackupGUI:
             messagebox.showerror("Error", f"Backup failed:\n{e}")
         
         finally:
+            self.current_backup = None
+            self.full_speed_button.config(state=tk.DISABLED)
             self.progress_bar.stop()
             self.start_button.config(state=tk.NORMAL)
 
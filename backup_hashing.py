@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+🔐 FILE HASHING
+Configurable digest algorithm (per repository) with an optional tree hash.
+
+Flat mode hashes the whole file with one algorithm (md5, sha256,
+blake2b, ...). Tree mode splits files larger than one leaf into
+fixed-size leaves that are hashed in parallel:
+
+    leaf  = H(0x00 || leaf bytes)
+    root  = H(0x01 || leaf digest 1 || leaf digest 2 || ...)
+
+The leaf digests are kept in the inventory, so a part of a file can be
+verified (or re-hashed) without reading the rest.
+
+Settings live in PC_Backup/repository.json and are copied into every
+file_inventory.json; inventories without them are MD5 (old snapshots).
+
+    python backup_hashing.py verify E:/PC_Backup/Backup_X
+    python backup_hashing.py verify E:/PC_Backup/Backup_X --path Documents/vm.vdi --range 0-1073741824
+"""
+
+import os
+import sys
+import json
+import hashlib
+
+REPOSITORY_FILE = "repository.json"
+LEGACY_SETTINGS = {'algorithm': 'md5', 'leaf_size': None}
+READ_SIZE = 1024 * 1024
+
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+
+
+def check_algorithm(name):
+    """Raise ValueError for algorithms hashlib does not provide"""
+    if name not in hashlib.algorithms_available or name.startswith('shake'):
+        raise ValueError(f"Unsupported hash algorithm: {name}")
+    return name
+
+
+def settings_from_config(config):
+    """Hash settings for a new repository from the "hash" config section"""
+    section = (config or {}).get('hash', {})
+    leaf_mb = section.get('leaf_size_mb', 64) if section.get('tree') else None
+    return {
+        'algorithm': check_algorithm(section.get('algorithm', 'blake2b')),
+        'leaf_size': leaf_mb * 1024 * 1024 if leaf_mb else None,
+    }
+
+
+def load_repository(backup_root, config):
+    """Repository settings; created from the config on first use"""
+    path = os.path.join(backup_root, REPOSITORY_FILE)
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            repository = json.load(f)
+        check_algorithm(repository['hash']['algorithm'])
+        return repository
+
+    repository = {'hash': settings_from_config(config)}
+    os.makedirs(backup_root, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(repository, f, indent=2)
+    return repository
+
+
+def inventory_settings(inventory):
+    """Hash settings recorded in an inventory (old inventories are MD5)"""
+    return inventory.get('hash') or LEGACY_SETTINGS
+
+
+def entry_digest(entry):
+    """Digest stored for an inventory entry, old ("md5") or new ("digest") style"""
+    return entry.get('digest') or entry.get('md5')
+
+
+class TreeHasher:
+    """Incremental hasher producing flat or tree digests (hashlib-like)"""
+
+    def __init__(self, settings, size):
+        self.algorithm = settings['algorithm']
+        self.leaf_size = settings.get('leaf_size')
+        # Files that fit in one leaf always get a flat digest
+        self.tree = bool(self.leaf_size) and size > self.leaf_size
+        self.leaves = []
+        self._leaf = self._new_leaf() if self.tree else hashlib.new(self.algorithm)
+        self._leaf_fill = 0
+
+    def _new_leaf(self):
+        h = hashlib.new(self.algorithm)
+        h.update(LEAF_PREFIX)
+        return h
+
+    def update(self, data):
+        data = memoryview(data)
+        if not self.tree:
+            self._leaf.update(data)
+            return
+        while len(data):
+            take = min(len(data), self.leaf_size - self._leaf_fill)
+            self._leaf.update(data[:take])
+            self._leaf_fill += take
+            data = data[take:]
+            if self._leaf_fill == self.leaf_size:
+                self.leaves.append(self._leaf.hexdigest())
+                self._leaf = self._new_leaf()
+                self._leaf_fill = 0
+
+    def result(self):
+        """Return {'digest': ...} plus 'leaves' for tree digests"""
+        if not self.tree:
+            return {'digest': self._leaf.hexdigest()}
+        leaves = list(self.leaves)
+        if self._leaf_fill or not leaves:
+            leaves.append(self._leaf.hexdigest())
+        return {'digest': _root(self.algorithm, leaves), 'leaves': leaves}
+
+    def hexdigest(self):
+        return self.result()['digest']
+
+
+def _root(algorithm, leaves):
+    h = hashlib.new(algorithm)
+    h.update(NODE_PREFIX)
+    for leaf in leaves:
+        h.update(bytes.fromhex(leaf))
+    return h.hexdigest()
+
+
+def _hash_range(path, algorithm, start, length, prefix=LEAF_PREFIX):
+    h = hashlib.new(algorithm)
+    if prefix:
+        h.update(prefix)
+    buf = bytearray(min(READ_SIZE, max(length, 1)))
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            n = f.readinto(view[:min(remaining, len(buf))])
+            if not n:
+                break
+            h.update(view[:n])
+            remaining -= n
+    return h.hexdigest()
+
+
+def hash_file(path, settings, workers=1, size=None):
+    """Hash a file on disk; tree leaves are hashed in parallel"""
+    if size is None:
+        size = os.path.getsize(path)
+    leaf_size = settings.get('leaf_size')
+    algorithm = settings['algorithm']
+
+    if not leaf_size or size <= leaf_size:
+        return {'digest': _hash_range(path, algorithm, 0, size, prefix=None)}
+
+    offsets = range(0, size, leaf_size)
+    if workers > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        # hashlib releases the GIL on large buffers, so threads scale
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            leaves = list(pool.map(lambda start: _hash_range(path, algorithm, start,
+                                                              min(leaf_size, size - start)), offsets))
+    else:
+        leaves = [_hash_range(path, algorithm, start, min(leaf_size, size - start)) for start in offsets]
+    return {'digest': _root(algorithm, leaves), 'leaves': leaves}
+
+
+def hash_stream(f, settings, size):
+    """Hash a file-like object sequentially (e.g. a delta being rebuilt)"""
+    hasher = TreeHasher(settings, size)
+    while True:
+        chunk = f.read(READ_SIZE)
+        if not chunk:
+            break
+        hasher.update(chunk)
+    return hasher.result()
+
+
+def verify_leaves(path, entry, settings, start=0, end=None):
+    """Re-hash only the leaves overlapping [start, end); returns bad leaf indexes"""
+    leaf_size = settings['leaf_size']
+    size = entry['size']
+    end = size if end is None else min(end, size)
+    bad = []
+    first = start // leaf_size
+    last = (max(end, 1) - 1) // leaf_size
+    for index in range(first, last + 1):
+        offset = index * leaf_size
+        if _hash_range(path, settings['algorithm'], offset, min(leaf_size, size - offset)) != entry['leaves'][index]:
+            bad.append(index)
+    return bad
+
+
+def verify_snapshot(snapshot, path_filter=None, byte_range=None, workers=1):
+    """Verify files of a snapshot against its inventory; returns (ok, failed)"""
+    from backup_delta import open_stored, stored_suffix
+
+    with open(os.path.join(snapshot, 'file_inventory.json'), 'r') as f:
+        inventory = json.load(f)
+    settings = inventory_settings(inventory)
+
+    ok, failed = 0, []
+    for entry in inventory.get('files', []):
+        rel = entry['file'].replace('\\', '/').lstrip('/')
+        if path_filter and rel != path_filter and not rel.startswith(path_filter.rstrip('/') + '/'):
+            continue
+        if entry.get('encrypted'):
+            continue  # needs the password, use backup_reader.py
+        path = os.path.join(snapshot, *rel.split('/'))
+        try:
+            suffix = stored_suffix(entry)
+            if suffix or not os.path.exists(path):
+                with open_stored(path + suffix) as stream:
+                    good = hash_stream(stream, settings, entry['size'])['digest'] == entry_digest(entry)
+            elif byte_range and entry.get('leaves'):
+                good = not verify_leaves(path, entry, settings, *byte_range)
+            else:
+                good = hash_file(path, settings, workers, entry['size'])['digest'] == entry_digest(entry)
+        except (OSError, ValueError):
+            good = False
+        if good:
+            ok += 1
+        else:
+            failed.append(rel)
+    return ok, failed
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Verify a snapshot against its inventory")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('verify')
+    p.add_argument('snapshot', help="Backup_YYYYMMDD_HHMMSS folder")
+    p.add_argument('--path', help="Only this file or folder (e.g. Documents/report.docx)")
+    p.add_argument('--range', help="Byte range START-END (tree digests only)")
+    p.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    byte_range = tuple(int(x) for x in args.range.split('-')) if args.range else None
+    ok, failed = verify_snapshot(args.snapshot, args.path, byte_range, args.workers)
+    for rel in failed:
+        print(f"❌ {rel}")
+    print(f"✅ {ok} files verified, {len(failed)} failed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+💽 I/O SCHEDULING
+Orders source reads to avoid seeking and keeps USB writes sequential:
+
+- small files are copied first, in one batch ordered by physical
+  location on disk (FIEMAP on Linux) or by inode number elsewhere
+- large files are streamed afterwards, one at a time, in the same order
+- priority mode (for runs that may be cut short) copies recently
+  modified files first, then small files, then bulk, each by folder
+  weight and only then by location
+- the copy buffer size is tuned per run from a quick probe of the devices
+- fsync is done per batch (syncfs on Linux) instead of per file
+"""
+
+import os
+import time
+import struct
+import platform
+
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP_HEADER = struct.Struct('QQIIII')
+FIEMAP_EXTENT = struct.Struct('QQQ')
+FIEMAP_EXTENT_SIZE = 56
+
+DEFAULT_BUFFER = 1024 * 1024
+PROBE_SIZES = [64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024]
+
+
+def physical_offset(path):
+    """Physical byte offset of the first extent of a file (Linux only), or None"""
+    import fcntl
+
+    buf = bytearray(FIEMAP_HEADER.size + FIEMAP_EXTENT_SIZE)
+    FIEMAP_HEADER.pack_into(buf, 0, 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0)
+    with open(path, 'rb') as f:
+        fcntl.ioctl(f.fileno(), FS_IOC_FIEMAP, buf, True)
+    if FIEMAP_HEADER.unpack_from(buf, 0)[3] == 0:
+        return None  # empty or inline file
+    return FIEMAP_EXTENT.unpack_from(buf, FIEMAP_HEADER.size)[1]
+
+
+def is_rotational(path):
+    """True/False for spinning disks on Linux, None when unknown"""
+    if platform.system() != "Linux":
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    # Partitions keep the queue settings on the parent device
+    base = f"/sys/dev/block/{os.major(st.st_dev)}:{os.minor(st.st_dev)}"
+    for candidate in (base + "/queue/rotational", base + "/../queue/rotational"):
+        try:
+            with open(candidate) as f:
+                return f.read().strip() == "1"
+        except OSError:
+            continue
+    return None
+
+
+def _seek_distance(offsets):
+    """Sum of head movements when reading files in the given order"""
+    total = 0
+    previous = None
+    for offset in offsets:
+        if offset is None:
+            continue
+        if previous is not None:
+            total += abs(offset - previous)
+        previous = offset
+    return total
+
+
+class IOScheduler:
+    """Orders copy jobs and keeps per-phase measurements for the report"""
+
+    def __init__(self, settings=None, priority=None):
+        settings = settings or {}
+        priority = priority or {}
+        self.enabled = settings.get('schedule', True)
+        self.large_file = settings.get('large_file_mb', 8) * 1024 * 1024
+        self.use_extents = settings.get('use_extents', True) and platform.system() == "Linux"
+        self.priority = priority.get('enabled', False)
+        self.recent = priority.get('recent_days', 7) * 86400
+        self.weights = priority.get('weights', {})
+        self.report = {}
+        self._extents_ok = {}  # st_dev -> FIEMAP works
+
+    def _location(self, entry):
+        st = entry.stat
+        if self.use_extents and self._extents_ok.get(st.st_dev, True):
+            try:
+                offset = physical_offset(entry.path)
+                self._extents_ok[st.st_dev] = True
+                return 'extent', offset if offset is not None else 0
+            except (OSError, ImportError):
+                self._extents_ok[st.st_dev] = False
+        return 'inode', st.st_ino
+
+    def plan(self, jobs):
+        """Split (entry, dst_file) jobs into ordered (phase, jobs) batches"""
+        if not self.enabled and not self.priority:
+            self.report['strategy'] = 'walk order'
+            return [('all', list(jobs))]
+
+        keyed = []
+        kinds = set()
+        for job in jobs:
+            kind, location = self._location(job[0])
+            kinds.add(kind)
+            keyed.append((job[0].stat.st_dev, location, job))
+
+        small = [k for k in keyed if k[2][0].stat.st_size < self.large_file]
+        large = [k for k in keyed if k[2][0].stat.st_size >= self.large_file]
+        small.sort(key=lambda k: (k[0], k[1]))
+        large.sort(key=lambda k: (k[0], k[1]))
+
+        self.report['strategy'] = 'physical extent' if kinds == {'extent'} else (
+            'inode' if kinds == {'inode'} else 'extent+inode')
+        if keyed:
+            self.report['source_rotational'] = is_rotational(keyed[0][2][0].path)
+        self.report['small_files'] = len(small)
+        self.report['large_files'] = len(large)
+
+        if 'extent' in kinds:
+            walk = _seek_distance([k[1] for k in keyed])
+            scheduled = _seek_distance([k[1] for k in small] + [k[1] for k in large])
+            self.report['seek_distance_gb'] = {
+                'walk_order': round(walk / 1024 ** 3, 3),
+                'scheduled': round(scheduled / 1024 ** 3, 3),
+            }
+
+        if self.priority:
+            return self._priority_plan(small, large)
+        return [('small', [k[2] for k in small]), ('large', [k[2] for k in large])]
+
+    def weight(self, rel):
+        """Folder weight of a snapshot-relative path ("Documents/a.txt" -> weights["Documents"])"""
+        return self.weights.get(rel.split('/', 1)[0], 1)
+
+    def _priority_plan(self, small, large):
+        # Recent before old, small before bulk; heavier folders first within each
+        # phase, disk location only breaks ties
+        cutoff = time.time() - self.recent
+        phases = []
+        for name, keyed, recent in (('recent', small, True), ('small', small, False),
+                                    ('recent_large', large, True), ('large', large, False)):
+            chosen = [k for k in keyed if (k[2][0].stat.st_mtime >= cutoff) == recent]
+            if recent:
+                # Newest first: the last edits are the ones no other backup has yet
+                chosen.sort(key=lambda k: (-self.weight(k[2][1]), -k[2][0].stat.st_mtime))
+            else:
+                chosen.sort(key=lambda k: -self.weight(k[2][1]))   # stable: keeps location order
+            phases.append((name, [k[2] for k in chosen]))
+        self.report['strategy'] = f"priority ({self.report['strategy']})"
+        self.report['recent_files'] = len(phases[0][1]) + len(phases[2][1])
+        return phases
+
+    def record_phase(self, phase, files, size, seconds):
+        phases = self.report.setdefault('phases', {})
+        phases[phase] = {
+            'files': files,
+            'bytes': size,
+            'seconds': round(seconds, 2),
+            'mb_per_s': round(size / (1024 * 1024) / seconds, 1) if seconds > 0 else None,
+        }
+
+
+def _probe_write(directory, size, total):
+    path = os.path.join(directory, '.io_probe.tmp')
+    block = os.urandom(size)
+    start = time.perf_counter()
+    try:
+        with open(path, 'wb', buffering=0) as f:
+            for _ in range(max(total // size, 1)):
+                write_all(f, memoryview(block))
+            os.fsync(f.fileno())
+        return time.perf_counter() - start
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _probe_read(path, size, offset, total):
+    with open(path, 'rb', buffering=0) as f:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), offset, total, os.POSIX_FADV_DONTNEED)
+        f.seek(offset)
+        buf = bytearray(size)
+        start = time.perf_counter()
+        done = 0
+        while done < total:
+            n = f.readinto(buf)
+            if not n:
+                break
+            done += n
+        return time.perf_counter() - start
+
+
+def probe_buffer_size(target_dir, sample_file=None, probe_mb=4):
+    """Pick the copy buffer size from a quick write (and read) probe"""
+    total = probe_mb * 1024 * 1024
+    results = {'write': {}, 'read': {}}
+
+    for size in PROBE_SIZES:
+        seconds = _probe_write(target_dir, size, total)
+        results['write'][size] = round(total / (1024 * 1024) / seconds, 1) if seconds else 0
+
+    # Read probe uses a different region of a large source file per size
+    if sample_file and os.path.getsize(sample_file) >= total * len(PROBE_SIZES):
+        for i, size in enumerate(PROBE_SIZES):
+            seconds = _probe_read(sample_file, size, i * total, total)
+            results['read'][size] = round(total / (1024 * 1024) / seconds, 1) if seconds else 0
+
+    def best(speeds):
+        # Smallest buffer within 5% of the fastest
+        if not speeds:
+            return None
+        top = max(speeds.values())
+        return min(size for size, speed in speeds.items() if speed >= top * 0.95)
+
+    chosen = max(filter(None, [best(results['write']), best(results['read'])]), default=DEFAULT_BUFFER)
+    return chosen, results
+
+
+class FsyncBatcher:
+    """Flushes written files in batches instead of after every file"""
+
+    def __init__(self, batch_bytes=256 * 1024 * 1024, batch_files=1000):
+        self.batch_bytes = batch_bytes
+        self.batch_files = batch_files
+        self.pending = []
+        self.pending_bytes = 0
+        self.batches = 0
+        self._syncfs = self._load_syncfs()
+
+    @staticmethod
+    def _load_syncfs():
+        if platform.system() != "Linux":
+            return None
+        try:
+            import ctypes
+            import ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+            return libc.syncfs
+        except (OSError, AttributeError):
+            return None
+
+    def add(self, path, size):
+        self.pending.append(path)
+        self.pending_bytes += size
+        if self.pending_bytes >= self.batch_bytes or len(self.pending) >= self.batch_files:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        if self._syncfs is not None:
+            # One call flushes the whole target filesystem
+            fd = os.open(os.path.dirname(self.pending[-1]), os.O_RDONLY)
+            try:
+                self._syncfs(fd)
+            finally:
+                os.close(fd)
+        else:
+            for path in self.pending:
+                try:
+                    with open(path, 'r+b') as f:
+                        os.fsync(f.fileno())
+                except OSError:
+                    pass
+        self.batches += 1
+        self.pending = []
+        self.pending_bytes = 0
+
+
+def write_all(f, view):
+    """Write a whole buffer to an unbuffered file (raw writes may be short)"""
+    while len(view):
+        written = f.write(view)
+        view = view[written:]
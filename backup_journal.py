@@ -0,0 +1,526 @@
+#!/usr/bin/env python3
+"""
+📓 CHANGE-TRACKING JOURNAL
+Optional background watcher that records changed paths under the
+configured source folders, so a USB-triggered backup knows what changed
+without scanning the whole user profile.
+
+Run it in the background (Task Scheduler, systemd user unit, autostart):
+
+    python backup_journal.py            # inotify on Linux, polling elsewhere
+    python backup_journal.py --poll     # force polling
+
+Journal format (journal.log, one line per change):
+
+    #PCBJ1 <epoch> <rules-fingerprint>
+    <seq>\t<op>\t<json path>
+
+    op: M = created/modified, D = deleted, R = rescan directory,
+        S = sync marker written when a backup asks (path = token)
+
+A new epoch is started whenever the watcher (re)starts or its event
+queue overflows. A backup only trusts the journal if the previous
+snapshot recorded the same epoch and the watcher answers a sync request;
+otherwise it falls back to a full scan.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import errno
+import struct
+import hashlib
+import platform
+
+from backup_config import load_config, get_user_profile
+from backup_rules import BackupRules, SIZE_RULE, AGE_RULE
+from backup_scanner import scan_tree, SCAN_LIMITS
+
+JOURNAL_MAGIC = "#PCBJ1"
+JOURNAL_FILE = "journal.log"
+SYNC_FILE = "journal.sync"
+
+OP_MODIFIED = "M"
+OP_DELETED = "D"
+OP_RESCAN = "R"
+OP_SYNC = "S"
+
+
+def journal_dir(config):
+    """Directory holding the journal files"""
+    path = config.get('journal', {}).get('path')
+    return path or os.path.join(os.path.expanduser('~'), '.pc_backup', 'journal')
+
+
+def rules_fingerprint(config):
+    """Fingerprint of folders + rules; a change invalidates the journal"""
+    rules = config.get('rules', {})
+    selection = [config.get('folders'), rules.get('patterns')]
+    scan = config.get('scan', {})
+    limits = {key: scan[key] for key in SCAN_LIMITS if scan.get(key)}
+    limits.update({key: rules[key] for key in (SIZE_RULE, AGE_RULE) if rules.get(key)})
+    if limits:
+        selection.append(limits)    # only when set, so older fingerprints stay valid
+    data = json.dumps(selection, sort_keys=True)
+    return hashlib.sha1(data.encode()).hexdigest()[:12]
+
+
+class JournalChanges:
+    """Dirty set read from the journal"""
+
+    def __init__(self, epoch, seq):
+        self.epoch = epoch
+        self.seq = seq
+        self.modified = set()
+        self.deleted = set()
+        self.rescan = set()
+
+    def __len__(self):
+        return len(self.modified) + len(self.deleted) + len(self.rescan)
+
+    def touches(self, rel_path):
+        """True if a path (or one of its folders) was deleted or needs a rescan"""
+        if rel_path in self.modified or rel_path in self.deleted:
+            return True
+        parts = rel_path.split('/')
+        for i in range(1, len(parts)):
+            parent = '/'.join(parts[:i])
+            if parent in self.deleted or parent in self.rescan:
+                return True
+        return False
+
+
+class ChangeJournal:
+    """Append-only on-disk journal of changed paths"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, JOURNAL_FILE)
+        self.sync_path = os.path.join(directory, SYNC_FILE)
+        self.epoch = None
+        self.seq = 0
+        self.entries = 0
+
+    # ---- writer side (watcher) -------------------------------------
+
+    def start_epoch(self, fingerprint):
+        """Start a new, empty journal (previous entries become unusable)"""
+        os.makedirs(self.directory, exist_ok=True)
+        self.epoch = uuid.uuid4().hex[:16]
+        self.fingerprint = fingerprint
+        self.seq = 0
+        self.entries = 0
+        self._rewrite([])
+
+    def _rewrite(self, lines):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8', errors='surrogateescape') as f:
+            f.write(f"{JOURNAL_MAGIC} {self.epoch} {self.fingerprint}\n")
+            f.writelines(lines)
+        os.replace(tmp, self.path)
+
+    def append(self, changes):
+        """Append (op, rel_path) pairs"""
+        if not changes:
+            return
+        lines = []
+        for op, rel in changes:
+            self.seq += 1
+            lines.append(f"{self.seq}\t{op}\t{json.dumps(rel)}\n")
+        with open(self.path, 'a', encoding='utf-8', errors='surrogateescape') as f:
+            f.writelines(lines)
+            f.flush()
+        self.entries += len(lines)
+
+    def compact(self, max_entries):
+        """Keep only the newest entry per path; new epoch if still too big"""
+        latest = {}
+        for seq, op, rel in self._iter_lines():
+            if op != OP_SYNC:
+                latest[rel] = (seq, op)
+
+        if len(latest) > max_entries:
+            print(f"⚠️ Journal overflow ({len(latest)} paths) - starting new epoch")
+            self.start_epoch(self.fingerprint)
+            return
+
+        ordered = sorted((seq, op, rel) for rel, (seq, op) in latest.items())
+        self._rewrite([f"{seq}\t{op}\t{json.dumps(rel)}\n" for seq, op, rel in ordered])
+        self.entries = len(ordered)
+
+    def pending_sync(self):
+        """Token of a pending sync request, if any"""
+        try:
+            with open(self.sync_path, 'r', encoding='utf-8') as f:
+                token = f.read().strip()
+        except OSError:
+            return None
+        return token or None
+
+    def answer_sync(self, token):
+        self.append([(OP_SYNC, token)])
+        try:
+            os.remove(self.sync_path)
+        except OSError:
+            pass
+
+    # ---- reader side (backup) --------------------------------------
+
+    def read_header(self):
+        """Return (epoch, fingerprint) or None"""
+        try:
+            with open(self.path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+                parts = f.readline().split()
+        except OSError:
+            return None
+        if len(parts) != 3 or parts[0] != JOURNAL_MAGIC:
+            return None
+        return parts[1], parts[2]
+
+    def _iter_lines(self):
+        with open(self.path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+            f.readline()
+            for line in f:
+                if not line.endswith('\n'):
+                    break  # partially written line
+                try:
+                    seq, op, rel = line.rstrip('\n').split('\t', 2)
+                    yield int(seq), op, json.loads(rel)
+                except ValueError:
+                    continue
+
+    def request_sync(self, timeout):
+        """Ask the watcher to flush; return (epoch, seq) of the sync marker or None"""
+        header = self.read_header()
+        if header is None:
+            return None
+
+        token = uuid.uuid4().hex
+        tmp = self.sync_path + '.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(token)
+            os.replace(tmp, self.sync_path)
+        except OSError:
+            return None
+
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            header = self.read_header()
+            if header is not None:
+                for seq, op, rel in self._iter_lines():
+                    if op == OP_SYNC and rel == token:
+                        return header[0], seq
+            time.sleep(0.2)
+        return None
+
+    def changes_since(self, epoch, since_seq, until_seq):
+        """Collect changes in (since_seq, until_seq], None if the epoch moved on"""
+        header = self.read_header()
+        if header is None or header[0] != epoch:
+            return None
+
+        changes = JournalChanges(epoch, until_seq)
+        state = {}
+        for seq, op, rel in self._iter_lines():
+            if seq > until_seq:
+                break
+            if seq > since_seq and op != OP_SYNC:
+                state[rel] = op
+
+        for rel, op in state.items():
+            if op == OP_MODIFIED:
+                changes.modified.add(rel)
+            elif op == OP_DELETED:
+                changes.deleted.add(rel)
+            else:
+                changes.rescan.add(rel)
+        return changes
+
+
+def open_changes(config, previous):
+    """
+    Dirty set since a previous snapshot's journal position.
+
+    Returns (position, changes, reason): position is the current
+    {'epoch', 'seq', 'rules'} to record in the new snapshot (None if the
+    watcher is not running); changes is None when a full scan is needed.
+    """
+    settings = config.get('journal', {})
+    if not settings.get('enabled', True):
+        return None, None, "journal disabled"
+
+    journal = ChangeJournal(journal_dir(config))
+    header = journal.read_header()
+    if header is None:
+        return None, None, "no journal (watcher not installed)"
+
+    synced = journal.request_sync(settings.get('sync_timeout', 10))
+    if synced is None:
+        return None, None, "watcher not responding"
+
+    epoch, seq = synced
+    fingerprint = rules_fingerprint(config)
+    position = {'epoch': epoch, 'seq': seq, 'rules': fingerprint}
+
+    if header[1] != fingerprint:
+        return None, None, "folders/rules changed since the watcher started"
+    if not previous:
+        return position, None, "no previous snapshot"
+    if previous.get('epoch') != epoch or previous.get('rules') != fingerprint:
+        return position, None, "journal restarted or overflowed since last backup"
+
+    changes = journal.changes_since(epoch, previous.get('seq', 0), seq)
+    if changes is None:
+        return None, None, "journal restarted during sync"
+    return position, changes, None
+
+
+class PollingWatcher:
+    """Fallback watcher: periodic scan comparing size and mtime"""
+
+    def __init__(self, journal, user_profile, folders, rules, interval, max_entries, scan_settings=None):
+        self.journal = journal
+        self.user_profile = user_profile
+        self.folders = folders
+        self.rules = rules
+        self.interval = interval
+        self.max_entries = max_entries
+        self.scan_settings = scan_settings
+        self.state = self._scan()
+
+    def _scan(self):
+        state = {}
+        for name in self.folders:
+            src = os.path.join(self.user_profile, name)
+            if os.path.isdir(src):
+                for entry in scan_tree(src, name, self.rules, settings=self.scan_settings):
+                    state[entry.rel] = (entry.stat.st_size, entry.stat.st_mtime_ns)
+        return state
+
+    def poll(self):
+        new_state = self._scan()
+        changes = [(OP_MODIFIED, rel) for rel, sig in new_state.items() if self.state.get(rel) != sig]
+        changes += [(OP_DELETED, rel) for rel in self.state if rel not in new_state]
+        self.state = new_state
+        self.journal.append(sorted(changes, key=lambda c: c[1]))
+        if self.journal.entries > self.max_entries:
+            self.journal.compact(self.max_entries)
+
+    def run(self, stop_after=None):
+        last_poll = time.time()
+        started = time.time()
+        while stop_after is None or time.time() - started < stop_after:
+            token = self.journal.pending_sync()
+            if token:
+                self.poll()
+                self.journal.answer_sync(token)
+                last_poll = time.time()
+            elif time.time() - last_poll >= self.interval:
+                self.poll()
+                last_poll = time.time()
+            time.sleep(0.5)
+
+
+class InotifyWatcher:
+    """Linux watcher using inotify through ctypes (no extra dependencies)"""
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+
+    WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+                  IN_CREATE | IN_DELETE | IN_ONLYDIR)
+    ROOT_MASK = IN_CREATE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE | IN_ONLYDIR
+
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self, journal, user_profile, folders, rules, max_entries):
+        import ctypes
+        import ctypes.util
+
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        self.ctypes = ctypes
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.journal = journal
+        self.user_profile = user_profile
+        self.folders = set(folders)
+        self.rules = rules
+        self.max_entries = max_entries
+        self.watches = {}     # wd -> rel dir ("" = user profile)
+        self.pending = {}     # rel -> op, flushed to the journal
+
+        self._add_watch(user_profile, "", self.ROOT_MASK)
+        for name in folders:
+            path = os.path.join(user_profile, name)
+            if os.path.isdir(path):
+                self._watch_tree(path, name)
+
+    def _add_watch(self, path, rel, mask=None):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask or self.WATCH_MASK)
+        if wd < 0:
+            err = self.ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                return
+            raise OSError(err, f"inotify_add_watch failed for {path}")
+        self.watches[wd] = rel
+
+    def _watch_tree(self, path, rel):
+        self._add_watch(path, rel)
+        stack = [(path, rel)]
+        while stack:
+            current, current_rel = stack.pop()
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            child_rel = f"{current_rel}/{entry.name}"
+                            if self.rules and self.rules.excludes_dir(child_rel):
+                                continue
+                            self._add_watch(entry.path, child_rel)
+                            stack.append((entry.path, child_rel))
+            except OSError:
+                pass
+
+    def _unwatch_tree(self, rel):
+        prefix = rel + '/'
+        for wd, watched in list(self.watches.items()):
+            if watched == rel or watched.startswith(prefix):
+                self.libc.inotify_rm_watch(self.fd, wd)
+                self.watches.pop(wd, None)
+
+    def _handle(self, wd, mask, name):
+        if mask & self.IN_Q_OVERFLOW:
+            raise OverflowError("inotify queue overflow")
+        if mask & self.IN_IGNORED:
+            self.watches.pop(wd, None)
+            return
+
+        parent = self.watches.get(wd)
+        if parent is None or not name:
+            return
+        if parent == "" and name not in self.folders:
+            return  # only configured folders below the profile root
+
+        rel = f"{parent}/{name}" if parent else name
+        is_dir = bool(mask & self.IN_ISDIR)
+
+        if is_dir and self.rules and self.rules.excludes_dir(rel):
+            return
+        if not is_dir and self.rules and self.rules.excludes_file(rel):
+            return
+
+        if is_dir:
+            if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                self._watch_tree(os.path.join(self.user_profile, *rel.split('/')), rel)
+                self.pending[rel] = OP_RESCAN
+            elif mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                self._unwatch_tree(rel)
+                self.pending[rel] = OP_DELETED
+        elif mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+            self.pending[rel] = OP_DELETED
+        else:
+            self.pending[rel] = OP_MODIFIED
+
+    def _drain(self):
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = self.EVENT.unpack_from(data, offset)
+                offset += self.EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                self._handle(wd, mask, name)
+
+    def flush(self):
+        self.journal.append([(op, rel) for rel, op in sorted(self.pending.items())])
+        self.pending.clear()
+        if self.journal.entries > self.max_entries:
+            self.journal.compact(self.max_entries)
+
+    def run(self, stop_after=None):
+        import select
+
+        started = time.time()
+        while stop_after is None or time.time() - started < stop_after:
+            select.select([self.fd], [], [], 0.5)
+            try:
+                self._drain()
+            except OverflowError:
+                print("⚠️ inotify queue overflow - starting new journal epoch")
+                self.pending.clear()
+                self.journal.start_epoch(self.journal.fingerprint)
+
+            self.flush()
+            token = self.journal.pending_sync()
+            if token:
+                self._drain()
+                self.flush()
+                self.journal.answer_sync(token)
+
+
+def run_watcher(config, force_poll=False, stop_after=None):
+    """Start the watcher (blocks)"""
+    settings = config.get('journal', {})
+    journal = ChangeJournal(journal_dir(config))
+    journal.start_epoch(rules_fingerprint(config))
+
+    user_profile = get_user_profile()
+    folders = config.get('folders', [])
+    rules = BackupRules.from_config(config)
+
+    watcher = None
+    if platform.system() == "Linux" and not force_poll:
+        try:
+            watcher = InotifyWatcher(journal, user_profile, folders, rules,
+                                     settings.get('max_entries', 200000))
+            print(f"👀 Watching {len(watcher.watches)} folders with inotify")
+        except (OSError, AttributeError) as e:
+            print(f"⚠️ inotify unavailable ({e}) - using polling")
+        else:
+            print(f"📓 Journal: {journal.path} (epoch {journal.epoch})")
+            try:
+                watcher.run(stop_after)
+                return
+            except OSError as e:
+                # e.g. inotify watch limit reached for a new folder
+                print(f"⚠️ inotify failed ({e}) - switching to polling")
+                journal.start_epoch(journal.fingerprint)
+
+    watcher = PollingWatcher(journal, user_profile, folders, rules,
+                             settings.get('poll_interval', 60), settings.get('max_entries', 200000),
+                             config.get('scan'))
+    print(f"👀 Polling {len(watcher.state)} files every {watcher.interval}s")
+    print(f"📓 Journal: {journal.path} (epoch {journal.epoch})")
+    watcher.run(stop_after)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="PC Backup change-tracking watcher")
+    parser.add_argument('--config', help="Path to backup_config.json")
+    parser.add_argument('--poll', action='store_true', help="Force polling instead of inotify")
+    args = parser.parse_args()
+
+    try:
+        run_watcher(load_config(args.config), force_poll=args.poll)
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+🌳 SNAPSHOT MERKLE TREE
+Every snapshot gets merkle_tree.json next to its inventory: one digest
+per folder and a root digest for the whole snapshot, built from the
+file digests of the inventory with the repository's hash algorithm:
+
+    own(folder)    = H(for each file, by name:      len:name size digest\\n)
+    digest(folder) = H("D" own(folder) for each subfolder, by name: len:name digest\\n)
+    root           = digest("")
+
+Only names, sizes and content digests go in (not how a file is stored,
+not its metadata), so the same snapshot on two sticks has the same root.
+
+- compare: two snapshots (or two sticks) are compared from the root
+  down, only into folders whose digests differ
+- verify: a folder is re-hashed from the drive and checked against its
+  stored digest, without reading the inventory
+
+    python backup_merkle.py show E:/PC_Backup/Backup_X Pictures
+    python backup_merkle.py compare E:/PC_Backup/Backup_X F:/PC_Backup/Backup_X
+    python backup_merkle.py verify E:/PC_Backup/Backup_X Pictures/2025
+"""
+
+import os
+import sys
+import json
+import hashlib
+
+from backup_hashing import inventory_settings, entry_digest, hash_file, hash_stream
+from backup_delta import open_stored, DELTA_SUFFIX
+from backup_sparse import SPARSE_SUFFIX
+from backup_crypto import make_cipher, open_encrypted, ENC_SUFFIX
+
+TREE_FILE = 'merkle_tree.json'
+INVENTORY_FILE = 'file_inventory.json'
+
+# Written into the snapshot root after the inventory, not part of the tree
+SNAPSHOT_FILES = {INVENTORY_FILE, TREE_FILE, 'backup_report.json', 'README.txt'}
+
+
+def _normalize(path):
+    return '/'.join(part for part in (path or '').replace('\\', '/').split('/') if part and part != '.')
+
+
+def _record(name, *fields):
+    name = name.encode('utf-8', 'surrogateescape')
+    return b'%d:%s %s\n' % (len(name), name, ' '.join(str(f) for f in fields).encode('ascii'))
+
+
+class TreeBuilder:
+    """
+    Folder digests from (path, size, digest) of every file.
+
+    Files of one folder must be added in name order (inventories are
+    sorted by path, which keeps that order); folders may come in any
+    order. Memory grows with the number of folders, not files.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.algorithm = settings['algorithm']
+        self._own = {}      # folder -> [hasher, direct files, direct bytes]
+        self._children = {'': set()}
+
+    def add(self, rel, size, digest):
+        folder, _, name = rel.rpartition('/')
+        own = self._own.get(folder)
+        if own is None:
+            own = self._own[folder] = [hashlib.new(self.algorithm), 0, 0]
+            self._register(folder)
+        own[0].update(_record(name, size, digest))
+        own[1] += 1
+        own[2] += size
+
+    def _register(self, folder):
+        while folder:
+            parent, _, name = folder.rpartition('/')
+            children = self._children.setdefault(parent, set())
+            if name in children:
+                return
+            children.add(name)
+            self._children.setdefault(folder, set())
+            folder = parent
+
+    def finish(self):
+        """{'hash', 'root', 'dirs': {folder: {'digest', 'own', 'files', 'size'}}}"""
+        empty = hashlib.new(self.algorithm).hexdigest()
+        dirs = {}
+        # Deepest folders first, so subfolder digests are ready for their parent
+        for folder in sorted(self._children, key=lambda f: f.count('/') + bool(f), reverse=True):
+            own = self._own.get(folder)
+            node = hashlib.new(self.algorithm)
+            node.update(b'D' + (own[0].hexdigest() if own else empty).encode('ascii'))
+            files, size = (own[1], own[2]) if own else (0, 0)
+            for name in sorted(self._children[folder]):
+                child = dirs[f"{folder}/{name}" if folder else name]
+                node.update(_record(name, child['digest']))
+                files += child['files']
+                size += child['size']
+            dirs[folder] = {'digest': node.hexdigest(), 'own': own[0].hexdigest() if own else empty,
+                            'files': files, 'size': size}
+        return {'hash': self.settings, 'root': dirs['']['digest'], 'dirs': dict(sorted(dirs.items()))}
+
+
+def build_tree(entries, settings):
+    """Tree of inventory entries (sorted by path)"""
+    builder = TreeBuilder(settings)
+    for entry in entries:
+        builder.add(_normalize(entry['file']), entry.get('size', 0), entry_digest(entry))
+    return builder.finish()
+
+
+def write_tree(snapshot, entries, settings):
+    """Build and save merkle_tree.json for a snapshot; returns the root digest"""
+    tree = build_tree(entries, settings)
+    with open(os.path.join(snapshot, TREE_FILE), 'w') as f:
+        json.dump(tree, f, indent=1)
+    return tree['root']
+
+
+def load_tree(snapshot):
+    """Stored tree of a snapshot; built from the inventory for older snapshots"""
+    path = os.path.join(snapshot, TREE_FILE)
+    if os.path.isfile(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    from backup_diff import sorted_entries
+
+    stream, entries = sorted_entries(snapshot)
+    entries = list(entries)     # reads the header too
+    return build_tree(entries, inventory_settings(stream.header))
+
+
+def _subfolders(dirs):
+    """folder -> names of its subfolders"""
+    children = {}
+    for name in dirs:
+        if name:
+            parent, _, child = name.rpartition('/')
+            children.setdefault(parent, set()).add(child)
+    return children
+
+
+def compare_trees(old, new, folder=''):
+    """
+    Differences between two trees, walking only into folders that differ.
+
+    Returns (changes, folders compared); changes are (kind, folder) with
+    kind 'added', 'removed' (whole folders) or 'files' (files directly in
+    the folder differ). No changes: the trees are identical.
+    """
+    if old['hash']['algorithm'] != new['hash']['algorithm'] or \
+            old['hash'].get('leaf_size') != new['hash'].get('leaf_size'):
+        raise ValueError("Different hash settings - compare the inventories with backup_diff.py")
+    folder = _normalize(folder)
+    old_dirs, new_dirs = old['dirs'], new['dirs']
+    if folder not in old_dirs and folder not in new_dirs:
+        raise FileNotFoundError(f"Not in either snapshot: {folder}")
+
+    old_children, new_children = _subfolders(old_dirs), _subfolders(new_dirs)
+    changes = []
+    compared = 0
+    stack = [folder]
+    while stack:
+        current = stack.pop()
+        a, b = old_dirs.get(current), new_dirs.get(current)
+        compared += 1
+        if a is None or b is None:
+            changes.append(('added' if a is None else 'removed', current))
+            continue
+        if a['digest'] == b['digest']:
+            continue
+        if a['own'] != b['own']:
+            changes.append(('files', current))
+        for name in sorted(old_children.get(current, set()) | new_children.get(current, set()), reverse=True):
+            stack.append(f"{current}/{name}" if current else name)
+    return changes, compared
+
+
+def _stored_files(snapshot, folder):
+    """(logical path, stored path) of every file below a snapshot folder"""
+    top = os.path.join(snapshot, *folder.split('/')) if folder else snapshot
+    if not os.path.isdir(top):
+        raise FileNotFoundError(f"Not in snapshot: {folder}")
+    for root, dirs, files in os.walk(top):
+        dirs.sort()
+        rel_root = _normalize(os.path.relpath(root, snapshot).replace(os.sep, '/'))
+        names = []
+        for file in files:
+            if not rel_root and file in SNAPSHOT_FILES:
+                continue
+            name = file
+            for suffix in (DELTA_SUFFIX, SPARSE_SUFFIX, ENC_SUFFIX):
+                if file.endswith(suffix):
+                    name = file[:-len(suffix)]
+                    break
+            names.append((name, os.path.join(root, file)))
+        for name, path in sorted(names):
+            yield (f"{rel_root}/{name}" if rel_root else name), path
+
+
+def verify_tree(snapshot, folder='', password=None, workers=1):
+    """
+    Re-hash a folder of a snapshot and check it against merkle_tree.json
+    (against the inventory for snapshots older than the tree).
+
+    Returns (files hashed, bad folders); bad folders are the deepest ones
+    whose digest does not match (empty list: the folder is intact).
+    """
+    folder = _normalize(folder)
+    stored = load_tree(snapshot)
+    if folder not in stored['dirs']:
+        raise FileNotFoundError(f"Not in merkle tree: {folder}")
+    settings = stored['hash']
+
+    cipher = None
+    builder = TreeBuilder(settings)
+    count = 0
+    for rel, path in _stored_files(snapshot, folder):
+        if path.endswith(ENC_SUFFIX):
+            if cipher is None:
+                if password is None:
+                    raise ValueError(f"{rel} is encrypted - the password is needed to verify it")
+                cipher = make_cipher(password)
+            stream = open_encrypted(path, cipher)
+        elif path.endswith((DELTA_SUFFIX, SPARSE_SUFFIX)):
+            stream = open_stored(path)
+        else:
+            stream = None
+
+        if stream is None:
+            digest = hash_file(path, settings, workers)['digest']
+            size = os.path.getsize(path)
+        else:
+            with stream:
+                size = stream.size
+                digest = hash_stream(stream, settings, size)['digest']
+        builder.add(rel, size, digest)
+        count += 1
+
+    actual = builder.finish()['dirs']
+    bad = []
+    for name, node in stored['dirs'].items():
+        if folder and name != folder and not name.startswith(folder + '/'):
+            continue
+        mine = actual.get(name)
+        if mine is None or mine['own'] != node['own']:
+            bad.append(name)
+    # Folders on the drive that the tree does not know
+    bad.extend(name for name in actual if name not in stored['dirs'])
+    if not bad and actual.get(folder, {}).get('digest') != stored['dirs'][folder]['digest']:
+        bad.append(folder)
+    return count, sorted(set(bad))
+
+
+def _snapshot(path):
+    if os.path.isfile(os.path.join(path, INVENTORY_FILE)):
+        return path
+    from backup_reader import latest_snapshot
+    return latest_snapshot(path)  # PC_Backup folder given
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Snapshot folder digests (Merkle tree)")
+    parser.add_argument('--password', help="Password for encrypted files (verify)")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('show', help="Root or folder digest")
+    p.add_argument('snapshot', help="Backup_YYYYMMDD_HHMMSS folder (or PC_Backup for the latest)")
+    p.add_argument('path', nargs='?', default='')
+    p = sub.add_parser('compare', help="Compare two snapshots or the same snapshot on two sticks")
+    p.add_argument('old')
+    p.add_argument('new')
+    p.add_argument('path', nargs='?', default='')
+    p = sub.add_parser('verify', help="Re-hash a folder and check it against the tree")
+    p.add_argument('snapshot')
+    p.add_argument('path', nargs='?', default='')
+    p.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'show':
+            tree = load_tree(_snapshot(args.snapshot))
+            node = tree['dirs'].get(_normalize(args.path))
+            if node is None:
+                raise FileNotFoundError(f"Not in snapshot: {args.path}")
+            print(json.dumps(dict(node, algorithm=tree['hash']['algorithm']), indent=2))
+        elif args.command == 'compare':
+            changes, compared = compare_trees(load_tree(_snapshot(args.old)), load_tree(_snapshot(args.new)),
+                                              args.path)
+            marks = {'added': '+', 'removed': '-', 'files': 'M'}
+            for kind, folder in changes:
+                print(f"{marks[kind]} {folder or '/'}")
+            print(f"{'✅ Identical' if not changes else f'🔍 {len(changes)} folders differ'} "
+                  f"({compared} folders compared)")
+            sys.exit(1 if changes else 0)
+        else:
+            count, bad = verify_tree(_snapshot(args.snapshot), args.path, args.password, args.workers)
+            for folder in bad:
+                print(f"❌ {folder or '/'} (details: backup_hashing.py verify --path {folder or '.'})")
+            print(f"{'❌' if bad else '✅'} {count} files hashed, {len(bad)} folders do not match")
+            sys.exit(1 if bad else 0)
+    except (OSError, ValueError, ImportError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(2)
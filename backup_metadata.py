@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+🏷️ FILE METADATA IN THE INVENTORY
+copy2/copystat sets mode, timestamps and xattrs on every copied file -
+several extra system calls and directory updates per file. On FAT32 and
+exFAT sticks most of it is lost anyway (no permissions, no owner, 2 s or
+10 ms timestamps, no xattrs).
+
+In "index" mode the metadata of the source is taken from the scan
+(the stat the scanner already has, plus xattrs where the OS has them),
+stored with the file in file_inventory.json and nothing is set on the
+drive. Restores (backup_reader.py extract, backup_delta.py restore) put
+it back on the restored files.
+
+    "metadata": {"mode": "auto"}    index on drives that cannot keep it, copy elsewhere
+    "metadata": {"mode": "index"}   always
+    "metadata": {"mode": "copy"}    always copystat, like before
+"""
+
+import os
+import stat
+import base64
+import tempfile
+
+MODES = ('auto', 'copy', 'index')
+
+# Precise enough for NTFS (100 ns); exFAT (10 ms) and FAT (2 s) are not
+TIME_PROBE_NS = 1_234_567_891_234_567_891
+TIME_TOLERANCE_NS = 1000
+
+
+def supports_metadata(folder):
+    """True if files in folder keep permissions and fine-grained timestamps"""
+    fd, path = tempfile.mkstemp(prefix='.pcb_meta_', dir=folder)
+    try:
+        os.close(fd)
+        os.utime(path, ns=(TIME_PROBE_NS, TIME_PROBE_NS))
+        if abs(os.stat(path).st_mtime_ns - TIME_PROBE_NS) > TIME_TOLERANCE_NS:
+            return False
+        if os.name == 'posix':
+            # vfat/exfat mounts ignore chmod or refuse it
+            os.chmod(path, 0o604)
+            if stat.S_IMODE(os.stat(path).st_mode) != 0o604:
+                return False
+        return True
+    except OSError:
+        return False
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def metadata_mode(settings, folder):
+    """'copy' or 'index' for a snapshot folder, resolving 'auto' with a probe"""
+    mode = (settings or {}).get('mode', 'auto')
+    if mode not in MODES:
+        raise ValueError(f"Unknown metadata mode: {mode}")
+    if mode == 'auto':
+        return 'copy' if supports_metadata(folder) else 'index'
+    return mode
+
+
+def capture(path, st, xattrs=True):
+    """Inventory metadata of a source file from its stat (and its xattrs)"""
+    meta = {
+        'mode': stat.S_IMODE(st.st_mode),
+        'mtime_ns': st.st_mtime_ns,
+        'atime_ns': st.st_atime_ns,
+    }
+    if os.name == 'posix':
+        meta['uid'] = st.st_uid
+        meta['gid'] = st.st_gid
+    attributes = getattr(st, 'st_file_attributes', None)
+    if attributes:
+        meta['attributes'] = attributes   # Windows: read-only, hidden, ...
+    if xattrs and hasattr(os, 'listxattr'):
+        try:
+            names = os.listxattr(path)
+            if names:
+                meta['xattrs'] = {name: base64.b64encode(os.getxattr(path, name)).decode('ascii')
+                                  for name in names}
+        except OSError:
+            pass  # file system without xattrs, or not allowed to read them
+    return meta
+
+
+def apply(path, meta):
+    """Put inventory metadata back on a restored file; returns the fields that could not be set"""
+    failed = []
+    for name, value in meta.get('xattrs', {}).items():
+        try:
+            os.setxattr(path, name, base64.b64decode(value))
+        except (OSError, AttributeError):
+            failed.append('xattrs')
+            break
+    if 'uid' in meta and hasattr(os, 'chown'):
+        try:
+            os.chown(path, meta['uid'], meta['gid'])
+        except OSError:
+            failed.append('owner')  # only root may give files away
+    if 'attributes' in meta and os.name == 'nt':
+        import ctypes
+
+        if not ctypes.windll.kernel32.SetFileAttributesW(path, meta['attributes']):
+            failed.append('attributes')
+    if 'mode' in meta:
+        try:
+            os.chmod(path, meta['mode'])
+        except OSError:
+            failed.append('mode')
+    # Last: the other changes would update the times again
+    try:
+        os.utime(path, ns=(meta.get('atime_ns', meta['mtime_ns']), meta['mtime_ns']))
+    except (OSError, KeyError):
+        failed.append('times')
+    return failed
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+🔁 COPY PIPELINE
+Overlapped reading and writing for large files. A reader thread fills
+buffers from a small pool while the calling thread processes and
+writes the ones already filled, so the source disk and the USB drive
+work at the same time and only the slower one sets the pace:
+
+    reader thread:   readinto(buffer) ──┐
+                                        │  at most len(pool) buffers in flight
+    calling thread:  stages → write  ◄──┘  then the buffer goes back to the pool
+
+Buffers are allocated once per run and handed on as memoryviews. Stages
+(objects with a data(view) method returning what to pass on) run on each
+chunk in order before it is written:
+
+    HashStage(hasher)              digest of the data, passes it on unchanged
+    EncryptStage(cipher, count)    compress + encrypt (backup_crypto.py)
+"""
+
+import queue
+import threading
+
+from backup_io import DEFAULT_BUFFER
+
+DEFAULT_BUFFERS = 4
+
+
+class BufferPool:
+    """Fixed set of reusable bytearrays; get() waits until one is free"""
+
+    def __init__(self, count=DEFAULT_BUFFERS, size=DEFAULT_BUFFER):
+        self.count = max(count, 2)  # one being read, one being written
+        self.size = size
+        self._free = queue.Queue()
+        for _ in range(self.count):
+            self._free.put(bytearray(size))
+
+    def get(self):
+        return self._free.get()
+
+    def put(self, buffer):
+        self._free.put(buffer)
+
+
+def run_pipeline(fill, drain, pool):
+    """
+    Overlap fill(buffer) in a reader thread with drain(item) here.
+
+    fill returns an item describing what it read into the buffer, or
+    None at the end; drain gets the items in order. A buffer goes back to
+    the pool once its item is drained. An error on either side stops
+    both and is raised here.
+    """
+    ready = queue.Queue()
+    stop = threading.Event()
+
+    def reader():
+        buffer = None
+        try:
+            while not stop.is_set():
+                buffer = pool.get()
+                if stop.is_set():
+                    pool.put(buffer)
+                    return
+                item = fill(buffer)
+                ready.put((buffer, item, None))
+                buffer = None   # the calling thread hands it back
+                if item is None:
+                    return
+        except BaseException as e:
+            # A failed read must not cost the shared pool a buffer
+            if buffer is not None:
+                pool.put(buffer)
+            ready.put((None, None, e))
+
+    thread = threading.Thread(target=reader, name="pipeline-reader", daemon=True)
+    thread.start()
+    try:
+        while True:
+            buffer, item, error = ready.get()
+            if error is not None:
+                raise error
+            try:
+                if item is None:
+                    break
+                drain(item)
+            finally:
+                pool.put(buffer)
+    finally:
+        stop.set()
+        # Hand back whatever the reader still queued so it is not stuck waiting for a buffer
+        while thread.is_alive() or not ready.empty():
+            try:
+                buffer = ready.get(timeout=0.05)[0]
+            except queue.Empty:
+                continue
+            if buffer is not None:
+                pool.put(buffer)
+        thread.join()
+
+
+class HashStage:
+    """Feeds every chunk (and holes, as zeros) to a hashlib-like object"""
+
+    def __init__(self, hasher):
+        self.hasher = hasher
+        self._zeros = None
+
+    def data(self, view):
+        self.hasher.update(view)
+        return view
+
+    def zeros(self, length):
+        if self._zeros is None:
+            self._zeros = memoryview(bytes(DEFAULT_BUFFER))
+        while length > 0:
+            take = min(length, len(self._zeros))
+            self.hasher.update(self._zeros[:take])
+            length -= take
+
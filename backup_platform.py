@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+🧩 PLATFORM PROVIDERS
+Everything that depends on the operating system (wmic, reg, netsh,
+systeminfo, winreg, browser profile locations, ...) lives behind one
+provider interface:
+
+    provider = get_provider()
+    provider.network()
+    provider.export_registry("HKCU\\\\Software", "user_software.reg")
+
+The provider for the current OS is created on first use and imports
+its modules (winreg, subprocess) only inside the collectors, so the
+rest of the tool imports and runs on any OS.
+"""
+
+import os
+import platform
+
+_provider = None
+
+
+def _run(args, timeout=60):
+    """stdout of a command, or None if it is missing or fails"""
+    import subprocess
+
+    try:
+        result = subprocess.run(args, capture_output=True, text=True, timeout=timeout)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout
+
+
+class SystemProvider:
+    """Collectors that work everywhere; subclasses add OS-specific ones"""
+
+    name = 'generic'
+
+    def username(self):
+        # os.getlogin() fails without a controlling terminal (services, cron)
+        try:
+            return os.getlogin()
+        except OSError:
+            import getpass
+            return getpass.getuser()
+
+    def user_profile(self):
+        return os.path.expanduser('~')
+
+    def disks(self):
+        return None
+
+    def installed_programs(self):
+        return None
+
+    def network(self):
+        return _run(['ifconfig'])
+
+    def system_details(self):
+        """Long system report (systeminfo on Windows)"""
+        return None
+
+    def export_registry(self, key, path):
+        """Export a registry key to a .reg file; False where there is no registry"""
+        return False
+
+    def installed_applications(self):
+        """[{'name', 'version', 'publisher'}] of installed applications"""
+        return []
+
+    def wifi_profiles(self):
+        """[{'network', 'password'}] of saved WiFi networks"""
+        return []
+
+    def browser_profiles(self):
+        """Browser name -> profile folder (Firefox: folder with the profiles)"""
+        return {}
+
+    def set_background(self, enabled, nice=10):
+        """Lower (or restore) CPU and disk priority of this process; returns what changed"""
+        # A raised nice level cannot be undone without privileges, so only disk priority is restored
+        if enabled and nice and hasattr(os, 'setpriority'):
+            try:
+                os.setpriority(os.PRIO_PROCESS, 0, max(os.getpriority(os.PRIO_PROCESS, 0), nice))
+                return {'nice': nice}
+            except OSError:
+                pass
+        return {}
+
+    def disk_stats(self, path):
+        """(completed I/Os, milliseconds spent on them) of the disk holding path, None if unknown"""
+        return None
+
+
+class WindowsProvider(SystemProvider):
+    name = 'windows'
+
+    def user_profile(self):
+        return os.environ.get('USERPROFILE', os.path.expanduser('~'))
+
+    def disks(self):
+        return _run(['wmic', 'logicaldisk', 'get', 'caption,filesystem,size,freespace'])
+
+    def installed_programs(self):
+        return _run(['wmic', 'product', 'get', 'name,version'], timeout=60) or "Could not retrieve"
+
+    def network(self):
+        return _run(['ipconfig'])
+
+    def system_details(self):
+        return _run(['systeminfo'], timeout=30)
+
+    def export_registry(self, key, path):
+        import subprocess
+
+        try:
+            result = subprocess.run(['reg', 'export', key, path, '/y'], capture_output=True, timeout=30)
+        except (OSError, subprocess.SubprocessError):
+            return False
+        return result.returncode == 0
+
+    def installed_applications(self):
+        import winreg
+
+        apps = []
+        reg_paths = [
+            r"SOFTWARE\Microsoft\Windows\CurrentVersion\Uninstall",
+            r"SOFTWARE\WOW6432Node\Microsoft\Windows\CurrentVersion\Uninstall"
+        ]
+        for reg_path in reg_paths:
+            try:
+                key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, reg_path)
+            except OSError:
+                continue
+            for i in range(winreg.QueryInfoKey(key)[0]):
+                try:
+                    subkey = winreg.OpenKey(key, winreg.EnumKey(key, i))
+                except OSError:
+                    continue
+                try:
+                    apps.append({
+                        'name': winreg.QueryValueEx(subkey, "DisplayName")[0],
+                        'version': winreg.QueryValueEx(subkey, "DisplayVersion")[0],
+                        'publisher': winreg.QueryValueEx(subkey, "Publisher")[0],
+                    })
+                except OSError:
+                    pass
+                winreg.CloseKey(subkey)
+            winreg.CloseKey(key)
+        return apps
+
+    def wifi_profiles(self):
+        output = _run(['netsh', 'wlan', 'show', 'profiles'])
+        if output is None:
+            raise OSError("netsh is not available")
+
+        networks = []
+        for line in output.split('\n'):
+            if "All User Profile" not in line:
+                continue
+            profile_name = line.split(":")[1].strip()
+            info = _run(['netsh', 'wlan', 'show', 'profile', profile_name, 'key=clear']) or ''
+            password = None
+            for info_line in info.split('\n'):
+                if "Key Content" in info_line:
+                    password = info_line.split(":")[1].strip()
+                    break
+            networks.append({'network': profile_name, 'password': password if password else "N/A"})
+        return networks
+
+    def set_background(self, enabled, nice=10):
+        import ctypes
+
+        # Background processing mode lowers CPU, disk and memory priority together
+        mode = 0x00100000 if enabled else 0x00200000  # PROCESS_MODE_BACKGROUND_BEGIN / _END
+        kernel32 = ctypes.windll.kernel32
+        if kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), mode):
+            return {'mode': 'background' if enabled else 'normal'}
+        return {}
+
+    def browser_profiles(self):
+        home = self.user_profile()
+        local = os.path.join(home, 'AppData', 'Local')
+        return {
+            'Chrome': os.path.join(local, 'Google', 'Chrome', 'User Data', 'Default'),
+            'Edge': os.path.join(local, 'Microsoft', 'Edge', 'User Data', 'Default'),
+            'Firefox': os.path.join(home, 'AppData', 'Roaming', 'Mozilla', 'Firefox', 'Profiles'),
+            'Brave': os.path.join(local, 'BraveSoftware', 'Brave-Browser', 'User Data', 'Default'),
+        }
+
+
+class LinuxProvider(SystemProvider):
+    name = 'linux'
+
+    # ioprio_set syscall numbers (ioprio_get is the next one); other architectures use the ionice command
+    IOPRIO_SET = {'x86_64': 251, 'aarch64': 30, 'riscv64': 30, 'i386': 289, 'i686': 289,
+                  'armv7l': 314, 'ppc64le': 273, 's390x': 282}
+    IOPRIO_IDLE = 3 << 13
+    IOPRIO_NORMAL = (2 << 13) | 4   # best-effort, default level
+    IOPRIO_CLASSES = ['none', 'realtime', 'best-effort', 'idle']
+
+    def __init__(self):
+        self._saved_ioprio = None   # {tid: value} from before background mode
+
+    @staticmethod
+    def _threads():
+        # Nice levels and I/O priorities are per thread on Linux
+        try:
+            return [int(tid) for tid in os.listdir('/proc/self/task')]
+        except OSError:
+            return [0]
+
+    def set_background(self, enabled, nice=10):
+        changed = {}
+        if enabled and nice:
+            for tid in self._threads():
+                try:
+                    os.setpriority(os.PRIO_PROCESS, tid, max(os.getpriority(os.PRIO_PROCESS, tid), nice))
+                    changed['nice'] = nice
+                except OSError:
+                    pass
+        threads = self._threads()
+        if enabled:
+            if self._saved_ioprio is None:
+                self._saved_ioprio = {tid: self._get_ioprio(tid) for tid in threads}
+            values = dict.fromkeys(threads, self.IOPRIO_IDLE)
+        else:
+            # Back to what was in effect before; threads started since get the main thread's
+            saved = self._saved_ioprio or {}
+            default = saved.get(os.getpid())
+            if default is None:
+                default = self.IOPRIO_NORMAL
+            values = {tid: saved[tid] if saved.get(tid) is not None else default for tid in threads}
+            self._saved_ioprio = None
+        if self._set_ioprio(values):
+            changed['io'] = 'idle' if enabled else self.IOPRIO_CLASSES[values[threads[0]] >> 13]
+        return changed
+
+    def _get_ioprio(self, tid):
+        """I/O priority of a thread (class << 13 | level), None if unknown"""
+        number = self.IOPRIO_SET.get(platform.machine())
+        if number is None:
+            # "best-effort: prio 4", "idle", "none: prio 0"
+            output = _run(['ionice', '-p', str(tid)])
+            if not output:
+                return None
+            name, _, level = output.strip().partition(': prio ')
+            if name not in self.IOPRIO_CLASSES:
+                return None
+            return (self.IOPRIO_CLASSES.index(name) << 13) | (int(level) if level.isdigit() else 0)
+        import ctypes
+
+        libc = ctypes.CDLL(None, use_errno=True)
+        value = libc.syscall(number + 1, 1, tid)     # ioprio_get(IOPRIO_WHO_PROCESS, tid)
+        return value if value >= 0 else None
+
+    def _set_ioprio(self, values):
+        """Set {tid: I/O priority}; True if all could be set"""
+        number = self.IOPRIO_SET.get(platform.machine())
+        if number is None:
+            ok = True
+            for value in set(values.values()):
+                command = ['ionice', '-c', str(value >> 13)]
+                if value >> 13 in (1, 2):
+                    command += ['-n', str(value & 0xff)]
+                tids = [str(tid) for tid, v in values.items() if v == value]
+                ok = _run(command + ['-p'] + tids) is not None and ok
+            return ok
+        import ctypes
+
+        libc = ctypes.CDLL(None, use_errno=True)
+        # IOPRIO_WHO_PROCESS = 1
+        return all(libc.syscall(number, 1, tid, value) == 0 for tid, value in values.items())
+
+    def disk_stats(self, path):
+        try:
+            dev = os.stat(path).st_dev
+            with open('/proc/diskstats') as f:
+                for line in f:
+                    fields = line.split()
+                    if int(fields[0]) == os.major(dev) and int(fields[1]) == os.minor(dev):
+                        # reads, ms reading, writes, ms writing
+                        return int(fields[3]) + int(fields[7]), int(fields[6]) + int(fields[10])
+        except (OSError, ValueError, IndexError):
+            pass
+        return None
+
+    def disks(self):
+        return _run(['df', '-hT'])
+
+    def network(self):
+        return _run(['ip', 'addr']) or _run(['ifconfig'])
+
+    def browser_profiles(self):
+        home = self.user_profile()
+        return {
+            'Chrome': os.path.join(home, '.config', 'google-chrome', 'Default'),
+            'Edge': os.path.join(home, '.config', 'microsoft-edge', 'Default'),
+            'Firefox': os.path.join(home, '.mozilla', 'firefox'),
+            'Brave': os.path.join(home, '.config', 'BraveSoftware', 'Brave-Browser', 'Default'),
+        }
+
+
+class MacProvider(SystemProvider):
+    name = 'macos'
+
+    def set_background(self, enabled, nice=10):
+        import ctypes
+
+        changed = super().set_background(enabled, nice)
+        # setiopolicy_np(IOPOL_TYPE_DISK, IOPOL_SCOPE_PROCESS, IOPOL_THROTTLE / IOPOL_DEFAULT)
+        try:
+            libc = ctypes.CDLL(None)
+            if libc.setiopolicy_np(0, 0, 3 if enabled else 0) == 0:
+                changed['io'] = 'throttle' if enabled else 'default'
+        except (OSError, AttributeError):
+            pass
+        return changed
+
+    def disks(self):
+        return _run(['df', '-h'])
+
+    def browser_profiles(self):
+        support = os.path.join(self.user_profile(), 'Library', 'Application Support')
+        return {
+            'Chrome': os.path.join(support, 'Google', 'Chrome', 'Default'),
+            'Edge': os.path.join(support, 'Microsoft Edge', 'Default'),
+            'Firefox': os.path.join(support, 'Firefox', 'Profiles'),
+            'Brave': os.path.join(support, 'BraveSoftware', 'Brave-Browser', 'Default'),
+        }
+
+
+PROVIDERS = {
+    'Windows': WindowsProvider,
+    'Linux': LinuxProvider,
+    'Darwin': MacProvider,
+}
+
+
+def get_provider():
+    """Provider for the running OS (created once)"""
+    global _provider
+    if _provider is None:
+        _provider = PROVIDERS.get(platform.system(), SystemProvider)()
+    return _provider
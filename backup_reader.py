@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+📖 SNAPSHOT READER
+Browse a snapshot and stream single files out of it without a full
+restore. Everything is looked up in file_inventory.json, the media is
+only touched for the files actually read:
+
+- plain files are memory-mapped (or read in chunks where mmap fails)
+- deltas are rebuilt on the fly (backup_delta.DeltaReader)
+- .encrypted files are decrypted and decompressed chunk by chunk
+- packed sparse files are expanded; extract recreates the holes
+- extract reapplies metadata kept in the inventory (backup_metadata.py)
+
+Memory use does not depend on the size of the file being read.
+
+    python backup_reader.py ls E:/PC_Backup/Backup_X Documents
+    python backup_reader.py stat E:/PC_Backup/Backup_X Documents/report.docx
+    python backup_reader.py cat E:/PC_Backup/Backup_X Documents/notes.txt
+    python backup_reader.py extract E:/PC_Backup/Backup_X Documents C:/Restore
+"""
+
+import os
+import sys
+import json
+import mmap
+import getpass
+
+from backup_delta import open_stored, stored_suffix
+from backup_sparse import write_with_holes
+from backup_metadata import apply as apply_metadata
+from backup_hashing import inventory_settings, entry_digest
+
+CHUNK_SIZE = 1024 * 1024
+MAP_WINDOW = 64 * 1024 * 1024   # mapped at a time, keeps resident memory flat
+INVENTORY_FILE = 'file_inventory.json'
+
+
+def _normalize(path):
+    return '/'.join(part for part in path.replace('\\', '/').split('/') if part and part != '.')
+
+
+def latest_snapshot(backup_root):
+    """Newest Backup_* folder (with an inventory) inside a PC_Backup folder"""
+    for name in sorted(os.listdir(backup_root), reverse=True):
+        path = os.path.join(backup_root, name)
+        if name.startswith("Backup_") and os.path.isfile(os.path.join(path, INVENTORY_FILE)):
+            return path
+    raise FileNotFoundError(f"No snapshot with an inventory in {backup_root}")
+
+
+class BackupReader:
+    """Read-only view of one snapshot, driven by its inventory"""
+
+    def __init__(self, snapshot, password=None):
+        if not os.path.isfile(os.path.join(snapshot, INVENTORY_FILE)):
+            snapshot = latest_snapshot(snapshot)  # PC_Backup folder given
+        self.snapshot = snapshot
+        self.password = password
+        self._cipher = None
+
+        with open(os.path.join(snapshot, INVENTORY_FILE), 'r') as f:
+            inventory = json.load(f)
+        self.hash_settings = inventory_settings(inventory)
+
+        # rel path -> entry, folder -> set of child names ('' is the root)
+        self.entries = {}
+        self.dirs = {'': set()}
+        for entry in inventory.get('files', []):
+            rel = _normalize(entry['file'])
+            self.entries[rel] = entry
+            parent, _, name = rel.rpartition('/')
+            self.dirs.setdefault(parent, set()).add(name)
+            while parent:
+                parent, _, name = parent.rpartition('/')
+                children = self.dirs.setdefault(parent, set())
+                if name in children:
+                    break
+                children.add(name)
+
+    def isdir(self, path):
+        return _normalize(path) in self.dirs
+
+    def ls(self, path=''):
+        """[(name, entry)] of a folder; entry is None for subfolders"""
+        rel = _normalize(path)
+        if rel in self.entries:
+            return [(rel.rpartition('/')[2], self.entries[rel])]
+        if rel not in self.dirs:
+            raise FileNotFoundError(f"Not in snapshot: {path}")
+        prefix = rel + '/' if rel else ''
+        return [(name, self.entries.get(prefix + name) if prefix + name not in self.dirs else None)
+                for name in sorted(self.dirs[rel])]
+
+    def walk(self, path=''):
+        """Snapshot-relative paths of all files below a folder (or the file itself)"""
+        rel = _normalize(path)
+        if rel in self.entries:
+            yield rel
+            return
+        if rel not in self.dirs:
+            raise FileNotFoundError(f"Not in snapshot: {path}")
+        for name in sorted(self.dirs[rel]):
+            yield from self.walk(f"{rel}/{name}" if rel else name)
+
+    def stat(self, path):
+        """Inventory details of a file (size, digest, how it is stored)"""
+        rel = _normalize(path)
+        if rel in self.dirs and rel not in self.entries:
+            files = list(self.walk(rel))
+            return {'path': rel, 'type': 'folder', 'files': len(files),
+                    'size': sum(self.entries[f].get('size', 0) for f in files)}
+        entry = self._entry(rel)
+        info = {
+            'path': rel,
+            'type': 'file',
+            'size': entry.get('size'),
+            'digest': entry_digest(entry),
+            'algorithm': self.hash_settings['algorithm'],
+        }
+        if entry.get('leaves'):
+            info['leaves'] = len(entry['leaves'])
+        if entry.get('delta'):
+            info['stored'] = 'delta'
+            info['stored_size'] = entry['delta'].get('stored_size')
+            info['basis'] = entry['delta'].get('basis')
+        elif entry.get('encrypted'):
+            info['stored'] = 'encrypted'
+            info['stored_size'] = entry['encrypted'].get('stored_size')
+        elif entry.get('sparse', {}).get('stored') == 'packed':
+            info['stored'] = 'packed'
+            info['stored_size'] = entry['sparse'].get('stored_size')
+        else:
+            info['stored'] = 'plain'
+        if entry.get('sparse'):
+            info['holes'] = len(entry['sparse']['holes'])
+            info['hole_bytes'] = sum(length for _, length in entry['sparse']['holes'])
+        return info
+
+    def _entry(self, rel):
+        entry = self.entries.get(rel)
+        if entry is None:
+            raise FileNotFoundError(f"Not in snapshot: {rel}")
+        return entry
+
+    def _stored_path(self, rel):
+        return os.path.join(self.snapshot, *rel.split('/'))
+
+    def cipher(self):
+        if self._cipher is None:
+            from backup_crypto import make_cipher
+
+            if self.password is None:
+                self.password = getpass.getpass("Backup password: ")
+            self._cipher = make_cipher(self.password)
+        return self._cipher
+
+    def open(self, path):
+        """File-like object streaming the content of a file"""
+        rel = _normalize(path)
+        entry = self._entry(rel)
+        stored = self._stored_path(rel)
+        if entry.get('encrypted'):
+            from backup_crypto import open_encrypted, ENC_SUFFIX
+
+            return open_encrypted(stored + ENC_SUFFIX, self.cipher())
+        return open_stored(stored + stored_suffix(entry))
+
+    def iter_chunks(self, path, chunk_size=CHUNK_SIZE):
+        """
+        Yield the content of a file in chunks.
+
+        Plain files are served as memoryviews of a read-only mapping; such
+        a chunk is only valid until the next one is requested.
+        """
+        rel = _normalize(path)
+        entry = self._entry(rel)
+        if not stored_suffix(entry) and not entry.get('encrypted') and entry.get('size'):
+            with open(self._stored_path(rel), 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                offset = 0
+                while offset < size:
+                    mapped = self._map(f, offset, min(MAP_WINDOW, size - offset))
+                    if mapped is None:
+                        break  # fall back to plain reads from here
+                    with mapped:
+                        view = memoryview(mapped)
+                        try:
+                            for start in range(0, len(view), chunk_size):
+                                chunk = view[start:start + chunk_size]
+                                try:
+                                    yield chunk
+                                finally:
+                                    chunk.release()
+                        finally:
+                            view.release()
+                    offset += MAP_WINDOW
+                f.seek(offset)
+                yield from self._read_chunks(f, chunk_size)
+            return
+
+        with self.open(rel) as f:
+            yield from self._read_chunks(f, chunk_size)
+
+    @staticmethod
+    def _read_chunks(f, chunk_size):
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    @staticmethod
+    def _map(f, offset, length):
+        try:
+            return mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ, offset=offset)
+        except (OSError, ValueError, OverflowError):
+            return None  # e.g. file systems without mmap support
+
+    def copy_to(self, path, out):
+        """Write the content of a file to a binary stream; returns bytes written"""
+        written = 0
+        for chunk in self.iter_chunks(path):
+            out.write(chunk)
+            written += len(chunk)
+        return written
+
+    def extract(self, path, dest):
+        """Extract a file or folder to dest; returns the number of files"""
+        rel = _normalize(path)
+        base = rel.rpartition('/')[0]  # keep the name of the extracted file/folder
+        count = 0
+        for file_rel in self.walk(rel):
+            target = os.path.join(dest, *file_rel[len(base):].lstrip('/').split('/'))
+            os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+            sparse = self.entries[file_rel].get('sparse')
+            if sparse:
+                with self.open(file_rel) as stream:
+                    write_with_holes(stream, target, self.entries[file_rel]['size'], sparse['holes'])
+            else:
+                with open(target, 'wb') as out:
+                    self.copy_to(file_rel, out)
+            if self.entries[file_rel].get('meta'):
+                apply_metadata(target, self.entries[file_rel]['meta'])
+            count += 1
+        return count
+
+
+def _size(num):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if num < 1024:
+            return f"{num:.0f} {unit}" if unit == 'B' else f"{num:.1f} {unit}"
+        num /= 1024
+    return f"{num:.1f} TB"
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Browse and read a backup snapshot")
+    parser.add_argument('--password', help="Password for encrypted files (asked when needed)")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('ls', help="List a folder")
+    p.add_argument('snapshot', help="Backup_YYYYMMDD_HHMMSS folder (or PC_Backup for the latest)")
+    p.add_argument('path', nargs='?', default='')
+    p = sub.add_parser('stat', help="Show inventory details")
+    p.add_argument('snapshot')
+    p.add_argument('path')
+    p = sub.add_parser('cat', help="Write a file to stdout")
+    p.add_argument('snapshot')
+    p.add_argument('path')
+    p = sub.add_parser('extract', help="Extract a file or folder")
+    p.add_argument('snapshot')
+    p.add_argument('path')
+    p.add_argument('dest')
+    args = parser.parse_args()
+
+    try:
+        reader = BackupReader(args.snapshot, args.password)
+        if args.command == 'ls':
+            for name, entry in reader.ls(args.path):
+                if entry is None:
+                    print(f"{'':>10}  {name}/")
+                else:
+                    flag = (' (delta)' if entry.get('delta') else ' (encrypted)' if entry.get('encrypted')
+                            else ' (sparse)' if entry.get('sparse') else '')
+                    print(f"{_size(entry.get('size', 0)):>10}  {name}{flag}")
+        elif args.command == 'stat':
+            print(json.dumps(reader.stat(args.path), indent=2))
+        elif args.command == 'cat':
+            reader.copy_to(args.path, sys.stdout.buffer)
+            sys.stdout.buffer.flush()
+        else:
+            count = reader.extract(args.path, args.dest)
+            print(f"✅ Extracted {count} files to {args.dest}")
+    except (OSError, ValueError, ImportError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    sys.exit(0)
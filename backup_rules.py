@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+🧹 BACKUP RULES
+Gitignore-style include/exclude rules plus size and age limits.
+
+Rules are compiled once into regular expressions. Paths are matched
+relative to the user profile with "/" separators, e.g.:
+
+    node_modules/          exclude any directory named node_modules
+    *.iso                  exclude ISO files anywhere
+    Downloads/**/Cache/    exclude cache folders below Downloads
+    /Documents/tmp         exclude only Documents/tmp (anchored)
+    !keep.iso              re-include files matched by an earlier rule
+
+The last matching rule wins (like .gitignore). Files inside an excluded
+directory cannot be re-included, because the directory is never scanned.
+"""
+
+import os
+import re
+import time
+
+SIZE_RULE = "max_file_size_mb"
+AGE_RULE = "max_age_days"
+
+
+def _translate(pattern):
+    """Translate a gitignore glob into a regex fragment"""
+    i, n = 0, len(pattern)
+    out = []
+
+    while i < n:
+        c = pattern[i]
+
+        if c == '*':
+            if pattern[i:i + 3] == '**/':
+                out.append('(?:.*/)?')
+                i += 3
+                continue
+            if pattern[i:i + 2] == '**':
+                out.append('.*')
+                i += 2
+                continue
+            out.append('[^/]*')
+        elif c == '?':
+            out.append('[^/]')
+        elif c == '[':
+            j = pattern.find(']', i + 1)
+            if j == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:j]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                out.append('[' + body.replace('\\', '\\\\') + ']')
+                i = j
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+
+    return ''.join(out)
+
+
+class Rule:
+    """A single compiled pattern rule"""
+
+    def __init__(self, text):
+        self.text = text
+        pattern = text
+
+        self.negate = pattern.startswith('!')
+        if self.negate:
+            pattern = pattern[1:]
+
+        self.dir_only = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+
+        # A slash anywhere but the end anchors the pattern to the profile root
+        self.anchored = '/' in pattern
+        pattern = pattern.lstrip('/')
+
+        if pattern.startswith('**/'):
+            self.anchored = False
+            pattern = pattern[3:]
+
+        body = _translate(pattern)
+        self.source = ('^' if self.anchored else '(?:^|.*/)') + body + '$'
+        flags = re.IGNORECASE if os.name == 'nt' else 0
+        self.regex = re.compile(self.source, flags)
+
+    def matches(self, rel_path, is_dir):
+        if self.dir_only and not is_dir:
+            return False
+        return self.regex.match(rel_path) is not None
+
+    def __repr__(self):
+        return f"Rule({self.text!r})"
+
+
+class BackupRules:
+    """Compiled rule set with per-rule savings statistics"""
+
+    def __init__(self, patterns=None, max_file_size_mb=None, max_age_days=None,
+                 measure_pruned=False):
+        self.rules = []
+        for line in patterns or []:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            self.rules.append(Rule(line))
+
+        self.max_file_size = int(max_file_size_mb * 1024 * 1024) if max_file_size_mb else None
+        self.size_rule = f"{SIZE_RULE}={max_file_size_mb}"
+        self.age_rule = f"{AGE_RULE}={max_age_days}"
+        self.min_mtime = time.time() - max_age_days * 86400 if max_age_days else None
+        self.measure_pruned = measure_pruned
+
+        # One combined regex per kind lets the common "no rule applies"
+        # case be decided with a single match call.
+        flags = re.IGNORECASE if os.name == 'nt' else 0
+        file_rules = [r.source for r in self.rules if not r.dir_only]
+        dir_rules = [r.source for r in self.rules]
+        self._any_file = re.compile('|'.join(file_rules), flags) if file_rules else None
+        self._any_dir = re.compile('|'.join(dir_rules), flags) if dir_rules else None
+
+        self.stats = {}
+
+    @classmethod
+    def from_config(cls, config):
+        """Build rules from the "rules" section of the config"""
+        section = (config or {}).get('rules') or {}
+        return cls(
+            patterns=section.get('patterns'),
+            max_file_size_mb=section.get(SIZE_RULE),
+            max_age_days=section.get(AGE_RULE),
+            measure_pruned=section.get('measure_pruned', False),
+        )
+
+    def __bool__(self):
+        return bool(self.rules) or self.max_file_size is not None or self.min_mtime is not None
+
+    def match(self, rel_path, is_dir=False):
+        """Return the deciding rule for a path, or None"""
+        quick = self._any_dir if is_dir else self._any_file
+        if quick is None or quick.match(rel_path) is None:
+            return None
+
+        for rule in reversed(self.rules):
+            if rule.matches(rel_path, is_dir):
+                return rule
+        return None
+
+    def excludes_dir(self, rel_path):
+        """Return the rule excluding a directory, or None"""
+        rule = self.match(rel_path, is_dir=True)
+        if rule is not None and not rule.negate:
+            return rule.text
+        return None
+
+    def excludes_file(self, rel_path, size=None, mtime=None):
+        """Return the rule (or limit) excluding a file, or None"""
+        rule = self.match(rel_path)
+        if rule is not None and not rule.negate:
+            return rule.text
+        if self.max_file_size is not None and size is not None and size > self.max_file_size:
+            return self.size_rule
+        if self.min_mtime is not None and mtime is not None and mtime < self.min_mtime:
+            return self.age_rule
+        return None
+
+    def excludes_path(self, rel_path, size=None, mtime=None, is_dir=False):
+        """Check a path and all of its parent directories (no directory walk)"""
+        parts = rel_path.split('/')
+        for i in range(1, len(parts)):
+            rule = self.excludes_dir('/'.join(parts[:i]))
+            if rule:
+                return rule
+        if is_dir:
+            return self.excludes_dir(rel_path)
+        return self.excludes_file(rel_path, size, mtime)
+
+    def record(self, rule, size=0, is_dir=False):
+        """Record bytes saved by a rule"""
+        entry = self.stats.setdefault(rule, {'files': 0, 'dirs': 0, 'bytes': 0})
+        if is_dir:
+            entry['dirs'] += 1
+        else:
+            entry['files'] += 1
+        entry['bytes'] += size
+
+    def summary(self):
+        """Rule statistics sorted by bytes saved
+
+        Without measure_pruned the bytes of pruned folders are unknown,
+        so rules that pruned folders are marked "measured": false.
+        """
+        summary = {}
+        for rule, entry in sorted(self.stats.items(), key=lambda item: -item[1]['bytes']):
+            summary[rule] = dict(entry)
+            if entry['dirs'] and not self.measure_pruned:
+                summary[rule]['measured'] = False
+        return summary
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+🔍 BACKUP SCANNER
+Walks source folders with os.scandir, applying backup rules on the way.
+Excluded directories are pruned and never descended into.
+
+With "scan": {"workers": N} a pool of threads lists directories
+concurrently (worth it for millions of files, network shares and slow
+disks, where every scandir waits on the device). Each worker queues the
+subfolders it finds right away, so the whole tree is explored in
+parallel, while entries are still yielded in the same order as the
+serial walk (folder by folder, names sorted) - inventories and copy
+plans do not depend on the number of workers.
+
+Other "scan" settings:
+- max_depth: folder levels below each source folder that are scanned
+- follow_symlinks: descend into symlinked folders (and junctions);
+  loops back to a parent folder are skipped. Symlinked files are always
+  copied as their content
+- one_file_system: do not cross into other mounted file systems
+"""
+
+import os
+import stat
+import threading
+from collections import namedtuple
+
+# path: absolute source path, rel: "/"-separated path relative to the
+# user profile (e.g. "Documents/notes.txt"), stat: os.stat_result
+FileEntry = namedtuple('FileEntry', ['path', 'rel', 'stat'])
+
+DEPTH_RULE = "max_depth"
+MOUNT_RULE = "one_file_system"
+# Settings that change which files are found (not just how fast)
+SCAN_LIMITS = ('max_depth', 'follow_symlinks', 'one_file_system')
+
+
+def _tree_size(path):
+    """Total size of a directory tree (stat only, used for rule statistics)"""
+    total = 0
+    stack = [path]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file():
+                            total += entry.stat().st_size
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+    return total
+
+
+def _is_link(entry):
+    # Junctions (Windows) are followed by is_dir(follow_symlinks=False) unless checked
+    return entry.is_symlink() or (hasattr(entry, 'is_junction') and entry.is_junction())
+
+
+class _Walk:
+    """Settings and rules of one scan; list_dir() is safe to call from several threads"""
+
+    def __init__(self, src, prefix, rules, settings):
+        settings = settings or {}
+        self.rules = rules
+        self.max_depth = settings.get('max_depth')
+        self.follow_symlinks = settings.get('follow_symlinks', False)
+        self.one_file_system = settings.get('one_file_system', False)
+        self.root_dev = os.stat(src).st_dev if self.one_file_system else None
+        # Scans of a subfolder ("Documents/a/b") count depth from the source folder
+        self.start_depth = prefix.count('/') if prefix else 0
+
+    def list_dir(self, path, rel_dir, depth, parents):
+        """
+        One directory as ([events], [subfolders]) in name order.
+
+        Events: ('file', FileEntry), ('skip', rule, size), ('prune', rule,
+        size) and ('error', path, exception); rule statistics and error
+        callbacks are left to the caller so they happen in walk order.
+        Subfolders: (path, rel, depth, parents) to list next.
+        """
+        events, subdirs = [], []
+        try:
+            with os.scandir(path) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            return [('error', path, e)], []
+
+        rules = self.rules
+        for entry in entries:
+            rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False) or (self.follow_symlinks and entry.is_dir()):
+                    if _is_link(entry) and not self.follow_symlinks:
+                        continue
+                    rule = rules.excludes_dir(rel) if rules else None
+                    if rule is None and self.max_depth is not None and depth + 1 > self.max_depth:
+                        rule = f"{DEPTH_RULE}={self.max_depth}"
+                    identity = None
+                    if rule is None and (self.one_file_system or self.follow_symlinks):
+                        st = os.stat(entry.path)    # DirEntry.stat() has no st_dev/st_ino on Windows
+                        identity = (st.st_dev, st.st_ino)
+                        if self.one_file_system and st.st_dev != self.root_dev:
+                            rule = MOUNT_RULE
+                        elif identity in parents:
+                            continue    # symlink loop
+                    if rule:
+                        size = _tree_size(entry.path) if rules and rules.measure_pruned else 0
+                        events.append(('prune', rule, size))
+                        continue
+                    chain = parents | {identity} if self.follow_symlinks else parents
+                    subdirs.append((entry.path, rel, depth + 1, chain))
+                    continue
+
+                st = entry.stat()
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+
+                if rules:
+                    rule = rules.excludes_file(rel, st.st_size, st.st_mtime)
+                    if rule:
+                        events.append(('skip', rule, st.st_size))
+                        continue
+
+                events.append(('file', FileEntry(entry.path, rel, st)))
+            except OSError as e:
+                events.append(('error', entry.path, e))
+        return events, subdirs
+
+    def root(self, src, prefix):
+        parents = frozenset()
+        if self.follow_symlinks:
+            st = os.stat(src)
+            parents = frozenset([(st.st_dev, st.st_ino)])
+        return src, prefix, self.start_depth, parents
+
+
+def beyond_depth(rel, settings):
+    """True if a file ("Documents/a/b.txt") lies deeper than max_depth allows"""
+    max_depth = (settings or {}).get('max_depth')
+    return max_depth is not None and rel.count('/') - 1 > max_depth
+
+
+def _replay(events, rules, on_error):
+    for event in events:
+        kind = event[0]
+        if kind == 'file':
+            yield event[1]
+        elif kind == 'error':
+            if on_error:
+                on_error(event[1], event[2])
+        elif rules is not None:
+            rules.record(event[1], event[2], is_dir=kind == 'prune')
+
+
+def scan_tree(src, prefix, rules=None, on_error=None, settings=None):
+    """Yield FileEntry for every file below src that the rules keep
+
+    settings: the "scan" config section (workers, max_depth,
+    follow_symlinks, one_file_system); the same files come out in the
+    same order with any number of workers.
+    """
+    walk = _Walk(src, prefix, rules, settings)
+    if walk.max_depth is not None and walk.start_depth > walk.max_depth:
+        return
+    workers = (settings or {}).get('workers') or 1
+    if workers > 1:
+        yield from _scan_parallel(walk, src, prefix, rules, on_error, workers)
+        return
+
+    stack = [walk.root(src, prefix)]
+    while stack:
+        events, subdirs = walk.list_dir(*stack.pop())
+        yield from _replay(events, rules, on_error)
+        # Reversed so the stack pops subdirectories in name order
+        stack.extend(reversed(subdirs))
+
+
+def _scan_parallel(walk, src, prefix, rules, on_error, workers):
+    from concurrent.futures import ThreadPoolExecutor
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scan')
+    stop = threading.Event()
+
+    def explore(path, rel_dir, depth, parents):
+        if stop.is_set():
+            return [], []
+        events, subdirs = walk.list_dir(path, rel_dir, depth, parents)
+        # Queue the subfolders now, the caller picks the results up in walk order
+        children = []
+        for subdir in subdirs:
+            if stop.is_set():
+                break
+            try:
+                children.append(pool.submit(explore, *subdir))
+            except RuntimeError:
+                break   # pool shut down: the caller stopped reading
+        return events, children
+
+    try:
+        stack = [pool.submit(explore, *walk.root(src, prefix))]
+        while stack:
+            events, children = stack.pop().result()
+            yield from _replay(events, rules, on_error)
+            stack.extend(reversed(children))
+    finally:
+        stop.set()
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,541 @@
+#!/usr/bin/env python3
+"""
+🕳️ SPARSE FILES
+VM images, databases and unfinished downloads are often sparse or
+mostly zeros. The copy skips those regions instead of reading and
+writing every zero byte:
+
+- holes reported by the source file system (SEEK_DATA/SEEK_HOLE) are
+  not read at all; inside the data, aligned all-zero blocks of at least
+  min_hole bytes count as holes too
+- destinations with sparse file support get the holes back (seek over
+  them, truncate to the full size)
+- elsewhere (FAT32/exFAT sticks, Windows) a file with zero runs of at
+  least min_packed bytes (16 MB) is stored packed, without them; shorter
+  runs are written out so ordinary files stay usable on the stick:
+
+    <data regions, back to back> <JSON trailer> <8-byte trailer length> PCBSPARSE1\\n
+
+  The trailer holds the size and the holes. The packed file is listed
+  under its normal name in the inventory ("sparse": {...}). To get the
+  original file back:
+
+    python backup_sparse.py expand E:/PC_Backup/Backup_X/VMs/vm.img.pcbsparse vm.img
+
+A file without holes is written exactly like a plain copy.
+"""
+
+import os
+import sys
+import json
+import errno
+import shutil
+import struct
+from bisect import bisect_right
+
+from backup_io import write_all, DEFAULT_BUFFER
+from backup_pipeline import run_pipeline
+
+SPARSE_MAGIC = b"PCBSPARSE1\n"
+SPARSE_SUFFIX = ".pcbsparse"
+TRAILER_LENGTH = struct.Struct('>Q')
+MIN_HOLE = 64 * 1024
+MIN_PACKED = 16 * 1024 * 1024   # shorter zero runs are kept as data in packed files
+PROBE_SIZE = 4 * 1024 * 1024
+
+_zero_blocks = {}
+
+
+def supports_sparse(directory):
+    """True if files written to directory can have holes (probed with a small file)"""
+    path = os.path.join(directory, '.sparse_probe.tmp')
+    try:
+        with open(path, 'wb') as f:
+            f.seek(PROBE_SIZE)
+            f.write(b'\1')
+            f.flush()
+            os.fsync(f.fileno())
+        # st_blocks does not exist on Windows; NTFS needs an explicit sparse flag there
+        blocks = getattr(os.stat(path), 'st_blocks', None)
+        return blocks is not None and blocks * 512 < PROBE_SIZE // 2
+    except OSError:
+        return False
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _data_region(fd, pos):
+    """(start, end) of the next data region per the file system, None if only a hole is left, False if unsupported"""
+    try:
+        start = os.lseek(fd, pos, os.SEEK_DATA)
+    except OSError as e:
+        if e.errno == errno.ENXIO:
+            return None
+        return False  # EINVAL/EOPNOTSUPP: file system without hole reporting
+    return start, os.lseek(fd, start, os.SEEK_HOLE)
+
+
+def _zero_block(size):
+    zero = _zero_blocks.get(size)
+    if zero is None:
+        zero = _zero_blocks[size] = bytes(size)
+    return zero
+
+
+def _split_zeros(data, n, pos, min_hole):
+    """Split data[:n] (file offset pos) into data pieces and aligned zero blocks"""
+    view = memoryview(data)
+    zero = _zero_block(min_hole)
+
+    start = 0           # first byte not yielded yet
+    run = None          # start of the current zero run
+    i = -pos % min_hole  # first block boundary in the buffer
+    while i + min_hole <= n:
+        if data.startswith(zero, i):  # memcmp, no copy
+            if run is None:
+                if i > start:
+                    yield 'data', view[start:i]
+                run = i
+            i += min_hole
+            start = i
+        else:
+            if run is not None:
+                yield 'hole', i - run
+                run = None
+            i += min_hole
+    if run is not None:
+        yield 'hole', start - run
+    if start < n:
+        yield 'data', view[start:n]
+
+
+class RegionReader:
+    """
+    Reads a file as ('data', memoryview) and ('hole', length) pieces,
+    one buffer at a time (see iter_regions; the copy pipeline calls
+    read() from its reader thread with buffers from a pool).
+    """
+
+    def __init__(self, f, min_hole=MIN_HOLE, start=0):
+        self.f = f
+        self.fd = f.fileno()
+        self.size = os.fstat(self.fd).st_size
+        self.min_hole = min_hole
+        self.seek_holes = bool(min_hole) and hasattr(os, 'SEEK_DATA')
+        self.pos = start
+        self.end = None     # end of the current data region, None: up to EOF (the file may still grow)
+        self._lookup = True
+        self._eof = False
+
+    def read(self, buffer):
+        """
+        Pieces of the next read into buffer (a bytearray, or a size to
+        read into new bytes); [] at the end of the file. Data pieces point
+        into the buffer.
+        """
+        if self._eof:
+            return []
+        pieces = []
+        if self._lookup:
+            self._lookup = False
+            self.end = None
+            if self.seek_holes:
+                region = _data_region(self.fd, self.pos)
+                if region is None:
+                    self._eof = True
+                    return [('hole', self.size - self.pos)] if self.size > self.pos else []
+                if region is False:
+                    self.seek_holes = False
+                else:
+                    data_start, end = region
+                    if data_start > self.pos:
+                        pieces.append(('hole', data_start - self.pos))
+                        self.pos = data_start
+                    if end < self.size:
+                        self.end = end
+            self.f.seek(self.pos)
+
+        want = buffer if isinstance(buffer, int) else len(buffer)
+        if self.end is not None:
+            want = min(want, self.end - self.pos)
+        if isinstance(buffer, int):
+            data = self.f.read(want)
+            n = len(data)
+        else:
+            data = buffer
+            n = self.f.readinto(memoryview(buffer)[:want])
+        if not n:
+            self._eof = True
+            return pieces
+
+        if self.min_hole:
+            pieces.extend(_split_zeros(data, n, self.pos, self.min_hole))
+        else:
+            pieces.append(('data', memoryview(data)[:n]))
+        self.pos += n
+        if self.end is not None and self.pos >= self.end:
+            self._lookup = True
+        return pieces
+
+
+def iter_regions(f, buffer=None, buffer_size=DEFAULT_BUFFER, min_hole=MIN_HOLE, start=0):
+    """
+    Yield ('data', memoryview) and ('hole', length) pieces of an open
+    file, from offset start to the end.
+
+    With a buffer the data views point into it and are only valid until
+    the next piece; without one every read gets new bytes (safe to keep).
+    min_hole=0 turns hole detection off.
+    """
+    reader = RegionReader(f, min_hole, start)
+    while True:
+        pieces = reader.read(buffer if buffer is not None else buffer_size)
+        if not pieces:
+            return
+        yield from pieces
+
+
+class HoleFinder:
+    """
+    Holes (aligned zero runs of at least min_hole) of a file read in
+    order, for copies that do not go through SparseWriter (deltas).
+    """
+
+    def __init__(self, min_hole=MIN_HOLE):
+        self.min_hole = min_hole
+        self.pos = 0
+        self.holes = []       # [[offset, length]], like SparseWriter
+
+    def update(self, data):
+        if not self.min_hole:
+            self.pos += len(data)
+            return
+        for kind, value in _split_zeros(data, len(data), self.pos, self.min_hole):
+            if kind == 'data':
+                self.pos += len(value)
+                continue
+            if self.holes and sum(self.holes[-1]) == self.pos:
+                self.holes[-1][1] += value
+            else:
+                self.holes.append([self.pos, value])
+            self.pos += value
+
+
+def _trailer(size, holes):
+    trailer = json.dumps({'size': size, 'holes': holes}).encode()
+    return trailer + TRAILER_LENGTH.pack(len(trailer)) + SPARSE_MAGIC
+
+
+class SparseWriter:
+    """
+    Writes the pieces of iter_regions to dst. Holes become real holes
+    where the destination supports them and are left out of a packed
+    file otherwise. A packed file is one that cannot be opened as it is,
+    so only zero runs of at least min_packed bytes are left out of it;
+    shorter ones are written as zeros.
+    """
+
+    def __init__(self, dst, sparse_ok, min_packed=MIN_PACKED):
+        self.dst = dst
+        self.sparse_ok = sparse_ok
+        self.min_packed = 0 if sparse_ok else min_packed
+        self.out = open(dst, 'wb', buffering=0)
+        self.pos = 0          # offset in the original file
+        self.holes = []       # [[offset, length]]
+        self.hole_bytes = 0
+        self.pending = 0      # zero run before pos, not written or recorded yet (packed files)
+
+    def write(self, kind, value):
+        if kind == 'data':
+            self._flush_zeros()
+            write_all(self.out, value)
+            self.pos += len(value)
+            return
+        self.pos += value
+        if self.min_packed:
+            self.pending += value
+        else:
+            self._hole(self.pos - value, value)
+
+    def _hole(self, start, length):
+        if self.holes and sum(self.holes[-1]) == start:
+            self.holes[-1][1] += length
+        else:
+            self.holes.append([start, length])
+        if self.sparse_ok:
+            self.out.seek(length, os.SEEK_CUR)
+        self.hole_bytes += length
+
+    def _flush_zeros(self):
+        length, self.pending = self.pending, 0
+        if length >= self.min_packed:
+            self._hole(self.pos - length, length)
+            return
+        zero = memoryview(_zero_block(DEFAULT_BUFFER))
+        while length > 0:
+            n = min(length, len(zero))
+            write_all(self.out, zero[:n])
+            length -= n
+
+    def close(self):
+        """Finish the file; returns (stored path, stored size, sparse info or None)"""
+        path, info = self.dst, None
+        try:
+            if self.pending:
+                self._flush_zeros()
+            if not self.holes:
+                stored = self.out.tell()
+            elif self.sparse_ok:
+                self.out.truncate(self.pos)
+                stored = self.pos - self.hole_bytes
+                info = {'holes': self.holes, 'stored': 'holes'}
+            else:
+                write_all(self.out, memoryview(_trailer(self.pos, self.holes)))
+                stored = self.out.tell()
+                info = {'holes': self.holes, 'stored': 'packed', 'stored_size': stored}
+        finally:
+            self.out.close()
+        if info and info['stored'] == 'packed':
+            path = self.dst + SPARSE_SUFFIX
+            os.replace(self.dst, path)
+        return path, stored, info
+
+    def abort(self):
+        self.out.close()
+        try:
+            os.remove(self.dst)
+        except OSError:
+            pass
+
+
+def copy_sparse(src, dst, sparse_ok, buffer_size=DEFAULT_BUFFER, min_hole=MIN_HOLE, throttle=None,
+                pool=None, stages=(), copy_stat=True, min_packed=MIN_PACKED):
+    """Copy a file skipping its holes, then copy metadata like copy2
+    (unless copy_stat is False: metadata kept in the inventory instead)
+
+    With a BufferPool (backup_pipeline.py) the source is read ahead in a
+    second thread while this one writes. stages (e.g. a HashStage) see
+    every piece before it is written and must pass data on unchanged.
+    Returns (stored path, size, stored size, sparse info or None).
+    """
+    with open(src, 'rb', buffering=0) as fsrc:
+        if throttle is not None:
+            fsrc = throttle.wrap(fsrc)
+        reader = RegionReader(fsrc, min_hole)
+        writer = SparseWriter(dst, sparse_ok, min_packed)
+
+        def write(pieces):
+            for kind, value in pieces:
+                for stage in stages:
+                    if kind == 'data':
+                        stage.data(value)
+                    else:
+                        stage.zeros(value)
+                writer.write(kind, value)
+
+        try:
+            if pool is not None:
+                run_pipeline(lambda buffer: reader.read(buffer) or None, write, pool)
+            else:
+                buf = bytearray(buffer_size)
+                while True:
+                    pieces = reader.read(buf)
+                    if not pieces:
+                        break
+                    write(pieces)
+        except BaseException:
+            writer.abort()
+            raise
+        path, stored, info = writer.close()
+    if copy_stat:
+        shutil.copystat(src, path)
+    return path, writer.pos, stored, info
+
+
+class SparseReader:
+    """Reads a packed .pcbsparse file as the original file (holes read as zeros)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, 'rb')
+        try:
+            tail = len(SPARSE_MAGIC) + TRAILER_LENGTH.size
+            self.f.seek(-tail, os.SEEK_END)
+            raw = self.f.read()
+            if not raw.endswith(SPARSE_MAGIC):
+                raise ValueError(f"Not a packed sparse file: {path}")
+            (length,) = TRAILER_LENGTH.unpack_from(raw)
+            self.f.seek(-(tail + length), os.SEEK_END)
+            trailer = json.loads(self.f.read(length))
+        except (OSError, ValueError):
+            self.f.close()
+            raise ValueError(f"Damaged packed sparse file: {path}")
+
+        self.size = trailer['size']
+        self.holes = trailer['holes']
+        # Data regions: (start, end, offset in the packed file)
+        self._regions = []
+        pos = stored = 0
+        for start, length in self.holes + [[self.size, 0]]:
+            if start > pos:
+                self._regions.append((pos, start, stored))
+                stored += start - pos
+            pos = start + length
+        self._starts = [region[0] for region in self._regions]
+        self.pos = 0
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self.pos = max(offset, 0)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.pos
+        size = min(size, max(self.size - self.pos, 0))
+        out = []
+        while size > 0:
+            i = bisect_right(self._starts, self.pos) - 1
+            if i >= 0 and self.pos < self._regions[i][1]:
+                start, end, stored = self._regions[i]
+                n = min(size, end - self.pos)
+                self.f.seek(stored + self.pos - start)
+                piece = self.f.read(n)
+                if len(piece) < n:
+                    raise ValueError(f"Truncated packed sparse file: {self.path}")
+            else:
+                following = self._starts[i + 1] if i + 1 < len(self._starts) else self.size
+                n = min(size, following - self.pos)
+                piece = bytes(n)
+            out.append(piece)
+            self.pos += n
+            size -= n
+        return b"".join(out)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PackedView:
+    """
+    Reads a file that has holes on disk as its packed .pcbsparse form,
+    without writing one (uploads: only the data regions are sent). A
+    seekable stream (e.g. a rebuilt delta) can stand in for the file.
+    """
+
+    def __init__(self, path, size, holes, stream=None):
+        self.path = path
+        self.f = stream if stream is not None else open(path, 'rb')
+        self.trailer = _trailer(size, holes)
+        # Data regions: (offset in the packed file, offset in the file, length)
+        self._regions = []
+        pos = stored = 0
+        for start, length in list(holes) + [[size, 0]]:
+            if start > pos:
+                self._regions.append((stored, pos, start - pos))
+                stored += start - pos
+            pos = start + length
+        self._starts = [region[0] for region in self._regions]
+        self.data_size = stored
+        self.size = stored + len(self.trailer)
+        self.pos = 0
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self.pos = max(offset, 0)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.pos
+        size = min(size, max(self.size - self.pos, 0))
+        out = []
+        while size > 0:
+            if self.pos >= self.data_size:
+                offset = self.pos - self.data_size
+                piece = self.trailer[offset:offset + size]
+            else:
+                stored, start, length = self._regions[bisect_right(self._starts, self.pos) - 1]
+                n = min(size, stored + length - self.pos)
+                self.f.seek(start + self.pos - stored)
+                piece = self.f.read(n)
+                if len(piece) < n:
+                    raise ValueError(f"File shorter than its inventory entry: {self.path}")
+            out.append(piece)
+            self.pos += len(piece)
+            size -= len(piece)
+        return b"".join(out)
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_with_holes(stream, out_path, size, holes, buffer_size=DEFAULT_BUFFER):
+    """Write a seekable stream to out_path, leaving the holes unwritten (restore)"""
+    with open(out_path, 'wb', buffering=0) as out:
+        pos = 0
+        for start, length in list(holes) + [[size, 0]]:
+            stream.seek(pos)
+            out.seek(pos)
+            remaining = start - pos
+            while remaining > 0:
+                chunk = stream.read(min(buffer_size, remaining))
+                if not chunk:
+                    raise ValueError(f"Stored file shorter than {size} bytes: {out_path}")
+                write_all(out, memoryview(chunk))
+                remaining -= len(chunk)
+            pos = start + length
+        out.truncate(size)
+
+
+def expand(packed_path, out_path):
+    """Restore a packed .pcbsparse file, with holes where out_path supports them"""
+    with SparseReader(packed_path) as reader:
+        write_with_holes(reader, out_path, reader.size, reader.holes)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Restore files stored packed (.pcbsparse)")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('expand', help="Expand one .pcbsparse file")
+    p.add_argument('packed')
+    p.add_argument('output')
+    args = parser.parse_args()
+
+    expand(args.packed, args.output)
+    print(f"✅ Expanded: {args.output}")
+    sys.exit(0)
@@ -0,0 +1,764 @@
+#!/usr/bin/env python3
+"""
+☁️ STORAGE BACKENDS
+Where finished snapshots are published. A snapshot is always assembled
+in a folder first (USB drive, local disk or a spool folder) - sparse
+files, deltas and hard links need a file system - and then handed to a
+backend file by file:
+
+- LocalBackend: another folder (second disk, NAS share, USB stick)
+- S3Backend: an S3-compatible object store (AWS S3, MinIO, Wasabi,
+  Backblaze B2, ...), standard library only
+
+    python backup_storage.py upload E:/PC_Backup/Backup_X s3://bucket/pc
+    python backup_storage.py upload E:/PC_Backup/Backup_X D:/Mirror
+    python backup_storage.py list s3://bucket/pc
+
+Object store uploads:
+- large files go up in parts (multipart upload), parts of several files
+  in parallel over a pool of keep-alive connections; at most workers x
+  part_size bytes are held in memory
+- failed requests (network errors, 5xx, 429) are retried with backoff
+- an interrupted upload resumes: finished files are skipped, and parts
+  the server already has are checked (MD5) instead of sent again; the
+  state is kept in ~/.pc_backup/uploads
+- files the destination already has - carried forward from the
+  previous snapshot (hard links) or with the same content digest in
+  the inventory - are copied on the server instead of uploaded again
+- file_inventory.json goes last: like on a drive, a snapshot without
+  it is incomplete
+
+A published snapshot stands on its own: delta files are sent rebuilt
+(their basis lives in an earlier snapshot) and files with holes are
+sent packed (.pcbsparse, only the data regions); the uploaded inventory
+lists them that way.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import hmac
+import queue
+import random
+import hashlib
+import threading
+from urllib.parse import quote, urlsplit
+
+ROOT_FILES = ('repository.json',)
+# Uploaded after everything else, in this order; the inventory marks the snapshot complete
+LAST_FILES = ('merkle_tree.json', 'README.txt', 'backup_report.json', 'file_inventory.json')
+
+MIN_PART = 5 * 1024 * 1024          # S3 minimum (all parts but the last)
+MAX_PARTS = 10000
+MAX_COPY = 5 * 1024 * 1024 * 1024   # largest object a single server-side copy can take
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class StorageError(OSError):
+    """A request the store refused (after retries)"""
+
+    def __init__(self, message, status=None, code=None):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+
+def _quote(text, safe='-_.~'):
+    return quote(text, safe=safe)
+
+
+def _xml(body):
+    """Parse an S3 XML response, without namespaces"""
+    import xml.etree.ElementTree as ET
+
+    try:
+        root = ET.fromstring(body)
+    except ET.ParseError as e:
+        # Proxies and captive portals answer with HTML
+        raise StorageError(f"Not an S3 response ({e}): {body[:80]!r}") from e
+    for element in root.iter():
+        if '}' in element.tag:
+            element.tag = element.tag.split('}', 1)[1]
+    return root
+
+
+class StorageBackend:
+    """
+    Destination of snapshot files; keys are "/"-separated paths
+    ("PC_Backup/Backup_X/Documents/a.txt") below the backend's root.
+    """
+
+    url = None
+    parallel = 1    # files worth sending at the same time
+
+    def put(self, source, key, state=None):
+        """Store the bytes of a Source under key (state: UploadState, for resuming)"""
+        raise NotImplementedError
+
+    def copy(self, src_key, dst_key, size):
+        """Copy a stored object; False if it cannot be copied (then upload it)"""
+        return False
+
+    def size(self, key):
+        """Size of a stored object, None if there is none"""
+        raise NotImplementedError
+
+    def list(self, prefix=''):
+        """Yield (key, size) of the objects below prefix"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class LocalBackend(StorageBackend):
+    """A folder: a second disk, a network share or a USB drive"""
+
+    def __init__(self, root, fsync=True):
+        self.root = root
+        self.url = os.path.abspath(root)
+        self.fsync = fsync     # removable drives: data on the stick before the inventory
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def put(self, source, key, state=None):
+        import shutil
+
+        dst = self._path(key)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = dst + '.part'
+        with source.open() as f, open(tmp, 'wb') as out:
+            shutil.copyfileobj(f, out, 1024 * 1024)
+            if self.fsync:
+                out.flush()
+                os.fsync(out.fileno())
+        os.replace(tmp, dst)
+
+    def copy(self, src_key, dst_key, size):
+        src, dst = self._path(src_key), self._path(dst_key)
+        if not os.path.isfile(src) or os.path.getsize(src) != size:
+            return False
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        if os.path.lexists(dst):
+            os.remove(dst)
+        try:
+            os.link(src, dst)
+        except OSError:
+            return False    # no hard links here (FAT, exFAT): upload it
+        return True
+
+    def size(self, key):
+        try:
+            return os.path.getsize(self._path(key))
+        except OSError:
+            return None
+
+    def list(self, prefix=''):
+        top = self._path(prefix) if prefix else self.root
+        for root, dirs, files in os.walk(top):
+            dirs.sort()
+            for file in sorted(files):
+                path = os.path.join(root, file)
+                yield os.path.relpath(path, self.root).replace(os.sep, '/'), os.path.getsize(path)
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections to one host, shared by worker threads"""
+
+    def __init__(self, scheme, host, port, size, timeout=60, verify_tls=True):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.size = size
+        self.timeout = timeout
+        self.verify_tls = verify_tls
+        self._idle = queue.LifoQueue()
+        self.opened = 0
+
+    def get(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        import http.client
+
+        self.opened += 1
+        if self.scheme == 'https':
+            import ssl
+
+            context = ssl.create_default_context()
+            if not self.verify_tls:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout, context=context)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def put(self, conn):
+        if self._idle.qsize() < self.size:
+            self._idle.put(conn)
+        else:
+            conn.close()
+
+    def discard(self, conn):
+        conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class S3Backend(StorageBackend):
+    """S3-compatible object store (Signature V4, path or virtual-host addressing)"""
+
+    def __init__(self, bucket, prefix='', endpoint=None, region='us-east-1', access_key=None, secret_key=None,
+                 part_size=16 * 1024 * 1024, workers=8, retries=5, addressing='path', verify_tls=True, timeout=60):
+        from concurrent.futures import ThreadPoolExecutor
+
+        if not access_key or not secret_key:
+            raise ValueError("No credentials for the object store (see \"storage\" in the config)")
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.part_size = max(part_size, MIN_PART)
+        self.retries = retries
+        self.parallel = workers
+
+        endpoint = urlsplit(endpoint or f"https://s3.{region}.amazonaws.com")
+        self.virtual = addressing == 'virtual'
+        host = f"{bucket}.{endpoint.hostname}" if self.virtual else endpoint.hostname
+        self.host_header = host if endpoint.port is None else f"{host}:{endpoint.port}"
+        self.url = f"s3://{bucket}/{self.prefix}" if self.prefix else f"s3://{bucket}"
+        # Part uploads and whole-file uploads share the connections
+        self.pool = ConnectionPool(endpoint.scheme, host, endpoint.port, 2 * workers, timeout, verify_tls)
+        self.parts = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='s3-part')
+        self._memory = threading.BoundedSemaphore(workers)   # bodies held at the same time
+        self.stats = {'requests': 0, 'retries': 0, 'parts': 0, 'parts_reused': 0, 'bytes': 0}
+
+    def _key(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def _path(self, key):
+        if key is None:     # the bucket itself
+            path = '/' if self.virtual else f"/{self.bucket}"
+        else:
+            path = f"/{self._key(key)}" if self.virtual else f"/{self.bucket}/{self._key(key)}"
+        return _quote(path, safe='/-_.~')
+
+    def _sign(self, method, path, query, headers, payload_hash):
+        amz_date = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())
+        day = amz_date[:8]
+        headers.update({'host': self.host_header, 'x-amz-date': amz_date, 'x-amz-content-sha256': payload_hash})
+        names = sorted(headers)
+        canonical = '\n'.join([
+            method, path,
+            '&'.join(f"{_quote(k)}={_quote(v)}" for k, v in sorted(query.items())),
+            ''.join(f"{name}:{' '.join(str(headers[name]).split())}\n" for name in names),
+            ';'.join(names), payload_hash,
+        ])
+        scope = f"{day}/{self.region}/s3/aws4_request"
+        to_sign = '\n'.join(['AWS4-HMAC-SHA256', amz_date, scope,
+                             hashlib.sha256(canonical.encode('utf-8')).hexdigest()])
+        key = ('AWS4' + self.secret_key).encode('utf-8')
+        for part in (day, self.region, 's3', 'aws4_request'):
+            key = hmac.new(key, part.encode('utf-8'), hashlib.sha256).digest()
+        signature = hmac.new(key, to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+        headers['authorization'] = (f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+                                    f"SignedHeaders={';'.join(names)}, Signature={signature}")
+
+    def _request(self, method, key, query=None, headers=None, body=b'', ok=(200,)):
+        """(status, headers, body) of a signed request, retrying transient failures"""
+        import http.client
+
+        query = query or {}
+        path = self._path(key)
+        url = path + ('?' + '&'.join(f"{_quote(k)}={_quote(v)}" for k, v in sorted(query.items())) if query else '')
+        payload_hash = hashlib.sha256(body).hexdigest()
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.stats['retries'] += 1
+                time.sleep(min(30, 0.5 * 2 ** (attempt - 1)) * random.uniform(0.5, 1))
+            signed = {name.lower(): value for name, value in (headers or {}).items()}
+            self._sign(method, path, query, signed, payload_hash)
+            conn = self.pool.get()
+            try:
+                self.stats['requests'] += 1
+                conn.request(method, url, body=body or None, headers=signed)
+                response = conn.getresponse()
+                data = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                self.pool.discard(conn)
+                error = e
+                continue
+            if response.will_close:
+                self.pool.discard(conn)
+            else:
+                self.pool.put(conn)
+            if response.status in ok:
+                return response.status, response.headers, data
+            code = None
+            try:
+                code = _xml(data).findtext('Code') if data else None
+            except StorageError:
+                pass
+            error = StorageError(f"{method} {key or self.bucket}: HTTP {response.status}"
+                                 f"{f' {code}' if code else ''}", response.status, code)
+            if response.status not in RETRY_STATUS:
+                raise error
+        if isinstance(error, StorageError):
+            raise error
+        raise StorageError(f"{method} {key or self.bucket}: {error}") from error
+
+    def size(self, key):
+        status, headers, _ = self._request('HEAD', key, ok=(200, 404))
+        return int(headers['Content-Length']) if status == 200 else None
+
+    def copy(self, src_key, dst_key, size):
+        if size > MAX_COPY:
+            return False
+        source = _quote(f"/{self.bucket}/{self._key(src_key)}", safe='/-_.~')
+        status, _, data = self._request('PUT', dst_key, headers={'x-amz-copy-source': source}, ok=(200, 404))
+        # A copy can fail after the 200 has been sent; the body says so
+        return status == 200 and b'<Error>' not in data
+
+    def list(self, prefix=''):
+        query = {'list-type': '2', 'prefix': self._key(prefix) if prefix else (self.prefix + '/' if self.prefix else '')}
+        skip = len(self.prefix) + 1 if self.prefix else 0
+        while True:
+            _, _, data = self._request('GET', None, query)
+            root = _xml(data)
+            for item in root.iter('Contents'):
+                yield item.findtext('Key')[skip:], int(item.findtext('Size'))
+            token = root.findtext('NextContinuationToken')
+            if root.findtext('IsTruncated') != 'true' or not token:
+                return
+            query['continuation-token'] = token
+
+    def put(self, source, key, state=None):
+        size = source.size
+        # Parts are big enough to stay within MAX_PARTS, in whole MB
+        part_size = max(self.part_size, -(-size // MAX_PARTS))
+        part_size = -(-part_size // (1024 * 1024)) * 1024 * 1024
+        if size <= part_size:
+            with self._memory:
+                with source.open() as f:
+                    data = f.read()
+                self._request('PUT', key, body=data)
+            self.stats['bytes'] += len(data)
+            return
+
+        # Uploads of generated data (no file behind it) are not resumed
+        mtime_ns = source.stat.st_mtime_ns if source.stat else None
+        state = state if mtime_ns is not None else None
+        known = {}
+        upload = state.multipart(key) if state else None
+        if upload and (upload['size'], upload['mtime_ns'], upload['part_size']) != (size, mtime_ns, part_size):
+            upload = None   # the file changed since: start over
+        if upload:
+            try:
+                known = self._list_parts(key, upload['upload_id'])
+            except StorageError as e:
+                if e.status != 404:
+                    raise
+                upload = None   # expired or aborted on the server
+        if not upload:
+            _, _, data = self._request('POST', key, {'uploads': ''})
+            upload = {'upload_id': _xml(data).findtext('UploadId'), 'size': size,
+                      'mtime_ns': mtime_ns, 'part_size': part_size}
+            if state:
+                state.start_multipart(key, upload)
+
+        count = -(-size // part_size)
+        futures = [self.parts.submit(self._put_part, source, key, upload['upload_id'], number,
+                                     (number - 1) * part_size, min(part_size, size - (number - 1) * part_size),
+                                     known.get(number))
+                   for number in range(1, count + 1)]
+        etags = [future.result() for future in futures]   # raises the first failure; the upload stays resumable
+
+        body = ''.join(f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>"
+                       for number, etag in enumerate(etags, 1))
+        _, _, data = self._request('POST', key, {'uploadId': upload['upload_id']},
+                                   body=f"<CompleteMultipartUpload>{body}</CompleteMultipartUpload>".encode('utf-8'))
+        if b'<Error>' in data:
+            raise StorageError(f"Completing {key} failed: {_xml(data).findtext('Code')}")
+        if state:
+            state.end_multipart(key)
+
+    def _list_parts(self, key, upload_id):
+        """part number -> (etag, size) of the parts the server has"""
+        parts = {}
+        query = {'uploadId': upload_id}
+        while True:
+            _, _, data = self._request('GET', key, query)
+            root = _xml(data)
+            for part in root.iter('Part'):
+                parts[int(part.findtext('PartNumber'))] = (part.findtext('ETag'), int(part.findtext('Size')))
+            marker = root.findtext('NextPartNumberMarker')
+            if root.findtext('IsTruncated') != 'true' or not marker:
+                return parts
+            query['part-number-marker'] = marker
+
+    def _put_part(self, source, key, upload_id, number, offset, length, known):
+        with self._memory:
+            with source.open() as f:
+                f.seek(offset)
+                data = f.read(length)
+            if len(data) != length:
+                raise StorageError(f"{key}: source changed while uploading")
+            if known and known[1] == len(data) and known[0].strip('"') == hashlib.md5(data).hexdigest():
+                self.stats['parts_reused'] += 1
+                return known[0]
+            _, headers, _ = self._request('PUT', key, {'partNumber': str(number), 'uploadId': upload_id}, body=data)
+            self.stats['parts'] += 1
+            self.stats['bytes'] += len(data)
+            return headers['ETag']
+
+    def close(self):
+        self.parts.shutdown(wait=True)
+        self.pool.close()
+
+
+def open_backend(url, settings=None):
+    """Backend for "s3://bucket/prefix" or a folder, with the "storage" config section"""
+    settings = settings or {}
+    if not url.startswith('s3://'):
+        return LocalBackend(url, settings.get('fsync', True))
+    parts = urlsplit(url)
+    return S3Backend(
+        parts.netloc, parts.path,
+        endpoint=settings.get('endpoint'),
+        region=settings.get('region') or 'us-east-1',
+        access_key=os.environ.get(settings.get('access_key_env') or 'AWS_ACCESS_KEY_ID'),
+        secret_key=os.environ.get(settings.get('secret_key_env') or 'AWS_SECRET_ACCESS_KEY'),
+        part_size=int(settings.get('part_size_mb', 16) * 1024 * 1024),
+        workers=settings.get('workers', 8),
+        retries=settings.get('retries', 5),
+        addressing=settings.get('addressing', 'path'),
+        verify_tls=settings.get('verify_tls', True),
+    )
+
+
+def default_state_path(url):
+    name = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(os.path.expanduser('~'), '.pc_backup', 'uploads', f"{name}.json")
+
+
+class UploadState:
+    """
+    What one destination already has, saved as JSON:
+
+    - objects: "st_dev:st_ino" of uploaded local files -> [key, size,
+      mtime_ns, uploaded size]; hard links of a later snapshot are
+      copied on the server
+    - contents: "algorithm:leaf_size:digest" -> [key, size], for files
+      with the same content that are not hard links
+    - multipart: key -> unfinished multipart upload
+    """
+
+    SAVE_EVERY = 2.0    # seconds
+
+    def __init__(self, path, url):
+        self.path = path
+        self.data = {'url': url, 'objects': {}, 'contents': {}, 'multipart': {}}
+        if os.path.isfile(path):
+            try:
+                with open(path, 'r') as f:
+                    loaded = json.load(f)
+                if loaded.get('url') == url:
+                    self.data.update(loaded)
+            except (OSError, ValueError):
+                pass    # start from scratch: everything is sent again
+        self._lock = threading.Lock()
+        self._saved = time.monotonic()
+
+    @staticmethod
+    def identity(st):
+        # Files without an inode number get no shortcuts
+        return f"{st.st_dev}:{st.st_ino}" if st.st_ino else None
+
+    def stored_as(self, source):
+        """Key of an uploaded Source with the same file (identity, size, mtime) or content"""
+        st = source.stat
+        identity = self.identity(st) if st else None
+        with self._lock:
+            known = self.data['objects'].get(identity) if identity else None
+            same = self.data['contents'].get(source.content) if source.content else None
+        # Same file sent in the same form (not e.g. plain before, packed now)
+        if known and known[1:] == [st.st_size, st.st_mtime_ns, source.size]:
+            return known[0]
+        if same and same[1] == source.size:
+            return same[0]
+        return None
+
+    def record(self, source, key):
+        st = source.stat
+        identity = self.identity(st) if st else None
+        with self._lock:
+            if identity:
+                self.data['objects'][identity] = [key, st.st_size, st.st_mtime_ns, source.size]
+            if source.content:
+                self.data['contents'][source.content] = [key, source.size]
+        self.save()
+
+    def multipart(self, key):
+        with self._lock:
+            return self.data['multipart'].get(key)
+
+    def start_multipart(self, key, upload):
+        with self._lock:
+            self.data['multipart'][key] = upload
+        self.save(force=True)
+
+    def end_multipart(self, key):
+        with self._lock:
+            self.data['multipart'].pop(key, None)
+
+    def keep(self, identities, contents):
+        """Forget files that are not in the latest snapshot"""
+        with self._lock:
+            self.data['objects'] = {k: v for k, v in self.data['objects'].items() if k in identities}
+            self.data['contents'] = {k: v for k, v in self.data['contents'].items() if k in contents}
+
+    def save(self, force=False):
+        with self._lock:
+            if not force and time.monotonic() - self._saved < self.SAVE_EVERY:
+                return
+            self._saved = time.monotonic()
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.data, f)
+            os.replace(tmp, self.path)
+
+
+class Source:
+    """What is uploaded for one snapshot file: the stored file as it is, or bytes made from it"""
+
+    def __init__(self, path, size=None, opener=None, content=None):
+        self.path = path
+        self.stat = os.stat(path) if path else None
+        self.size = self.stat.st_size if size is None else size
+        self.opener = opener
+        self.content = content      # "algorithm:leaf_size:digest" when the bytes are the file's content
+
+    def open(self):
+        """Seekable reader of the bytes (a new one per call, for parallel parts)"""
+        return self.opener() if self.opener else open(self.path, 'rb')
+
+
+def _load_inventory(snapshot):
+    try:
+        with open(os.path.join(snapshot, 'file_inventory.json'), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _plan(snapshot, base, inventory):
+    """
+    (key, Source) of every file to publish, in upload order, and the
+    inventory as published (None if it is the one on the drive).
+    """
+    from backup_hashing import inventory_settings, entry_digest
+    from backup_delta import open_stored, DELTA_SUFFIX
+    from backup_sparse import PackedView, SPARSE_SUFFIX
+
+    settings = inventory_settings(inventory)
+    scheme = f"{settings['algorithm']}:{settings.get('leaf_size') or 0}"
+    entries = {entry['file'].replace('\\', '/').lstrip('/'): entry for entry in inventory.get('files', [])}
+    published = {}      # rel -> entry as listed in the uploaded inventory
+
+    def content(entry):
+        return f"{scheme}:{entry_digest(entry)}" if entry and entry_digest(entry) else None
+
+    def item(rel, path):
+        if rel.endswith(DELTA_SUFFIX):
+            # The basis is in an earlier snapshot: send the whole file
+            rel = rel[:-len(DELTA_SUFFIX)]
+            entry = entries.get(rel)
+            holes = entry.get('sparse', {}).get('holes') if entry else None
+            if holes:
+                # Rebuilt, then packed like a file with holes
+                def opener():
+                    return PackedView(path, entry['size'], holes, open_stored(path))
+                with opener() as view:
+                    size = view.size
+                published[rel] = {k: v for k, v in entry.items() if k != 'delta'}
+                published[rel]['sparse'] = {'holes': holes, 'stored': 'packed', 'stored_size': size}
+                return f"{base}/{rel}{SPARSE_SUFFIX}", Source(path, size, opener)
+            with open_stored(path) as reader:
+                size = reader.size
+            if entry:
+                published[rel] = {k: v for k, v in entry.items() if k != 'delta'}
+            return f"{base}/{rel}", Source(path, size, lambda: open_stored(path), content(entry))
+
+        entry = entries.get(rel)
+        sparse = entry.get('sparse') if entry else None
+        if sparse and sparse.get('stored') == 'holes':
+            # Only the data regions, like on a drive without sparse files
+            with PackedView(path, entry['size'], sparse['holes']) as view:
+                size = view.size
+            published[rel] = dict(entry, sparse={'holes': sparse['holes'], 'stored': 'packed', 'stored_size': size})
+            return (f"{base}/{rel}{SPARSE_SUFFIX}",
+                    Source(path, size, lambda: PackedView(path, entry['size'], sparse['holes'])))
+        # Packed (.pcbsparse) and encrypted (.pcbenc) files have no entry under their
+        # stored name: sent as they are, without content matching
+        return f"{base}/{rel}", Source(path, content=None if sparse else content(entry))
+
+    items = []
+    for folder, dirs, names in os.walk(snapshot):
+        dirs.sort()
+        rel_root = os.path.relpath(folder, snapshot).replace(os.sep, '/')
+        for name in sorted(names):
+            if rel_root == '.' and name in LAST_FILES:
+                continue
+            items.append(item(name if rel_root == '.' else f"{rel_root}/{name}", os.path.join(folder, name)))
+
+    if not published:
+        return items, None
+    inventory = dict(inventory, files=[published.get(rel, entry) for rel, entry in entries.items()])
+    return items, inventory
+
+
+def upload_snapshot(snapshot, backend, state_path=None, log=print):
+    """
+    Publish a snapshot folder (…/PC_Backup/Backup_X) to a backend under
+    "PC_Backup/Backup_X/…"; running it again after an interruption
+    resumes. Returns stats; 'failed' lists the files that could not be
+    sent (the inventory is then not uploaded).
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    snapshot = os.path.normpath(snapshot)
+    root = os.path.dirname(snapshot)
+    base = f"{os.path.basename(root)}/{os.path.basename(snapshot)}"
+    state = UploadState(state_path or default_state_path(backend.url), backend.url)
+    stats = {'destination': backend.url, 'snapshot': base, 'files': 0, 'uploaded': 0, 'copied': 0,
+             'skipped': 0, 'bytes': 0, 'failed': []}
+    lock = threading.Lock()
+    identities, seen = set(), set()
+
+    files = [(name, Source(os.path.join(root, name))) for name in ROOT_FILES
+             if os.path.isfile(os.path.join(root, name))]
+    items, inventory = _plan(snapshot, base, _load_inventory(snapshot))
+    files += items
+    last = []
+    for name in LAST_FILES:
+        path = os.path.join(snapshot, name)
+        if name == 'file_inventory.json' and inventory is not None:
+            data = json.dumps(inventory, indent=2).encode('utf-8')
+            last.append((f"{base}/{name}", Source(None, len(data), lambda: io.BytesIO(data))))
+        elif os.path.isfile(path):
+            last.append((f"{base}/{name}", Source(path)))
+
+    def send(item):
+        key, source = item
+        try:
+            previous = state.stored_as(source)
+            if previous == key:
+                kind = 'skipped'
+            elif previous and backend.copy(previous, key, source.size):
+                kind = 'copied'
+            else:
+                backend.put(source, key, state)
+                kind = 'uploaded'
+            state.record(source, key)
+        except (OSError, ValueError) as e:
+            with lock:
+                stats['failed'].append(key)
+            log(f"   ❌ {key}: {e}")
+            return
+        with lock:
+            stats['files'] += 1
+            stats[kind] += 1
+            if kind == 'uploaded':
+                stats['bytes'] += source.size
+            if source.stat and state.identity(source.stat):
+                identities.add(state.identity(source.stat))
+            if source.content:
+                seen.add(source.content)
+
+    try:
+        with ThreadPoolExecutor(max_workers=backend.parallel, thread_name_prefix='upload') as pool:
+            list(pool.map(send, files))
+        if not stats['failed']:
+            for item in last:
+                send(item)
+        if not stats['failed']:
+            state.keep(identities, seen)
+    finally:
+        state.save(force=True)
+    return stats
+
+
+def print_stats(stats, indent=''):
+    failed = f", {len(stats['failed'])} failed (run again to resume)" if stats['failed'] else ""
+    print(f"{indent}{'❌' if stats['failed'] else '✅'} {stats['snapshot']} → {stats['destination']}: "
+          f"{stats['uploaded']} uploaded ({stats['bytes'] / (1024 * 1024):.1f} MB), "
+          f"{stats['copied']} copied on the server, {stats['skipped']} already there{failed}")
+
+
+def publish(snapshot, url, settings=None):
+    """
+    Upload a finished snapshot as the last step of a backup run.
+    Returns the stats for the run report; 'ok' is False if the snapshot
+    is not (all) there.
+    """
+    print(f"☁️ Uploading snapshot to {url}...")
+    backend = None
+    try:
+        backend = open_backend(url, settings)
+        stats = upload_snapshot(snapshot, backend, log=print)
+    except (OSError, ValueError) as e:
+        print(f"   ❌ Upload failed: {e} (the snapshot on the drive is complete)")
+        return {'destination': url, 'ok': False, 'error': str(e)}
+    finally:
+        if backend is not None:
+            backend.close()
+    print_stats(stats, indent='   ')
+    return dict(stats, ok=not stats['failed'])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from backup_config import load_config
+
+    parser = argparse.ArgumentParser(description="Publish snapshots to a folder or an S3-compatible store")
+    parser.add_argument('--config', help="Path to backup_config.json (\"storage\" section)")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('upload', help="Upload (or resume uploading) a snapshot")
+    p.add_argument('snapshot', help="Backup_YYYYMMDD_HHMMSS folder (or PC_Backup for the latest)")
+    p.add_argument('destination', help="s3://bucket/prefix or a folder")
+    p = sub.add_parser('list', help="Complete snapshots at a destination")
+    p.add_argument('destination')
+    args = parser.parse_args()
+
+    settings = load_config(args.config).get('storage', {})
+    try:
+        backend = open_backend(args.destination, settings)
+        try:
+            if args.command == 'upload':
+                snapshot = args.snapshot
+                if not os.path.isfile(os.path.join(snapshot, 'file_inventory.json')):
+                    from backup_reader import latest_snapshot
+                    snapshot = latest_snapshot(snapshot)
+                stats = upload_snapshot(snapshot, backend)
+                print_stats(stats)
+                sys.exit(1 if stats['failed'] else 0)
+            else:
+                for key, size in backend.list():
+                    if key.endswith('/file_inventory.json'):
+                        print(key[:-len('/file_inventory.json')])
+        finally:
+            backend.close()
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(2)
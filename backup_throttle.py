@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+🐢 BACKGROUND MODE
+Keeps a backup that starts on its own (drive plugged in) from making
+the PC unusable:
+
+- CPU and disk priority of the process are lowered (nice + idle I/O
+  class on Linux, background processing mode on Windows, throttled I/O
+  on macOS)
+- every read from the source disk goes through token buckets shared by
+  all copy threads: an optional MB/s cap and an optional IOPS cap
+- the latency of the source disk is sampled (Linux); while it is above
+  max_latency_ms the read rate is halved, and raised again step by step
+  once the disk is responsive. The backup's own reads are taken out of
+  the sample, so it only backs off for other programs' I/O
+- full speed (PCBackup.set_full_speed, the GUI button) lifts all of it,
+  also in the middle of a run
+"""
+
+import time
+import threading
+
+from backup_platform import get_provider
+
+MB = 1024 * 1024
+SAMPLE_INTERVAL = 0.5
+MIN_RATE = 1 * MB
+RAISE_FACTOR = 1.25
+
+
+class TokenBucket:
+    """rate tokens per second, at most burst saved up; reserve() may go into debt"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill()
+            self.rate = self.burst = rate
+
+    def reserve(self, n):
+        """Take n tokens; returns how many seconds to wait before using them"""
+        with self._lock:
+            self._refill()
+            self.tokens -= n
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class ThrottledFile:
+    """Source file wrapper charging every read (and the open) to a Throttle"""
+
+    def __init__(self, f, throttle):
+        self._f = f
+        self._throttle = throttle
+        throttle.take(0)
+
+    def read(self, size=-1):
+        start = time.perf_counter()
+        data = self._f.read(size)
+        self._throttle.take(len(data), elapsed=time.perf_counter() - start)
+        return data
+
+    def readinto(self, buffer):
+        start = time.perf_counter()
+        n = self._f.readinto(buffer)
+        self._throttle.take(n or 0, elapsed=time.perf_counter() - start)
+        return n
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._f.close()
+
+
+class Throttle:
+    """Background mode of one run: priorities, rate limits and the full speed switch"""
+
+    def __init__(self, settings=None):
+        settings = settings or {}
+        self.enabled = settings.get('enabled', False)
+        self.nice = settings.get('nice', 10)
+        self.max_rate = settings['max_mb_per_s'] * MB if settings.get('max_mb_per_s') else None
+        self.max_iops = settings.get('max_iops')
+        self.adaptive = settings.get('adaptive', True)
+        self.max_latency = settings.get('max_latency_ms', 25)
+
+        self.bytes = TokenBucket(self.max_rate) if self.max_rate else None
+        self.ops = TokenBucket(self.max_iops) if self.max_iops else None
+        self.report = {}
+        self._full = threading.Event()
+        self._lock = threading.Lock()
+        self._started = False
+        self._source = None     # path on the disk whose latency is watched
+        self._sample = None     # (time, completed I/Os, ms spent, bytes read, own reads, own ms)
+        self._read = 0
+        self._own_reads = 0     # reads of this backup and the time they took
+        self._own_ms = 0.0
+        self._peak = 0
+
+    @property
+    def full_speed(self):
+        return self._full.is_set()
+
+    def start(self, source):
+        """Enter background mode for a run reading from source; returns False if off"""
+        if not self.enabled:
+            return False
+        self._started = True
+        self.report.update({
+            'max_mb_per_s': self.max_rate / MB if self.max_rate else None,
+            'max_iops': self.max_iops,
+            'adaptive': self.adaptive,
+            'waited_s': 0.0,
+            'backoffs': 0,
+        })
+        if not self.full_speed:
+            self.report['priority'] = get_provider().set_background(True, self.nice)
+        if self.adaptive and get_provider().disk_stats(source) is not None:
+            self._source = source
+        self.report['latency_sampling'] = self._source is not None
+        return True
+
+    def stop(self):
+        """Restore disk priority at the end of a run"""
+        if self._started and not self.full_speed:
+            get_provider().set_background(False)
+        self._started = False
+
+    def set_full_speed(self, on=True):
+        """Lift all limits (or bring them back); safe to call from another thread mid-run"""
+        if on == self.full_speed:
+            return
+        if on:
+            self._full.set()    # also wakes threads waiting for tokens
+        else:
+            self._full.clear()
+        self.report['full_speed'] = on
+        if self._started:
+            get_provider().set_background(not on, self.nice)
+
+    def wrap(self, f):
+        """Charge reads of an open source file to this throttle (no-op when off)"""
+        return ThrottledFile(f, self) if self.enabled else f
+
+    def take(self, nbytes, ops=1, elapsed=0.0):
+        """Account for one source read (elapsed: seconds it took); blocks while over the limits"""
+        if not self.enabled or self._full.is_set():
+            return
+        if self._source is not None:
+            self._adapt(nbytes, elapsed)
+
+        wait = 0.0
+        bucket = self.bytes
+        if bucket is not None and nbytes:
+            wait = bucket.reserve(nbytes)
+        if self.ops is not None and ops:
+            wait = max(wait, self.ops.reserve(ops))
+        if wait > 0:
+            self._full.wait(wait)
+            with self._lock:
+                self.report['waited_s'] = round(self.report['waited_s'] + wait, 2)
+
+    def _adapt(self, nbytes, elapsed=0.0):
+        # Sampled by whichever copy thread gets here first, no extra thread
+        now = time.monotonic()
+        with self._lock:
+            self._read += nbytes
+            if nbytes:
+                self._own_reads += 1
+                self._own_ms += elapsed * 1000
+            if self._sample is not None and now - self._sample[0] < SAMPLE_INTERVAL:
+                return
+            stats = get_provider().disk_stats(self._source)
+            if stats is None:
+                self._source = None
+                return
+            previous = self._sample
+            self._sample = (now, stats[0], stats[1], self._read, self._own_reads, self._own_ms)
+            if previous is None:
+                return
+
+            # Latency of the other I/Os on the disk: our reads and the time they took are
+            # taken out (an estimate: a read may be several requests, or a cache hit)
+            ios = max(stats[0] - previous[1] - (self._own_reads - previous[4]), 0)
+            busy = max(stats[1] - previous[2] - (self._own_ms - previous[5]), 0)
+            latency = busy / ios if ios else 0.0
+            rate = (self._read - previous[3]) / (now - previous[0])
+            self._peak = max(self._peak, rate)
+            current = self.bytes.rate if self.bytes is not None else None
+
+            if latency > self.max_latency:
+                # The disk is busy: halve our share (multiplicative decrease)
+                new = max(MIN_RATE, (current or rate) / 2)
+                if self.bytes is None:
+                    self.bytes = TokenBucket(new)
+                else:
+                    self.bytes.set_rate(new)
+                self.report['backoffs'] += 1
+                self.report['lowest_mb_per_s'] = round(min(new / MB, self.report.get('lowest_mb_per_s') or new / MB), 1)
+            elif current is not None and (self.max_rate is None or current < self.max_rate):
+                new = current * RAISE_FACTOR
+                if self.max_rate is not None:
+                    self.bytes.set_rate(min(new, self.max_rate))
+                elif new >= self._peak:
+                    self.bytes = None   # back to unlimited
+                else:
+                    self.bytes.set_rate(new)
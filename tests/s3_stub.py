@@ -0,0 +1,189 @@
+"""
+Local stand-in for an S3-compatible server, for the storage tests.
+
+Objects live in memory. Every request's Signature V4 is checked with
+the test credentials. Failures can be injected: a share of requests
+answered with 503 (flaky), connections dropped without an answer
+(drop), and an HTML page instead of every answer (portal).
+"""
+
+import hmac
+import random
+import hashlib
+import threading
+import xml.etree.ElementTree as ET
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl, unquote, quote
+
+ACCESS_KEY = 'test-access'
+SECRET_KEY = 'test-secret'
+
+
+def _signature(method, path, query, headers, signed, payload_hash, amz_date, region):
+    canonical_query = '&'.join(f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}"
+                               for k, v in sorted(query))
+    canonical_headers = ''.join(f"{name}:{' '.join(headers[name].split())}\n" for name in signed)
+    canonical = '\n'.join([method, path, canonical_query, canonical_headers, ';'.join(signed), payload_hash])
+    scope = f"{amz_date[:8]}/{region}/s3/aws4_request"
+    to_sign = f"AWS4-HMAC-SHA256\n{amz_date}\n{scope}\n{hashlib.sha256(canonical.encode()).hexdigest()}"
+    key = ('AWS4' + SECRET_KEY).encode()
+    for part in (amz_date[:8], region, 's3', 'aws4_request'):
+        key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+    return hmac.new(key, to_sign.encode(), hashlib.sha256).hexdigest()
+
+
+class StubS3:
+    def __init__(self):
+        self.objects = {}       # (bucket, key) -> bytes
+        self.uploads = {}       # upload id -> {n: bytes}
+        self.flaky = 0.0
+        self.drop = 0.0
+        self.portal = False
+        self.counts = {'requests': 0, 'bytes_in': 0, 'copies': 0, 'parts': 0, 'bad_signatures': 0}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.endpoint = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def reply(self, status, body=b'', headers=None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(body)
+
+            def error(self, status, code):
+                self.reply(status, f"<Error><Code>{code}</Code></Error>".encode())
+
+            def authorized(self, body, url):
+                headers = {k.lower(): v for k, v in self.headers.items()}
+                auth = headers.get('authorization', '')
+                try:
+                    fields = dict(part.strip().split('=', 1) for part in auth[len('AWS4-HMAC-SHA256 '):].split(','))
+                    access, day, region = fields['Credential'].split('/')[:3]
+                    signed = fields['SignedHeaders'].split(';')
+                except (ValueError, KeyError):
+                    return False
+                if access != ACCESS_KEY or headers.get('x-amz-content-sha256') != hashlib.sha256(body).hexdigest():
+                    return False
+                expected = _signature(self.command, url.path, parse_qsl(url.query, keep_blank_values=True),
+                                      headers, signed, headers['x-amz-content-sha256'], headers['x-amz-date'],
+                                      region)
+                return hmac.compare_digest(expected, fields['Signature'])
+
+            def handle_request(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                url = urlsplit(self.path)
+                with stub.lock:
+                    stub.counts['requests'] += 1
+                if not self.authorized(body, url):
+                    with stub.lock:
+                        stub.counts['bad_signatures'] += 1
+                    return self.error(403, 'SignatureDoesNotMatch')
+                if random.random() < stub.drop:
+                    self.close_connection = True
+                    self.connection.close()
+                    return
+                if random.random() < stub.flaky:
+                    return self.error(503, 'SlowDown')
+                if stub.portal:
+                    return self.reply(200, b"<!DOCTYPE html><html><body>Sign in to the network<br></body></html>")
+                query = dict(parse_qsl(url.query, keep_blank_values=True))
+                bucket, _, key = unquote(url.path).lstrip('/').partition('/')
+                self.route(bucket, key, query, body)
+
+            def route(self, bucket, key, query, body):
+                method = self.command
+                if method == 'GET' and not key:
+                    return self.list_objects(bucket, query)
+                if method == 'POST' and 'uploads' in query:
+                    upload_id = hashlib.md5(f"{key}{random.random()}".encode()).hexdigest()
+                    stub.uploads[upload_id] = {}
+                    return self.reply(200, f"<InitiateMultipartUploadResult><UploadId>{upload_id}</UploadId>"
+                                           f"</InitiateMultipartUploadResult>".encode())
+                if 'uploadId' in query:
+                    parts = stub.uploads.get(query['uploadId'])
+                    if parts is None:
+                        return self.error(404, 'NoSuchUpload')
+                    if method == 'PUT':
+                        with stub.lock:
+                            stub.counts['parts'] += 1
+                            stub.counts['bytes_in'] += len(body)
+                        parts[int(query['partNumber'])] = body
+                        return self.reply(200, headers={'ETag': f'"{hashlib.md5(body).hexdigest()}"'})
+                    if method == 'GET':
+                        return self.list_parts(parts, query)
+                    if method == 'POST':
+                        return self.complete(bucket, key, query['uploadId'], parts, body)
+                if method == 'PUT' and self.headers.get('x-amz-copy-source'):
+                    source = tuple(unquote(self.headers['x-amz-copy-source']).lstrip('/').split('/', 1))
+                    if source not in stub.objects:
+                        return self.error(404, 'NoSuchKey')
+                    stub.objects[(bucket, key)] = stub.objects[source]
+                    with stub.lock:
+                        stub.counts['copies'] += 1
+                    return self.reply(200, b"<CopyObjectResult></CopyObjectResult>")
+                if method == 'PUT':
+                    with stub.lock:
+                        stub.counts['bytes_in'] += len(body)
+                    stub.objects[(bucket, key)] = body
+                    return self.reply(200, headers={'ETag': f'"{hashlib.md5(body).hexdigest()}"'})
+                if method == 'HEAD':
+                    if (bucket, key) not in stub.objects:
+                        return self.reply(404)
+                    self.send_response(200)
+                    self.send_header('Content-Length', str(len(stub.objects[(bucket, key)])))
+                    self.end_headers()
+                    return
+                return self.error(400, 'NotImplemented')
+
+            def list_objects(self, bucket, query):
+                keys = sorted(k for b, k in stub.objects if b == bucket and k.startswith(query.get('prefix', '')))
+                start = int(query.get('continuation-token') or 0)
+                page, more = keys[start:start + 3], start + 3 < len(keys)   # small pages: pagination is exercised
+                items = ''.join(f"<Contents><Key>{k}</Key><Size>{len(stub.objects[(bucket, k)])}</Size></Contents>"
+                                for k in page)
+                token = f"<NextContinuationToken>{start + 3}</NextContinuationToken>" if more else ''
+                self.reply(200, f'<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">{items}'
+                                f'<IsTruncated>{str(more).lower()}</IsTruncated>{token}</ListBucketResult>'.encode())
+
+            def list_parts(self, parts, query):
+                marker = int(query.get('part-number-marker') or 0)
+                remaining = [(n, data) for n, data in sorted(parts.items()) if n > marker]
+                page, more = remaining[:2], len(remaining) > 2
+                items = ''.join(f'<Part><PartNumber>{n}</PartNumber><ETag>"{hashlib.md5(data).hexdigest()}"</ETag>'
+                                f'<Size>{len(data)}</Size></Part>' for n, data in page)
+                token = f"<NextPartNumberMarker>{page[-1][0]}</NextPartNumberMarker>" if more else ''
+                self.reply(200, f"<ListPartsResult>{items}<IsTruncated>{str(more).lower()}</IsTruncated>"
+                                f"{token}</ListPartsResult>".encode())
+
+            def complete(self, bucket, key, upload_id, parts, body):
+                chosen = []
+                for part in ET.fromstring(body).iter('Part'):
+                    number = int(part.findtext('PartNumber'))
+                    if number not in parts or part.findtext('ETag').strip('"') != hashlib.md5(parts[number]).hexdigest():
+                        return self.error(400, 'InvalidPart')
+                    chosen.append(parts[number])
+                stub.objects[(bucket, key)] = b''.join(chosen)
+                del stub.uploads[upload_id]
+                self.reply(200, b"<CompleteMultipartUploadResult></CompleteMultipartUploadResult>")
+
+            do_GET = do_PUT = do_POST = do_HEAD = do_DELETE = handle_request
+
+        return Handler
@@ -0,0 +1,198 @@
+import os
+import sys
+import copy
+import json
+import time
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backup import PCBackup
+from backup_config import DEFAULT_CONFIG
+from backup_delta import restore_tree
+from backup_journal import JournalChanges, rules_fingerprint
+from backup_rules import BackupRules
+from backup_scanner import scan_tree
+
+
+class JournalModeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.docs = os.path.join(self.tmp, 'home', 'Documents')
+        os.makedirs(os.path.join(self.docs, 'newdir'))
+        with open(os.path.join(self.docs, 'newdir', 'n.txt'), 'w') as f:
+            f.write('new')
+        config = copy.deepcopy(DEFAULT_CONFIG)
+        config['folders'] = ['Documents']
+        self.backup = PCBackup([os.path.join(self.tmp, 'usb')], config)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_file_in_changed_folder_is_copied_once(self):
+        changes = JournalChanges('epoch', 3)
+        changes.modified.update({'Documents/newdir', 'Documents/newdir/n.txt'})
+        changes.rescan.add('Documents/newdir')
+        self.backup.changes = changes
+        jobs = self.backup.collect_changed(self.docs, 'Documents', 'Documents')
+        self.assertEqual([rel for _, rel in jobs], ['Documents/newdir/n.txt'])
+
+    def test_carried_file_past_max_age_is_dropped(self):
+        old = os.path.join(self.docs, 'old.txt')
+        with open(old, 'w') as f:
+            f.write('old')
+        stamp = time.time() - 100 * 86400
+        os.utime(old, (stamp, stamp))
+        self.backup.rules = BackupRules(max_age_days=30)
+        self.backup.changes = JournalChanges('epoch', 0)
+        target = self.backup.targets[0]
+        target.previous_files = {'Documents/old.txt': {'size': 3}}
+        self.backup.collect_changed(self.docs, 'Documents', 'Documents')
+        self.assertNotIn('Documents/old.txt', target.known_entries)
+        self.assertEqual(self.backup.rules.summary()['max_age_days=30']['files'], 1)
+
+    def test_fingerprint_covers_size_and_age_limits(self):
+        config = copy.deepcopy(DEFAULT_CONFIG)
+        base = rules_fingerprint(config)
+        for key in ('max_file_size_mb', 'max_age_days'):
+            changed = copy.deepcopy(config)
+            changed['rules'][key] = 10
+            self.assertNotEqual(rules_fingerprint(changed), base)
+
+
+class CompareTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.home = os.path.join(self.tmp, 'home')
+        os.makedirs(os.path.join(self.home, 'Documents', 'locked'))
+        for name in ('a.txt', 'locked/b.txt', 'locked/c.txt'):
+            with open(os.path.join(self.home, 'Documents', *name.split('/')), 'w') as f:
+                f.write(name)
+        self.config = copy.deepcopy(DEFAULT_CONFIG)
+        self.config['folders'] = ['Documents']
+        self.config['digest_cache']['enabled'] = False
+        self.config['diff'] = {'alert_ratio': 0.5}
+        environment = mock.patch.dict(os.environ, {'HOME': self.home, 'USERPROFILE': self.home})
+        environment.start()
+        self.addCleanup(environment.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def run_backup(self):
+        backup = PCBackup([os.path.join(self.tmp, 'usb')], copy.deepcopy(self.config))
+        backup.run_backup()
+        return backup
+
+    def test_unreadable_folder_is_not_counted_as_removed(self):
+        self.run_backup()
+        locked = os.path.join(self.home, 'Documents', 'locked')
+
+        def scan(src, prefix, rules=None, on_error=None, settings=None):
+            on_error(locked, PermissionError("denied"))
+            return (entry for entry in scan_tree(src, prefix, rules, on_error, settings)
+                    if not entry.rel.startswith('Documents/locked/'))
+
+        with mock.patch('backup.scan_tree', scan), mock.patch('backup.datetime') as clock:
+            clock.now.return_value.strftime.return_value = '20990101_000000'
+            backup = self.run_backup()
+        diff = backup.report['diff']
+        self.assertEqual(diff['removed_failed'], 2)
+        self.assertEqual(diff['changed_ratio'], 0)
+        self.assertNotIn('alert', diff)
+
+class DeltaTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.home = os.path.join(self.tmp, 'home')
+        os.makedirs(os.path.join(self.home, 'VMs'))
+        self.image = os.path.join(self.home, 'VMs', 'vm.img')
+        with open(self.image, 'wb') as f:
+            f.write(os.urandom(512 * 1024))
+            f.seek(1536 * 1024)
+            f.write(os.urandom(512 * 1024))
+        self.config = copy.deepcopy(DEFAULT_CONFIG)
+        self.config['folders'] = ['VMs']
+        self.config['delta'] = {'enabled': True, 'folders': ['VMs'], 'min_size_mb': 1}
+        self.config['digest_cache']['path'] = os.path.join(self.tmp, 'digests.sqlite')
+        self.runs = 0
+        environment = mock.patch.dict(os.environ, {'HOME': self.home, 'USERPROFILE': self.home})
+        environment.start()
+        self.addCleanup(environment.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def run_backup(self):
+        self.runs += 1
+        with mock.patch('backup.datetime') as clock:
+            clock.now.return_value.strftime.return_value = f'2099010{self.runs}_000000'
+            backup = PCBackup([os.path.join(self.tmp, 'usb')], copy.deepcopy(self.config))
+            backup.run_backup()
+        return backup.backup_folder
+
+    def inventory(self, snapshot):
+        with open(os.path.join(snapshot, 'file_inventory.json')) as f:
+            return {entry['file'].replace('\\', '/').lstrip('/'): entry for entry in json.load(f)['files']}
+
+    def test_delta_keeps_holes(self):
+        self.run_backup()
+        with open(self.image, 'r+b') as f:
+            f.write(os.urandom(1000))
+        snapshot = self.run_backup()
+        entry = self.inventory(snapshot)['VMs/vm.img']
+        self.assertIn('delta', entry)
+        self.assertEqual(entry['sparse']['holes'], [[512 * 1024, 1024 * 1024]])
+
+        restored = os.path.join(self.tmp, 'restore')
+        restore_tree(snapshot, restored)
+        with open(os.path.join(restored, 'VMs', 'vm.img'), 'rb') as f, open(self.image, 'rb') as original:
+            self.assertEqual(f.read(), original.read())
+        if hasattr(os, 'SEEK_HOLE'):
+            with open(os.path.join(restored, 'VMs', 'vm.img'), 'rb') as f:
+                self.assertEqual(os.lseek(f.fileno(), 0, os.SEEK_HOLE), 512 * 1024)
+
+    def test_unchanged_file_is_carried_forward(self):
+        for cache in (True, False):
+            self.config['digest_cache']['enabled'] = cache
+            previous = self.run_backup()
+            snapshot = self.run_backup()
+            self.assertTrue(os.path.samefile(os.path.join(previous, 'VMs', 'vm.img'),
+                                             os.path.join(snapshot, 'VMs', 'vm.img')))
+            self.assertNotIn('delta', self.inventory(snapshot)['VMs/vm.img'])
+
+
+class UploadReportTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.home = os.path.join(self.tmp, 'home')
+        os.makedirs(os.path.join(self.home, 'Documents'))
+        with open(os.path.join(self.home, 'Documents', 'a.txt'), 'w') as f:
+            f.write('a')
+        environment = mock.patch.dict(os.environ, {'HOME': self.home, 'USERPROFILE': self.home})
+        environment.start()
+        self.addCleanup(environment.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_upload_outcome_is_in_the_report(self):
+        config = copy.deepcopy(DEFAULT_CONFIG)
+        config['folders'] = ['Documents']
+        config['digest_cache']['enabled'] = False
+        config['storage']['upload'] = os.path.join(self.tmp, 'mirror')
+        backup = PCBackup([os.path.join(self.tmp, 'usb')], config)
+        with mock.patch('backup_storage.default_state_path', lambda url: os.path.join(self.tmp, 'state.json')):
+            backup.run_backup()
+        with open(os.path.join(backup.backup_folder, 'backup_report.json')) as f:
+            upload = json.load(f)['upload']
+        self.assertTrue(upload['ok'])
+        self.assertEqual(upload['failed'], [])
+        self.assertGreater(upload['uploaded'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backup_fanout
+from backup_fanout import BackupTarget, FanoutCopier
+from backup_sparse import SparseWriter
+
+
+class BrokenWriter(SparseWriter):
+    """Fails with a non-OSError on the first destination"""
+
+    def write(self, kind, value):
+        if os.sep + 'one' + os.sep in self.dst:
+            raise ValueError("unexpected")
+        super().write(kind, value)
+
+
+class SlowWriter(SparseWriter):
+    """Writes to the first destination slowly"""
+
+    def write(self, kind, value):
+        if os.sep + 'one' + os.sep in self.dst:
+            time.sleep(0.002)
+        super().write(kind, value)
+
+
+class FanoutTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmp, 'src.bin')
+        with open(self.src, 'wb') as f:
+            f.write(os.urandom(256 * 1024))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_unexpected_error_fails_only_that_destination(self):
+        targets = [BackupTarget(os.path.join(self.tmp, name), 'X') for name in ('one', 'two')]
+        for target in targets:
+            os.makedirs(target.backup_folder)
+        with mock.patch.object(backup_fanout, 'SparseWriter', BrokenWriter):
+            copier = FanoutCopier(targets, buffer_size=16 * 1024, max_buffer=64 * 1024)
+            try:
+                for i in range(3):
+                    outputs = [(target, target.path(f'f{i}.bin')) for target in targets if target.ok]
+                    copier.copy(self.src, 256 * 1024, outputs)
+                done = threading.Thread(target=copier.drain, daemon=True)
+                done.start()
+                done.join(10)
+                self.assertFalse(done.is_alive(), "drain() hung on the failed destination")
+            finally:
+                copier.close()
+        self.assertFalse(targets[0].ok)
+        self.assertTrue(targets[1].ok)
+        self.assertEqual(targets[1].stats['files'], 3)
+        with open(self.src, 'rb') as a, open(targets[1].path('f2.bin'), 'rb') as b:
+            self.assertEqual(a.read(), b.read())
+
+    def copy_slowly(self, max_wait):
+        targets = [BackupTarget(os.path.join(self.tmp, name), 'X') for name in ('one', 'two')]
+        for target in targets:
+            os.makedirs(target.backup_folder)
+        with mock.patch.object(backup_fanout, 'SparseWriter', SlowWriter):
+            copier = FanoutCopier(targets, buffer_size=16 * 1024, max_buffer=32 * 1024, max_wait=max_wait)
+            try:
+                for i in range(3):
+                    copier.copy(self.src, 256 * 1024, [(target, target.path(f'f{i}.bin')) for target in targets])
+                copier.drain()
+            finally:
+                copier.close()
+        with open(self.src, 'rb') as a, open(targets[0].path('f2.bin'), 'rb') as b:
+            self.assertEqual(a.read(), b.read())
+        return targets[0]
+
+    def test_slower_destination_is_waited_for(self):
+        slow = self.copy_slowly(max_wait=5)
+        self.assertEqual(slow.stats['re_read'], 0)
+        self.assertGreater(slow.stats['waited_s'], 0)
+
+    def test_stalled_destination_reads_on_its_own(self):
+        self.assertGreater(self.copy_slowly(max_wait=0).stats['re_read'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
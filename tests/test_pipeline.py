@@ -0,0 +1,41 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backup_pipeline import BufferPool, run_pipeline
+
+
+class RunPipelineTest(unittest.TestCase):
+    def test_failed_reads_return_their_buffer(self):
+        pool = BufferPool(4, 16)
+
+        def fill(buffer):
+            raise OSError("read error")
+
+        # More failures than the pool has buffers: each must give its buffer back
+        for _ in range(pool.count * 2):
+            with self.assertRaises(OSError):
+                run_pipeline(fill, lambda item: None, pool)
+        self.assertEqual(pool._free.qsize(), pool.count)
+
+    def test_items_drained_in_order(self):
+        pool = BufferPool(2, 4)
+        chunks = [b'abcd', b'efgh', b'ij']
+        drained = []
+
+        def fill(buffer):
+            if not chunks:
+                return None
+            data = chunks.pop(0)
+            buffer[:len(data)] = data
+            return bytes(buffer[:len(data)])
+
+        run_pipeline(fill, drained.append, pool)
+        self.assertEqual(b''.join(drained), b'abcdefghij')
+        self.assertEqual(pool._free.qsize(), pool.count)
+
+
+if __name__ == '__main__':
+    unittest.main()
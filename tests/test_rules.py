@@ -0,0 +1,23 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backup_rules import BackupRules
+
+
+class RulesSummaryTest(unittest.TestCase):
+    def test_unmeasured_folders_are_marked(self):
+        rules = BackupRules(['node_modules/'])
+        rules.record('node_modules/', 0, is_dir=True)
+        self.assertIs(rules.summary()['node_modules/']['measured'], False)
+
+    def test_measured_folders_report_bytes(self):
+        rules = BackupRules(['node_modules/'], measure_pruned=True)
+        rules.record('node_modules/', 4096, is_dir=True)
+        self.assertEqual(rules.summary()['node_modules/'], {'files': 0, 'dirs': 1, 'bytes': 4096})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backup_sparse import copy_sparse, expand, SPARSE_SUFFIX
+
+KB = 1024
+
+
+class PackedCopyTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmp, 'src.bin')
+        self.dst = os.path.join(self.tmp, 'dst.bin')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, data):
+        with open(self.src, 'wb') as f:
+            f.write(data)
+        return data
+
+    def test_short_zero_run_is_written_out(self):
+        data = self.write(os.urandom(64 * KB) + bytes(128 * KB) + os.urandom(64 * KB))
+        path, size, stored, info = copy_sparse(self.src, self.dst, False, 64 * KB, min_hole=64 * KB,
+                                               min_packed=1024 * KB)
+        self.assertEqual((path, info, stored), (self.dst, None, len(data)))
+        with open(self.dst, 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+    def test_long_zero_run_is_packed(self):
+        data = self.write(os.urandom(64 * KB) + bytes(2048 * KB) + os.urandom(64 * KB) + bytes(128 * KB))
+        path, size, stored, info = copy_sparse(self.src, self.dst, False, 64 * KB, min_hole=64 * KB,
+                                               min_packed=1024 * KB)
+        self.assertEqual(path, self.dst + SPARSE_SUFFIX)
+        self.assertEqual(info['holes'], [[64 * KB, 2048 * KB]])
+        expand(path, os.path.join(self.tmp, 'out.bin'))
+        with open(os.path.join(self.tmp, 'out.bin'), 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,280 @@
+import os
+import sys
+import json
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backup_storage import S3Backend, LocalBackend, StorageError, upload_snapshot, publish
+from backup_hashing import hash_file
+from backup_delta import write_delta, DELTA_SUFFIX
+from backup_sparse import SPARSE_SUFFIX
+from backup_reader import BackupReader
+from s3_stub import StubS3, ACCESS_KEY, SECRET_KEY
+
+MB = 1024 * 1024
+SETTINGS = {'algorithm': 'sha256', 'leaf_size': None}
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def write_inventory(snapshot, entries):
+    with open(os.path.join(snapshot, 'file_inventory.json'), 'w') as f:
+        json.dump({'hash': SETTINGS, 'order': 'path', 'files': sorted(entries, key=lambda e: e['file'])}, f)
+
+
+def plain_entry(snapshot, rel):
+    path = os.path.join(snapshot, *rel.split('/'))
+    return dict(hash_file(path, SETTINGS), file='/' + rel, size=os.path.getsize(path))
+
+
+class StorageTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(7)
+        self.tmp = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp, 'PC_Backup')
+        self.state = os.path.join(self.tmp, 'state.json')
+        self.s3 = StubS3()
+
+    def tearDown(self):
+        self.s3.close()
+        shutil.rmtree(self.tmp)
+
+    def backend(self, **options):
+        options = dict(dict(endpoint=self.s3.endpoint, access_key=ACCESS_KEY, secret_key=SECRET_KEY,
+                            part_size=5 * MB, workers=4, retries=6), **options)
+        return S3Backend('bucket', 'pc', **options)
+
+    def upload(self, snapshot, backend=None):
+        backend = backend or self.backend()
+        try:
+            return upload_snapshot(snapshot, backend, self.state, log=lambda message: None)
+        finally:
+            backend.close()
+
+    def snapshot(self, name='Backup_1'):
+        """Snapshot with a multipart-sized file and a few small ones (names needing URL encoding)"""
+        snapshot = os.path.join(self.root, name)
+        write(os.path.join(snapshot, 'Documents', 'big.bin'), os.urandom(12 * MB + 123))
+        for i in range(5):
+            write(os.path.join(snapshot, 'Documents', 'sub dir', f'notes ü{i}.txt'), os.urandom(100 * i))
+        write_inventory(snapshot, [plain_entry(snapshot, rel) for rel in
+                                   ['Documents/big.bin'] + [f'Documents/sub dir/notes ü{i}.txt' for i in range(5)]])
+        return snapshot
+
+    def assert_uploaded(self, snapshot):
+        for folder, _, names in os.walk(snapshot):
+            for name in names:
+                path = os.path.join(folder, name)
+                key = 'pc/PC_Backup/' + os.path.relpath(path, self.root).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    self.assertEqual(self.s3.objects.get(('bucket', key)), f.read(), key)
+
+    def download(self, snapshot_key):
+        """The published snapshot, copied out of the stub into a PC_Backup folder"""
+        out = os.path.join(self.tmp, 'restore')
+        for (_, key), data in self.s3.objects.items():
+            if key.startswith(f'pc/{snapshot_key}/'):
+                write(os.path.join(out, *key[len('pc/'):].split('/')), data)
+        return os.path.join(out, *snapshot_key.split('/'))
+
+    def test_upload_multipart_and_list(self):
+        snapshot = self.snapshot()
+        stats = self.upload(snapshot)
+        self.assertEqual(stats['failed'], [])
+        self.assertEqual(stats['uploaded'], 7)
+        self.assertEqual(self.s3.counts['parts'], 3)
+        self.assertEqual(self.s3.counts['bad_signatures'], 0)
+        self.assert_uploaded(snapshot)
+        backend = self.backend()
+        keys = [key for key, _ in backend.list('PC_Backup')]
+        backend.close()
+        self.assertIn('PC_Backup/Backup_1/file_inventory.json', keys)
+        self.assertEqual(len(keys), 7)
+
+    def test_wrong_secret_is_refused(self):
+        snapshot = self.snapshot()
+        stats = self.upload(snapshot, self.backend(secret_key='wrong'))
+        self.assertTrue(stats['failed'])
+        self.assertFalse(self.s3.objects)
+        backend = self.backend(secret_key='wrong')
+        with self.assertRaises(StorageError) as caught:
+            backend.size('PC_Backup/x')
+        backend.close()
+        self.assertEqual(caught.exception.status, 403)
+
+    def test_retries_failed_requests(self):
+        snapshot = self.snapshot()
+        self.s3.flaky = 0.15
+        self.s3.drop = 0.05
+        backend = self.backend(retries=10)
+        stats = self.upload(snapshot, backend)
+        self.assertEqual(stats['failed'], [])
+        self.assertGreater(backend.stats['retries'], 0)
+        self.assert_uploaded(snapshot)
+
+    def test_resume_interrupted_multipart(self):
+        snapshot = self.snapshot()
+        put_part = S3Backend._put_part
+        sent = []
+
+        def fail_after_two(backend, *args):
+            if len(sent) >= 2:
+                raise StorageError("connection lost")
+            sent.append(args[3])
+            return put_part(backend, *args)
+
+        S3Backend._put_part = fail_after_two
+        try:
+            stats = self.upload(snapshot)
+        finally:
+            S3Backend._put_part = put_part
+        self.assertEqual(stats['failed'], ['PC_Backup/Backup_1/Documents/big.bin'])
+        self.assertNotIn(('bucket', 'pc/PC_Backup/Backup_1/file_inventory.json'), self.s3.objects)
+        with open(self.state) as f:
+            self.assertIn('PC_Backup/Backup_1/Documents/big.bin', json.load(f)['multipart'])
+
+        before = self.s3.counts['bytes_in']
+        backend = self.backend()
+        stats = self.upload(snapshot, backend)
+        self.assertEqual(stats['failed'], [])
+        self.assertEqual(backend.stats['parts_reused'], 2)
+        self.assertEqual(backend.stats['parts'], 1)
+        self.assertLess(self.s3.counts['bytes_in'] - before, 3 * MB)   # the last part and the small files
+        self.assert_uploaded(snapshot)
+
+    def test_existing_objects_are_skipped_or_copied(self):
+        snapshot = self.snapshot()
+        self.upload(snapshot)
+        before = self.s3.counts['bytes_in']
+        stats = self.upload(snapshot)
+        self.assertEqual((stats['skipped'], stats['uploaded']), (7, 0))
+        self.assertEqual(self.s3.counts['bytes_in'], before)
+
+        # Next snapshot: hard links and a plain copy with the same content
+        second = os.path.join(self.root, 'Backup_2')
+        os.makedirs(os.path.join(second, 'Documents', 'sub dir'))
+        os.link(os.path.join(snapshot, 'Documents', 'big.bin'), os.path.join(second, 'Documents', 'big.bin'))
+        for i in range(5):
+            shutil.copyfile(os.path.join(snapshot, 'Documents', 'sub dir', f'notes ü{i}.txt'),
+                            os.path.join(second, 'Documents', 'sub dir', f'notes ü{i}.txt'))
+        shutil.copyfile(os.path.join(snapshot, 'file_inventory.json'), os.path.join(second, 'file_inventory.json'))
+        stats = self.upload(second)
+        self.assertEqual(stats['copied'], 6)
+        self.assertEqual(stats['uploaded'], 1)      # the inventory
+        self.assert_uploaded(second)
+
+    def test_delta_snapshot_is_published_rebuilt(self):
+        first, second = os.path.join(self.root, 'Backup_1'), os.path.join(self.root, 'Backup_2')
+        old = os.urandom(2 * MB)
+        new = old[:MB] + os.urandom(1000) + old[MB + 1000:]
+        write(os.path.join(first, 'Desktop', 'big.bin'), old)
+        write_inventory(first, [plain_entry(first, 'Desktop/big.bin')])
+        source = os.path.join(self.tmp, 'big.bin')
+        write(source, new)
+        os.makedirs(os.path.join(second, 'Desktop'))
+        stats = write_delta(source, os.path.join(first, 'Desktop', 'big.bin'), 'Backup_1/Desktop/big.bin',
+                            os.path.join(second, 'Desktop', 'big.bin') + DELTA_SUFFIX)
+        self.assertIsNotNone(stats)
+        entry = dict(hash_file(source, SETTINGS), file='/Desktop/big.bin', size=len(new),
+                     delta={'basis': 'Backup_1/Desktop/big.bin', 'stored_size': stats['stored']})
+        write_inventory(second, [entry])
+
+        self.assertEqual(self.upload(second)['failed'], [])
+        published = self.download('PC_Backup/Backup_2')
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, 'restore', 'PC_Backup', 'Backup_1')))
+        reader = BackupReader(published)
+        self.assertNotIn('delta', reader.entries['Desktop/big.bin'])
+        with reader.open('Desktop/big.bin') as f:
+            self.assertEqual(f.read(), new)
+
+    def test_delta_with_holes_is_published_packed(self):
+        first, second = os.path.join(self.root, 'Backup_1'), os.path.join(self.root, 'Backup_2')
+        old = os.urandom(MB) + bytes(4 * MB) + os.urandom(MB)
+        new = b'x' * 1000 + old[1000:]
+        write(os.path.join(first, 'VMs', 'vm.img'), old)
+        write_inventory(first, [plain_entry(first, 'VMs/vm.img')])
+        source = os.path.join(self.tmp, 'vm.img')
+        write(source, new)
+        os.makedirs(os.path.join(second, 'VMs'))
+        stats = write_delta(source, os.path.join(first, 'VMs', 'vm.img'), 'Backup_1/VMs/vm.img',
+                            os.path.join(second, 'VMs', 'vm.img') + DELTA_SUFFIX)
+        holes = [[MB, 4 * MB]]
+        entry = dict(hash_file(source, SETTINGS), file='/VMs/vm.img', size=len(new),
+                     delta={'basis': 'Backup_1/VMs/vm.img', 'stored_size': stats['stored']},
+                     sparse={'holes': holes, 'stored': 'delta'})
+        write_inventory(second, [entry])
+
+        self.assertEqual(self.upload(second)['failed'], [])
+        self.assertLess(self.s3.counts['bytes_in'], 3 * MB)
+        self.assertIn(('bucket', 'pc/PC_Backup/Backup_2/VMs/vm.img' + SPARSE_SUFFIX), self.s3.objects)
+        reader = BackupReader(self.download('PC_Backup/Backup_2'))
+        self.assertEqual(reader.entries['VMs/vm.img']['sparse']['stored'], 'packed')
+        with reader.open('VMs/vm.img') as f:
+            self.assertEqual(f.read(), new)
+
+    def test_holes_are_sent_packed(self):
+        snapshot = os.path.join(self.root, 'Backup_1')
+        path = os.path.join(snapshot, 'VMs', 'disk.img')
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(b'a' * 4096)
+            f.seek(10 * MB)
+            f.write(b'b' * 4096)
+            f.truncate(20 * MB)
+        holes = [[4096, 10 * MB - 4096], [10 * MB + 4096, 10 * MB - 4096]]
+        entry = dict(plain_entry(snapshot, 'VMs/disk.img'), sparse={'holes': holes, 'stored': 'holes'})
+        write_inventory(snapshot, [entry])
+
+        self.assertEqual(self.upload(snapshot)['failed'], [])
+        self.assertLess(self.s3.counts['bytes_in'], MB)
+        self.assertIn(('bucket', 'pc/PC_Backup/Backup_1/VMs/disk.img' + SPARSE_SUFFIX), self.s3.objects)
+        reader = BackupReader(self.download('PC_Backup/Backup_1'))
+        self.assertEqual(reader.entries['VMs/disk.img']['sparse']['stored'], 'packed')
+        with reader.open('VMs/disk.img') as f, open(path, 'rb') as original:
+            self.assertEqual(f.read(), original.read())
+
+    def test_html_answer_is_a_storage_error(self):
+        snapshot = self.snapshot()
+        self.s3.portal = True
+        backend = self.backend()
+        try:
+            with self.assertRaises(StorageError):
+                list(backend.list())
+        finally:
+            backend.close()
+        stats = self.upload(snapshot)
+        self.assertIn('PC_Backup/Backup_1/Documents/big.bin', stats['failed'])
+
+    def test_publish_reports_a_failed_upload(self):
+        snapshot = self.snapshot()
+        self.s3.portal = True
+        settings = {'endpoint': self.s3.endpoint, 'access_key_env': 'TEST_ACCESS', 'secret_key_env': 'TEST_SECRET',
+                    'part_size_mb': 5, 'retries': 0}
+        with mock.patch.dict(os.environ, {'TEST_ACCESS': ACCESS_KEY, 'TEST_SECRET': SECRET_KEY}), \
+                mock.patch('backup_storage.default_state_path', lambda url: self.state):
+            result = publish(snapshot, 's3://bucket/pc', settings)
+        self.assertFalse(result['ok'])
+        self.assertTrue(result['failed'])
+
+    def test_local_backend_mirror(self):
+        snapshot = self.snapshot()
+        mirror = os.path.join(self.tmp, 'mirror')
+        stats = upload_snapshot(snapshot, LocalBackend(mirror), self.state, log=lambda message: None)
+        self.assertEqual((stats['uploaded'], stats['failed']), (7, []))
+        with open(os.path.join(snapshot, 'Documents', 'big.bin'), 'rb') as a, \
+                open(os.path.join(mirror, 'PC_Backup', 'Backup_1', 'Documents', 'big.bin'), 'rb') as b:
+            self.assertEqual(a.read(), b.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import sys
+import platform
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backup_throttle
+from backup_throttle import Throttle, MB
+from backup_platform import LinuxProvider
+
+
+class FakeProvider:
+    def __init__(self):
+        self.stats = (100, 1000)
+
+    def disk_stats(self, path):
+        return self.stats
+
+    def set_background(self, enabled, nice=10):
+        return {}
+
+
+class LatencyTest(unittest.TestCase):
+    def run_sample(self, ios, own_ms):
+        """Backoffs after 10 reads of ours while the disk did ios I/Os taking 1 s in total"""
+        provider = FakeProvider()
+        clock = [0.0]
+        throttle = Throttle({'enabled': True, 'max_latency_ms': 25})
+        with mock.patch.object(backup_throttle, 'get_provider', lambda: provider), \
+                mock.patch.object(backup_throttle.time, 'monotonic', lambda: clock[0]):
+            throttle.start('/')
+            throttle.take(0)
+            clock[0] = 0.1
+            for _ in range(10):
+                throttle.take(MB, elapsed=own_ms / 10000)
+            provider.stats = (100 + ios, 2000)
+            clock[0] = 0.6
+            throttle.take(0)
+        return throttle.report['backoffs']
+
+    def test_own_reads_do_not_cause_a_backoff(self):
+        self.assertEqual(self.run_sample(ios=10, own_ms=1000), 0)
+
+    def test_slow_disk_causes_a_backoff(self):
+        # 10 I/Os of other programs took 1 s
+        self.assertEqual(self.run_sample(ios=20, own_ms=0), 1)
+
+
+@unittest.skipUnless(platform.system() == 'Linux' and platform.machine() in LinuxProvider.IOPRIO_SET,
+                     "ioprio syscalls")
+class IoPriorityTest(unittest.TestCase):
+    def test_priority_before_background_mode_is_restored(self):
+        provider = LinuxProvider()
+        tid = os.getpid()
+        before = provider._get_ioprio(tid)
+        self.addCleanup(provider._set_ioprio, {tid: before})
+        lowest_best_effort = (2 << 13) | 7
+        provider._set_ioprio({tid: lowest_best_effort})
+        provider.set_background(True, nice=0)
+        self.assertEqual(provider._get_ioprio(tid), LinuxProvider.IOPRIO_IDLE)
+        provider.set_background(False)
+        self.assertEqual(provider._get_ioprio(tid), lowest_best_effort)
+
+
+if __name__ == '__main__':
+    unittest.main()